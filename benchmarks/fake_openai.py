@@ -0,0 +1,142 @@
+"""In-memory stand-in for the OpenAI files and batches APIs used by BatchProcessor.
+
+Batches complete on their first status check. Their output files hold canned chat completion
+responses that echo each input item with promo_price and unit_price filled in from its sale or
+regular price, in the same shape as a real batch_output.jsonl. Requests with a response_format
+are answered with the compact items object instead.
+"""
+import ast
+import contextlib
+import itertools
+import json
+import re
+from types import SimpleNamespace
+from typing import Any, BinaryIO, Dict, Iterator, List
+
+_INPUT = re.compile(r"### Input:\n(.*?)\n\n### Input Example", re.DOTALL)
+
+
+def canned_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    price = item.get("sale_price") or item.get("regular_price") or ""
+    return {**item, "promo_price": str(price), "unit_price": str(price)}
+
+
+def compact_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    price = float(item.get("sale_price") or item.get("regular_price") or 0)
+    return {"id": item.get("id", 0), "promo_price": price, "unit_price": price}
+
+
+def canned_content(request: Dict[str, Any]) -> str:
+    """Answers one request with the echoed item, or array of items for packed requests."""
+    prompt = request["body"]["messages"][-1]["content"]
+    match = _INPUT.search(prompt)
+    if match is None:
+        return "{}"
+    raw = match.group(1)
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError:
+        try:
+            items = ast.literal_eval(raw)
+        except (ValueError, SyntaxError):
+            return "{}"
+    if request["body"].get("response_format"):
+        return json.dumps({"items": [compact_item(item) for item in (items if isinstance(items, list) else [items])]})
+    if isinstance(items, list):
+        return json.dumps([canned_item(item) for item in items])
+    return "```json\n" + json.dumps(canned_item(items), indent=4) + "\n```"
+
+
+def canned_output_line(request: Dict[str, Any], index: int) -> Dict[str, Any]:
+    return {
+        "id": f"batch_req_{index}",
+        "custom_id": request["custom_id"],
+        "response": {
+            "status_code": 200,
+            "request_id": f"req_{index}",
+            "body": {
+                "id": f"chatcmpl-{index}",
+                "object": "chat.completion",
+                "model": request["body"].get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": canned_content(request)}, "finish_reason": "stop"}],
+            },
+        },
+        "error": None,
+    }
+
+
+class _StreamingResponse:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def iter_bytes(self, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class _StreamingFiles:
+    def __init__(self, files: "FakeFiles"):
+        self.files = files
+
+    @contextlib.contextmanager
+    def content(self, file_id: str) -> Iterator[_StreamingResponse]:
+        yield _StreamingResponse(self.files.data[file_id])
+
+
+class FakeFiles:
+    def __init__(self, ids: Iterator[int]):
+        self.ids = ids
+        self.data: Dict[str, bytes] = {}
+        self.with_streaming_response = _StreamingFiles(self)
+
+    def create(self, file: BinaryIO, purpose: str) -> Any:
+        file_id = f"file-{next(self.ids)}"
+        self.data[file_id] = file.read()
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(self.data[file_id]))
+
+    def retrieve(self, file_id: str) -> Any:
+        return SimpleNamespace(id=file_id, bytes=len(self.data[file_id]))
+
+    def content(self, file_id: str) -> Any:
+        data = self.data[file_id]
+        return SimpleNamespace(content=data, text=data.decode())
+
+
+class FakeBatches:
+    def __init__(self, ids: Iterator[int], files: FakeFiles):
+        self.ids = ids
+        self.files = files
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    def batch(self, batch_id: str) -> Any:
+        batch = self.batches[batch_id]
+        return SimpleNamespace(
+            id=batch_id,
+            status=batch["status"],
+            output_file_id=batch["output_file_id"] if batch["status"] == "completed" else None,
+            error_file_id=None,
+            request_counts=SimpleNamespace(completed=batch["completed"], failed=0, total=batch["total"]),
+        )
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str, metadata: Dict[str, str] = None) -> Any:
+        requests: List[Dict[str, Any]] = [json.loads(line) for line in self.files.data[input_file_id].splitlines() if line.strip()]
+        output = "".join(json.dumps(canned_output_line(request, index)) + "\n" for index, request in enumerate(requests))
+        output_file_id = f"file-{next(self.ids)}"
+        self.files.data[output_file_id] = output.encode()
+        batch_id = f"batch_{next(self.ids)}"
+        self.batches[batch_id] = {"status": "validating", "output_file_id": output_file_id, "completed": 0, "total": len(requests)}
+        return self.batch(batch_id)
+
+    def retrieve(self, batch_id: str) -> Any:
+        batch = self.batches[batch_id]
+        batch.update(status="completed", completed=batch["total"])
+        return self.batch(batch_id)
+
+
+class FakeOpenAI:
+    """Drop-in for `openai.OpenAI` covering the calls BatchProcessor makes."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        ids = itertools.count(1)
+        self.files = FakeFiles(ids)
+        self.batches = FakeBatches(ids, self.files)
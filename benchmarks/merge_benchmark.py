@@ -0,0 +1,66 @@
+"""Times BatchOutputProcessor.merge_data from 1k to 1M rows.
+
+Run from the repository root:
+
+    python -m benchmarks.merge_benchmark
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Tuple
+
+from core.batch_outputs import BatchOutputProcessor
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LEGACY_MAX_ROWS = 10_000
+
+
+def make_data(rows: int, duplication: int = 2) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Builds rows where every `duplication` rows share one request, half of them answered."""
+    temp_data = []
+    results = {}
+    for i in range(rows):
+        custom_id = f"request-{i // duplication}"
+        temp_data.append({"id": f"row-{i}", "custom_id": custom_id, "regular_price": "3.99", "sale_price": ""})
+        if (i // duplication) % 2 == 0:
+            results[custom_id] = {"id": f"row-{i}", "promo_price": "2.50", "unit_price": "1.25"}
+    return temp_data, results
+
+
+def legacy_merge(temp_data: List[Dict[str, Any]], filtered_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The nested-loop merge keyed on the echoed id that merge_data replaced."""
+    new_out = []
+    for t_item in temp_data:
+        updated = False
+        for f_item in filtered_data:
+            if t_item["id"] == f_item["id"]:
+                new_out.append({**t_item, **f_item})
+                updated = True
+                break
+        if not updated:
+            new_out.append(t_item)
+    return new_out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge scaling benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Row counts to benchmark")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'merge_data (s)':>15} {'rows/s':>12} {'legacy (s)':>12}")
+    for rows in args.sizes:
+        temp_data, results = make_data(rows)
+        legacy = "skipped"
+        if rows <= LEGACY_MAX_ROWS:
+            filtered_data = list(results.values())
+            start = time.perf_counter()
+            legacy_merge([dict(item) for item in temp_data], filtered_data)
+            legacy = f"{time.perf_counter() - start:.3f}"
+
+        start = time.perf_counter()
+        BatchOutputProcessor.merge_data(temp_data, results)
+        elapsed = time.perf_counter() - start
+        print(f"{rows:>10} {elapsed:>15.3f} {rows / elapsed:>12,.0f} {legacy:>12}")
+
+
+if __name__ == "__main__":
+    main()
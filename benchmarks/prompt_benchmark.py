@@ -0,0 +1,103 @@
+"""Measures prompt generation throughput in rows per second, 1M rows by default.
+
+Compares serializing request lines with the precompiled RequestEncoder against the previous
+per-row str(item) + template.replace + json.dumps, then times the full streaming prompt
+generation path (local rules, dedupe, encoding and buffered writes) on synthetic rows.
+
+Run from the repository root:
+
+    python -m benchmarks.prompt_benchmark
+    python -m benchmarks.prompt_benchmark --rows 100000
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from benchmarks.synthetic import generate_rows
+from core.batch_inputs import BatchInputProcessor
+from core.file_utils import Modifiers
+from core.loggers import logger
+
+POOL_SIZE = 10_000
+
+
+def minified_items(count: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": str(i),
+            "regular_price": row["regular_price"],
+            "sale_price": row["sale_price"],
+            "promo_description": row["promo_description"],
+            "promo_price": "",
+            "unit_price": "",
+        }
+        for i, row in enumerate(generate_rows(count))
+    ]
+
+
+def legacy_line(processor: BatchInputProcessor, custom_id: str, item: Dict[str, Any]) -> str:
+    """The per-row rendering and serialization the encoder replaced."""
+    content = processor.prompt_txt.replace("{INPUT}", str(item))
+    return json.dumps(processor.request_body(custom_id, content, 1000)) + "\n"
+
+
+def bench_serialize(processor: BatchInputProcessor, rows: int) -> None:
+    pool = minified_items(POOL_SIZE)
+    custom_id = "00000000-0000-0000-0000-000000000000"
+
+    start = time.perf_counter()
+    for item in itertools.islice(itertools.cycle(pool), rows):
+        legacy_line(processor, custom_id, item)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for item in itertools.islice(itertools.cycle(pool), rows):
+        processor.encoder.encode(custom_id, item, 1000)
+    encoder = time.perf_counter() - start
+
+    print(f"serialize {rows:,} requests: legacy {legacy:.2f}s ({rows / legacy:,.0f} rows/s), "
+          f"encoder {encoder:.2f}s ({rows / encoder:,.0f} rows/s), {legacy / encoder:.1f}x faster")
+
+
+def bench_write_prompts(processor: BatchInputProcessor, rows: int) -> None:
+    # Generating the synthetic rows is timed on its own and subtracted from the pipeline time.
+    start = time.perf_counter()
+    for _ in Modifiers.add_id_column(generate_rows(rows)):
+        pass
+    generation = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory(prefix="grc-bench-") as tmp:
+        prompts_path = os.path.join(tmp, "batch_inputs.jsonl")
+        start = time.perf_counter()
+        with open(prompts_path, "w", buffering=1024 * 1024) as f:
+            for _ in processor.write_prompts(Modifiers.add_id_column(generate_rows(rows)), f):
+                pass
+        elapsed = time.perf_counter() - start - generation
+        size = os.path.getsize(prompts_path)
+
+    print(f"write_prompts {rows:,} rows: {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), "
+          f"{processor.prompt_count:,} requests, {size / 1e6:,.0f} MB (row generation {generation:.2f}s excluded)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt generation throughput benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Number of rows")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.ERROR)
+    processor = BatchInputProcessor("", "")
+    processor.load_prompt_template()
+    bench_serialize(processor, args.rows)
+
+    processor = BatchInputProcessor("", "")
+    processor.load_prompt_template()
+    bench_write_prompts(processor, args.rows)
+
+
+if __name__ == "__main__":
+    main()
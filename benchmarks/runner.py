@@ -0,0 +1,147 @@
+"""Runs the pipeline end to end on synthetic data against the fake batch backend.
+
+Times FileHandler.load, generate_prompts, save_prompts, the fake batch round trip,
+BatchOutputProcessor.process and its save_data step for each size, and compares the
+timings with a stored baseline. Exits with status 1 when a step regressed.
+
+Run from the repository root:
+
+    python -m benchmarks.runner
+    python -m benchmarks.runner --sizes 1000 10000 100000 1000000
+    python -m benchmarks.runner --update-baseline
+
+The stored baseline is only meaningful on the machine that recorded it; record a new one
+with --update-baseline before comparing changes on another machine.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.fake_openai import FakeOpenAI
+from benchmarks.synthetic import write_rows
+from core.batch import BatchProcessor
+from core.batch_inputs import BatchInputProcessor
+from core.batch_outputs import BatchOutputProcessor
+from core.file_utils import FileHandler
+from core.loggers import logger
+from core.metrics import metrics
+
+SIZES = [1_000, 10_000, 100_000]
+STEPS = ["load", "generate_prompts", "save_prompts", "side_store", "fake_batch", "process", "save_data"]
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+# Differences below this many seconds are treated as noise.
+MIN_DELTA = 0.05
+
+
+def timed(timings: Dict[str, float], step: str, func: Callable[..., Any], *args: Any) -> Any:
+    start = time.perf_counter()
+    result = func(*args)
+    timings[step] = time.perf_counter() - start
+    return result
+
+
+def run_pipeline(input_file: Path, workdir: Path) -> Dict[str, float]:
+    """Runs every step once and returns the seconds each one took."""
+    timings: Dict[str, float] = {}
+    side_store = workdir / "rows.sqlite"
+    batch_input_file = workdir / "batch_inputs.jsonl"
+    batch_output_file = workdir / "batch_output.jsonl"
+
+    processor = BatchInputProcessor(str(input_file), batch_input_file, side_store=side_store)
+    processor.file = FileHandler(use_cache=False)
+    processor.load_prompt_template()
+    timed(timings, "load", processor.load_input_file, 0)
+    timed(timings, "generate_prompts", processor.generate_prompts)
+    timed(timings, "save_prompts", processor.save_prompts)
+    timed(timings, "side_store", processor.save_temp_data)
+
+    def fake_batch() -> None:
+        batch_processor = BatchProcessor(client=FakeOpenAI())
+        batch = batch_processor.start_batch(batch_processor.upload_batch_file(batch_input_file))
+        batch = batch_processor.get_batch_status(batch.id)
+        batch_processor.save_responses(batch.output_file_id, batch_output_file)
+
+    timed(timings, "fake_batch", fake_batch)
+
+    metrics.reset()
+    output_processor = BatchOutputProcessor(batch_output_file, workdir / "output", "json", side_store)
+    timed(timings, "process", output_processor.process)
+    # save_data runs inside process and is recorded by the metrics as its merge and write stages.
+    timings["save_data"] = sum(metrics.stages[stage]["wall_seconds"] for stage in ("merge", "write"))
+    return timings
+
+
+def run(sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    """Returns the best of `repeat` timings of every step for each size."""
+    results: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory(prefix="grc-bench-") as tmp:
+        workdir = Path(tmp)
+        for rows in sizes:
+            input_file = write_rows(workdir / f"synthetic-{rows}.json", rows)
+            best: Dict[str, float] = {}
+            for _ in range(repeat):
+                for step, seconds in run_pipeline(input_file, workdir).items():
+                    best[step] = min(seconds, best.get(step, seconds))
+            results[str(rows)] = {step: round(best[step], 4) for step in STEPS}
+            print(f"{rows:>9} rows: " + "  ".join(f"{step} {best[step]:.3f}s" for step in STEPS), flush=True)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    """Prints each step against the baseline and returns the regressions."""
+    regressions = []
+    print(f"\n{'rows':>9} {'step':<18} {'baseline (s)':>13} {'current (s)':>12} {'change':>8}")
+    for rows, steps in results.items():
+        for step, seconds in steps.items():
+            previous = baseline.get(rows, {}).get(step)
+            if previous is None:
+                print(f"{rows:>9} {step:<18} {'-':>13} {seconds:>12.3f} {'new':>8}")
+                continue
+            change = (seconds - previous) / previous if previous else 0.0
+            regressed = seconds > previous * (1 + tolerance) and seconds - previous > MIN_DELTA
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{rows:>9} {step:<18} {previous:>13.3f} {seconds:>12.3f} {change:>+8.0%}{flag}")
+            if regressed:
+                regressions.append(f"{step} at {rows} rows: {previous:.3f}s -> {seconds:.3f}s ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Row counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the fastest run of each step counts")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before a step counts as a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these timings as the new baseline")
+    args = parser.parse_args()
+
+    # Per-row warnings would otherwise dominate the timings, and STATUS records would go to ntfy.
+    logger.setLevel(logging.ERROR)
+    results = run(args.sizes, args.repeat)
+
+    if args.update_baseline:
+        stored = json.loads(args.baseline.read_text()) if args.baseline.is_file() else {"results": {}}
+        stored.update(machine=platform.platform(), python=platform.python_version())
+        stored["results"].update(results)
+        args.baseline.write_text(json.dumps(stored, indent=4) + "\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.is_file():
+        print(f"\nNo baseline at {args.baseline}; record one with --update-baseline")
+        return
+    regressions = compare(results, json.loads(args.baseline.read_text())["results"], args.tolerance)
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions))
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Local OpenAI-compatible /v1/chat/completions server answering with the canned fake responses.
+
+Lets the realtime backend be run end to end without network access or a GPU:
+
+    python -m benchmarks.stub_server --port 8000
+    python main.py -I input_files/jewelesco_new.json -O stub -m realtime --base-url http://127.0.0.1:8000/v1
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from typing import Any, Dict
+
+from benchmarks.fake_openai import canned_content
+
+_ids = count(1)
+
+
+def completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    index = next(_ids)
+    return {
+        "id": f"chatcmpl-{index}",
+        "object": "chat.completion",
+        "model": body.get("model", ""),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": canned_content({"body": body})}, "finish_reason": "stop"}],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            status, response = 200, completion(body)
+        else:
+            status, response = 404, {"error": {"message": f"Unknown path: {self.path}"}}
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The realtime backend opens its whole connection pool at once.
+    request_queue_size = 128
+
+
+def start(host: str = "127.0.0.1", port: int = 0) -> StubServer:
+    """Starts the server on a background thread; port 0 picks a free port."""
+    server = StubServer((host, port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), StubHandler)
+    print(f"Serving on http://{args.host}:{server.server_port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
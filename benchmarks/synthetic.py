@@ -0,0 +1,115 @@
+"""Generates synthetic grocery records with the schema of input_files/marianos_new.json.
+
+Promo descriptions are drawn from the patterns seen in the Marianos, Jewel-Osco and Target
+crawls: about half of the rows have none, and the rest mix the simple patterns the local
+calculator handles with the conditional ones that go to the model.
+
+Run from the repository root:
+
+    python -m benchmarks.synthetic --rows 100000 -o synthetic.json
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+STORES = [
+    (60453, "Marianos Oak Lawn", "11000 S Cicero Ave, OAK LAWN, IL, US"),
+    (60614, "Marianos Lincoln Park", "2112 N Ashland Ave, CHICAGO, IL, US"),
+    (60005, "Marianos Arlington Heights", "333 E Palatine Rd, ARLINGTON HEIGHTS, IL, US"),
+]
+STORE_LOGO = "https://www.kroger.com/content/v2/binary/image/marianos_svg_logo-desktop-1556242659761.svg"
+CATEGORIES = [
+    ("Pantry", ["Snacks", "Cereal", "Soup", "Pasta"]),
+    ("Beverages", ["Soda", "Juice", "Coffee", "Water"]),
+    ("Beer, Wine, Liquor & Mixers", ["Red Wine", "Beer", "White Wine"]),
+    ("Frozen", ["Frozen Pizza", "Frozen Meals", "Ice Cream"]),
+    ("Dairy & Eggs", ["Milk", "Cheese", "Yogurt"]),
+]
+BRANDS = ["Larabar", "Kellogg's", "General Mills", "Pepsi", "Coca-Cola", "Erath", "Red Baron", "Tostitos", "Simple Truth", "Private Selection"]
+PRODUCTS = ["Peanut Butter Bars", "Honey Oat Cereal", "Tomato Soup", "Cola 12 pk", "Pinot Noir", "Pepperoni Pizza", "Tortilla Chips", "Greek Yogurt", "Cold Brew Coffee", "Sparkling Water"]
+WEIGHTS = ["", "0.8 [lb_av]", "12 [oz_av]", "750 mL", "1 gal", "16 [oz_av]"]
+
+
+def _money(rng: random.Random, low: float, high: float) -> str:
+    return f"{rng.uniform(low, high):.2f}"
+
+
+# (weight, template) pairs; templates receive the random generator and return a description.
+PROMO_MIX: List[Tuple[int, Callable[[random.Random], str]]] = [
+    (50, lambda rng: ""),
+    (8, lambda rng: f"Buy {rng.randint(1, 2)}, Get {rng.randint(1, 2)} Free"),
+    (8, lambda rng: f"{rng.randint(2, 5)} For ${rng.randint(3, 12)}"),
+    (4, lambda rng: f"Buy {rng.randint(2, 4)} For ${rng.randint(5, 15)}"),
+    (4, lambda rng: f"${rng.choice(['0.50', '1.00', '2.00'])} off:{rng.randint(8, 16)}-oz."),
+    (4, lambda rng: f"Save {rng.choice([10, 15, 20, 25])}%"),
+    (3, lambda rng: f"${rng.randint(2, 10)} off:When you spend  ${rng.randint(20, 50)} of participating Baby Club items. Limit 1 offer."),
+    (4, lambda rng: f"${_money(rng, 1, 6)} each:Or Dr. Pepper or 7UP When you buy FOUR 6-pk., 16.9-oz. Limit 2."),
+    (3, lambda rng: f"${rng.randint(1, 3)}.00 OFF:${rng.randint(1, 3)}.00 OFF when you buy TWO(2) General Mills Cereal. Items must appear on the same transaction."),
+    (4, lambda rng: f"Buy 1 get 1 {rng.choice([25, 50])}% off with same day order services Order Pickup or Same Day Delivery only ∙ Details"),
+    (3, lambda rng: f"Buy {rng.randint(2, 4)} for ${rng.randint(5, 12)} on select Frito-Lay snacks & chips In-store or Online ∙ Details"),
+    (2, lambda rng: f"{rng.randint(2, 4)} For ${rng.randint(5, 10)} Save Up To:$ {_money(rng, 1, 3)} On {rng.randint(2, 4)}; ${_money(rng, 1, 4)} each:12-oz. Limit 4."),
+    (2, lambda rng: "Save $5:Items must be purchased in the same transaction. Limit 1 per week."),
+    (1, lambda rng: f"${_money(rng, 2, 9)}/lb"),
+]
+
+
+def generate_rows(rows: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yields `rows` synthetic records, the same ones for the same seed."""
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in PROMO_MIX]
+    templates = [template for _, template in PROMO_MIX]
+    for i in range(rows):
+        zipcode, store_name, store_location = rng.choice(STORES)
+        category, sub_categories = rng.choice(CATEGORIES)
+        title = f"{rng.choice(BRANDS)} {rng.choice(PRODUCTS)}"
+        upc = f"{rng.randrange(10 ** 12):013d}"
+        slug = title.lower().replace(" ", "-").replace("'", "")
+        regular_price = _money(rng, 0.99, 29.99)
+        on_sale = rng.random() < 0.3
+        yield {
+            "zipcode": zipcode,
+            "store_name": store_name,
+            "store_location": store_location,
+            "store_logo": STORE_LOGO,
+            "category": category,
+            "sub_category": rng.choice(sub_categories),
+            "product_title": title,
+            "weight": rng.choice(WEIGHTS),
+            "regular_price": regular_price,
+            "sale_price": f"{float(regular_price) * rng.uniform(0.6, 0.95):.2f}" if on_sale else "",
+            "promo_description": rng.choices(templates, weights)[0](rng),
+            "promo_price": "",
+            "unit_price": "",
+            "image_url": f"https://www.kroger.com/product/images/xlarge/front/{upc}",
+            "url": f"https://www.marianos.com/p/{slug}/{upc}",
+            "upc": upc,
+            "crawl_date": "2024-09-20",
+            "coupon_short_description": "",
+            "coupon_description": "",
+        }
+
+
+def write_rows(path: Path, rows: int, seed: int = 0) -> Path:
+    """Writes a JSON array of synthetic records one row at a time, like a crawl export."""
+    path = Path(path)
+    with open(path, "w") as f:
+        f.write("[\n")
+        for i, row in enumerate(generate_rows(rows, seed)):
+            f.write((",\n" if i else "") + json.dumps(row))
+        f.write("\n]\n")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic grocery data generator")
+    parser.add_argument("--rows", type=int, default=1_000, help="Number of rows to generate")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("-o", "--output", required=True, help="Output JSON file")
+    args = parser.parse_args()
+    write_rows(Path(args.output), args.rows, args.seed)
+
+
+if __name__ == "__main__":
+    main()
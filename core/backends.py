@@ -0,0 +1,65 @@
+import importlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from core.config import Config
+from core.manifest import JobManifest
+
+# Backend name -> (module, class). Backends are imported on first use, so a run only loads the
+# client library of the backend it uses.
+BACKENDS = {
+    "batch": ("core.batch", "BatchProcessor"),
+    "realtime": ("core.realtime", "RealtimeProcessor"),
+}
+
+
+class Backend:
+    """Runs the requests of a batch input file against an inference endpoint.
+
+    Every backend produces output lines in the Batch API output format, so the output stage
+    does not depend on where the requests were sent. A backend may hold pooled connections
+    across runs; `close` releases them.
+    """
+
+    def run_requests(self, batch_input_file: Path, manifest: JobManifest) -> None:
+        """Sends the requests and waits until all of them have been answered."""
+        raise NotImplementedError
+
+    def start_requests(self, batch_input_file: Path, manifest: JobManifest) -> None:
+        """Starts the requests without waiting for them where the endpoint queues them.
+
+        Backends without a queue run the requests to completion here.
+        """
+        self.run_requests(batch_input_file, manifest)
+
+    def requests_finished(self, manifest: JobManifest) -> bool:
+        """Checks once, without waiting, whether every started request has been answered."""
+        return True
+
+    def iter_responses(self, manifest: JobManifest, filename: str) -> Iterator[Dict[str, Any]]:
+        """Saves the output lines to filename, yielding them as they arrive, and marks the job downloaded."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "Backend":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def create_backend(name: str = Config.BACKEND, base_url: Optional[str] = None, api_key: Optional[str] = None) -> Backend:
+    """Creates a backend by name, optionally pointed at another OpenAI-compatible base URL.
+
+    A base URL other than the configured one gets `Config.BACKEND_API_KEY` unless api_key is
+    given, so the OpenAI key is never sent to a self-hosted server.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (choose from {', '.join(BACKENDS)})")
+    module, cls = BACKENDS[name]
+    backend = getattr(importlib.import_module(module), cls)
+    if base_url is None or base_url.rstrip("/") == Config.OPENAI_BASE_URL.rstrip("/"):
+        return backend(api_key=api_key or Config.OPENAI_API_KEY, base_url=Config.OPENAI_BASE_URL)
+    return backend(api_key=api_key or Config.BACKEND_API_KEY, base_url=base_url)
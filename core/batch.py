@@ -1,19 +1,74 @@
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from pathlib import Path
-from typing import Any
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
 
+from core.backends import Backend
 from core.config import Config
 from core.loggers import logger
+from core.manifest import JobManifest
+from core.metrics import in_context, metrics
 
 
-class BatchProcessor:
-    def __init__(self):
-        self.client = OpenAI(api_key=Config.OPENAI_API_KEY)
+class ShardPlanner:
+    def __init__(self, max_requests: int = Config.BATCH_MAX_REQUESTS, max_bytes: int = Config.BATCH_MAX_BYTES):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+
+    def shard_path(self, file_path: Path, index: int) -> Path:
+        return file_path.with_name(f"{file_path.stem}.shard-{index:03d}{file_path.suffix}")
+
+    def plan(self, file_path: Path) -> List[Path]:
+        """Splits a batch input file into shards under the request-count and byte limits.
+
+        Returns the input file itself when it already fits in one batch.
+        """
+        shards: List[Path] = []
+        out = None
+        requests = size = 0
+        with open(file_path, "rb") as f:
+            for line in f:
+                if out is None or requests + 1 > self.max_requests or size + len(line) > self.max_bytes:
+                    if out is not None:
+                        out.close()
+                    shards.append(self.shard_path(file_path, len(shards)))
+                    out = open(shards[-1], "wb")
+                    requests = size = 0
+                out.write(line)
+                requests += 1
+                size += len(line)
+        if out is not None:
+            out.close()
+
+        if len(shards) <= 1:
+            for shard in shards:
+                shard.unlink()
+            return [file_path]
+        logger.info(f"Split {file_path} into {len(shards)} shards")
+        return shards
+
+
+class BatchProcessor(Backend):
+    """Runs requests through the Batch API of OpenAI or of any server implementing it."""
+
+    TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, client: Optional[Any] = None, api_key: Optional[str] = Config.OPENAI_API_KEY, base_url: str = Config.OPENAI_BASE_URL):
+        self.client = client or OpenAI(api_key=api_key, base_url=base_url)
+
+    def run_requests(self, batch_input_file: Path, manifest: JobManifest) -> None:
+        self.run_batches(batch_input_file, manifest)
+
+    def close(self) -> None:
+        if hasattr(self.client, "close"):
+            self.client.close()
 
     def upload_batch_file(self, file_path: Path) -> Any:
         """Uploads a batch file to OpenAI and returns the file object."""
-        with open(file_path, "rb") as f:
+        with metrics.stage("upload") as stage, open(file_path, "rb") as f:
+            stage["bytes"] = Path(file_path).stat().st_size
             return self.client.files.create(file=f, purpose="batch")
 
     def start_batch(self, batch_input_file: Any) -> Any:
@@ -29,34 +84,140 @@ class BatchProcessor:
         """Retrieves the status of a batch using its ID."""
         return self.client.batches.retrieve(batch_id)
 
+    def download(self, file_id: str, output_file: BinaryIO) -> Iterator[Dict[str, Any]]:
+        """Streams a file to output_file in fixed-size chunks, yielding each JSON line as it completes."""
+        buffer = b""
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            for chunk in response.iter_bytes(Config.DOWNLOAD_CHUNK_BYTES):
+                output_file.write(chunk)
+                metrics.add("download", bytes=len(chunk))
+                *lines, buffer = (buffer + chunk).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+        if buffer.strip():
+            output_file.write(b"\n")
+            yield json.loads(buffer)
+
     def save_responses(self, file_id: str, filename: str) -> None:
         """Retrieves the responses from a file using its ID and saves to filename."""
         output_path = Config.OUTPUT_DIR / filename
-        with open(output_path, "w") as f:
-            data = self.client.files.content(file_id)
-            for line in data.text:
-                f.write(line)
-    
-    def process(self, batch_input_file: Any, batch_output_file) -> None:
-        """Mocks the process method to simulate the batch processing."""
-        batch_processor = BatchProcessor()
-        file = batch_processor.upload_batch_file(batch_input_file)
-        batch_request = batch_processor.start_batch(file)
-        
-        while batch_request.status != "completed":
-            batch_request = batch_processor.get_batch_status(batch_request.id)
-            if batch_request.status == "completed":
-                logger.info(f"Batch status: {batch_request.status}")
-                break
-            
-            logger.info(f"Batch status: {batch_request.status}")
-            logger.status(f"Processed: {batch_request.request_counts.completed}/{batch_request.request_counts.total}")
-            logger.info("Waiting for 30 seconds...")
-            time.sleep(30)
-        
-        batch_processor.save_responses(batch_request.output_file_id, batch_output_file)
-        logger.info(f"Batch processing completed. Data saved to {batch_output_file}")
+        with open(output_path, "wb") as f:
+            for _ in self.download(file_id, f):
+                pass
+
+    def submit(self, manifest: JobManifest, index: int) -> None:
+        """Uploads a shard and starts its batch, recording each step in the manifest."""
+        shard = manifest.data["shards"][index]
+        if shard.get("file_id"):
+            file = self.client.files.retrieve(shard["file_id"])
+        else:
+            file = self.upload_batch_file(Path(shard["input_file"]))
+            manifest.update_shard(index, file_id=file.id)
 
+        if not shard.get("batch_id"):
+            batch_request = self.start_batch(file)
+            manifest.update_shard(index, batch_id=batch_request.id)
+            self.record_status(manifest, index, batch_request)
+            logger.info(f"Started batch {batch_request.id} for {shard['input_file']}")
+
+    def record_status(self, manifest: JobManifest, index: int, batch_request: Any) -> None:
+        manifest.update_shard(
+            index,
+            status=batch_request.status,
+            output_file_id=batch_request.output_file_id,
+            error_file_id=batch_request.error_file_id,
+            completed=batch_request.request_counts.completed if batch_request.request_counts else 0,
+            total=batch_request.request_counts.total if batch_request.request_counts else 0,
+        )
+
+    def refresh_statuses(self, manifest: JobManifest) -> None:
+        """Retrieves the status of every unfinished batch of the job."""
+        pending = [
+            index for index, shard in enumerate(manifest.data["shards"])
+            if shard.get("batch_id") and shard.get("status") not in self.TERMINAL_STATUSES
+        ]
+        with ThreadPoolExecutor(max_workers=Config.BATCH_MAX_CONCURRENCY) as pool:
+            refreshed = pool.map(self.get_batch_status, [manifest.data["shards"][i]["batch_id"] for i in pending])
+            for index, batch_request in zip(pending, refreshed):
+                self.record_status(manifest, index, batch_request)
+
+    def poll(self, manifest: JobManifest) -> bool:
+        """Refreshes the status of the job's batches once and returns True when all of them have finished."""
+        shards = manifest.data["shards"]
+        if any(shard.get("status") not in self.TERMINAL_STATUSES for shard in shards):
+            self.refresh_statuses(manifest)
+            statuses = ", ".join(f"{shard['batch_id']}: {shard['status']}" for shard in shards)
+            logger.info(f"Batch status: {statuses}")
+            if any(shard["status"] not in self.TERMINAL_STATUSES for shard in shards):
+                completed = sum(shard["completed"] for shard in shards)
+                total = sum(shard["total"] for shard in shards)
+                logger.status(f"Processed: {completed}/{total}")
+                return False
+
+        for shard in shards:
+            if shard["status"] != "completed":
+                logger.error(f"Batch {shard['batch_id']} ended with status: {shard['status']}")
+        return True
+
+    def wait_for_batches(self, manifest: JobManifest) -> None:
+        """Polls all batches of the job together until every one of them has reached a terminal status."""
+        with metrics.stage("queue_wait"):
+            while not self.poll(manifest):
+                logger.info("Waiting for 30 seconds...")
+                time.sleep(30)
+
+    def iter_responses(self, manifest: JobManifest, filename: str) -> Iterator[Dict[str, Any]]:
+        """Streams the output of every batch into one file, in shard order, yielding lines as they arrive.
+
+        The error file of a batch, holding the requests the API rejected, follows its output, so
+        those requests are reported as API errors instead of missing.
+        """
+        with open(Config.OUTPUT_DIR / filename, "wb") as f:
+            for shard in manifest.data["shards"]:
+                for file_id in (shard.get("output_file_id"), shard.get("error_file_id")):
+                    if file_id:
+                        yield from self.download(file_id, f)
+        manifest.set_stage("downloaded")
+
+    def start_requests(self, batch_input_file: Path, manifest: JobManifest) -> None:
+        """Shards the input and submits its batches concurrently, without waiting for them.
+
+        Every completed step is recorded in the job manifest, so calling this again with the
+        same manifest continues from the last completed stage without re-uploading.
+        """
+        if not manifest.data["shards"]:
+            shards = ShardPlanner().plan(Path(batch_input_file))
+            manifest.update(shards=[{"input_file": str(shard)} for shard in shards])
+
+        if not manifest.reached("submitted"):
+            with ThreadPoolExecutor(max_workers=Config.BATCH_MAX_CONCURRENCY) as pool:
+                list(pool.map(in_context(lambda index: self.submit(manifest, index)), range(len(manifest.data["shards"]))))
+            manifest.set_stage("submitted")
+
+    def requests_finished(self, manifest: JobManifest) -> bool:
+        if manifest.reached("batches_finished"):
+            return True
+        if not self.poll(manifest):
+            return False
+        manifest.set_stage("batches_finished")
+        return True
+
+    def run_batches(self, batch_input_file: Any, manifest: JobManifest) -> None:
+        """Shards the input and runs the batches concurrently until all of them have finished."""
+        self.start_requests(batch_input_file, manifest)
+        if not manifest.reached("batches_finished"):
+            self.wait_for_batches(manifest)
+            manifest.set_stage("batches_finished")
+
+    def process(self, batch_input_file: Any, batch_output_file, manifest: Optional[JobManifest] = None) -> None:
+        """Shards the input, runs the batches concurrently and saves their stitched output."""
+        manifest = manifest or JobManifest.create(batch_input_file=str(batch_input_file))
+        self.run_batches(batch_input_file, manifest)
+        if not manifest.reached("downloaded"):
+            for _ in self.iter_responses(manifest, batch_output_file):
+                pass
+        logger.info(f"Batch processing completed. Data saved to {batch_output_file}")
 
 
 if __name__ == "__main__":
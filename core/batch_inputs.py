@@ -1,23 +1,71 @@
 import json
+import math
 from uuid import uuid4
-from typing import List, Dict, Any
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Iterator, Optional, TextIO, Tuple
+
+import pandas as pd
 
 from core.loggers import logger
-from core.file_utils import FileHandler, Modifiers
+from core.metrics import metrics
+from core.file_utils import FileHandler, Modifiers, iter_records
+from core.promo_rules import PromoCalculator
+from core.request_encoder import RequestEncoder
+from core.result_store import ResultStore
+from core.side_store import SideStore
 from core.config import Config
 
 
 class BatchInputProcessor:
-    def __init__(self, input_filename: str, output_filename: str):
+    # Input fields sent in compact mode; the model answers with promo_price and unit_price only.
+    COMPACT_FIELDS = ("regular_price", "sale_price", "promo_description")
+
+    def __init__(
+        self,
+        input_filename: str,
+        output_filename: str,
+        *,
+        local_rules: bool = Config.LOCAL_PROMO_RULES,
+        stream: bool = False,
+        side_store: Path = Config.SIDE_STORE_FILE,
+        rules_report: Path = Config.PROMO_RULES_REPORT_FILE,
+        pack_size: int = Config.PACK_SIZE,
+        pack_token_budget: int = Config.PACK_TOKEN_BUDGET,
+        result_store: Optional[Path] = None,
+        compact: bool = Config.COMPACT_RESPONSES,
+        model: str = Config.OPENAI_MODEL,
+    ):
         self.file = FileHandler()
+        self.stream = stream
+        self.side_store = Path(side_store)
+        self.rules_report = Path(rules_report)
+        self.calculator = PromoCalculator() if local_rules else None
         self.input_filename = input_filename
         self.output_filename = output_filename
+        self.frame = pd.DataFrame()
         self.data: List[Dict[str, Any]] = []
         self.prompt_txt: str = ""
-        self.prompts: List[Dict[str, Any]] = []
+        self.encoder: Optional[RequestEncoder] = None
+        self.prompts: List[str] = []
+        self.signatures: Dict[Tuple[str, str, str], str] = {}
+        self.prompt_count = 0
+        self.grouped_count = 0
+        self.skipped_count = 0
+        self.pack_size = pack_size
+        self.pack_token_budget = pack_token_budget
+        self.packing = pack_size > 1 or pack_token_budget > 0
+        self.pack: List[Dict[str, Any]] = []
+        self.pack_id = ""
+        self.pack_tokens = 0
+        self.result_store = result_store
+        self.results: Optional[ResultStore] = None
+        self.template_digest = ""
+        self.compact = compact
+        self.model = model
 
-    def load_input_file(self, count) -> None:
-        modifiers = [
+    @staticmethod
+    def input_modifiers() -> List[Dict[str, Any]]:
+        return [
             {
                 "modifier": Modifiers.add_id_column,
                 "args": [],
@@ -29,71 +77,279 @@ class BatchInputProcessor:
                 "kwargs": {}
             }
         ]
-        self.file.load(self.input_filename, modifiers=modifiers)
-        
-        if count > 0:
-            self.data = self.file.data[:count]
-        else:
-            self.data = self.file.data
-        
-        with open("output/temp_data.json", "w") as f:
-            json.dump(self.data, f, indent=4)
+
+    def load_input_file(self, count) -> None:
+        """Loads the input as a DataFrame; rows become dictionaries only when their prompts are generated."""
+        frame = self.file.scan(self.input_filename, modifiers=self.input_modifiers()).collect()
+        self.frame = frame.head(count) if count > 0 else frame
+
+    def save_temp_data(self) -> None:
+        """Saves the pass-through rows to the job's side store."""
+        with metrics.stage("side_store") as stage:
+            with SideStore.create(self.side_store) as store:
+                stage["rows"] = store.write(self.data)
+            stage["bytes"] = self.side_store.stat().st_size
 
     def load_prompt_template(self) -> None:
         with open(Config.PROMPT_TEMPLATE_FILE, "r") as f:
             self.prompt_txt = f.read()
+        if self.compact:
+            self.prompt_txt = self.compact_template(self.prompt_txt)
+        self.encoder = RequestEncoder(
+            self.prompt_txt,
+            self.request_body(
+                RequestEncoder.CUSTOM_ID, RequestEncoder.CONTENT, RequestEncoder.MAX_TOKENS,
+                Config.COMPACT_RESPONSE_FORMAT if self.compact else None, self.model,
+            ),
+        )
 
-    def generate_prompts(self) -> None:
-        for item in self.data:
-            if item["promo_description"] == "":
-                logger.warning(f"No descriptions found for the following items: {item['id']}")
-                continue
-            
-            
-            item_minified = {
-                "id": item["id"], 
-                "regular_price": item["regular_price"], 
-                "sale_price": item["sale_price"], 
-                "promo_description": item["promo_description"], 
-                "promo_price": item["promo_price"], 
-                "unit_price": item["unit_price"],
-                "upc": item["upc"]
-            }
-            content = self.prompt_txt.replace("{INPUT}", str(item_minified))
-
-            prompt = {
-                "custom_id": str(uuid4()),
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": Config.OPENAI_MODEL,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are an expert at calculating the price details of products. Your expertise in analyzing the promo description and calculation of the price is exceptional.",
-                        },
-                        {"role": "user", "content": content},
-                    ],
-                    "max_tokens": 1000,
-                    "temperature": 0.2,
-                    "top_p":0.1,
-                    
-                },
-            }
+    @staticmethod
+    def compact_template(template: str) -> str:
+        """Replaces the response format section of the template with the compact response instructions."""
+        head, marker, _ = template.partition(Config.PROMPT_FORMAT_MARKER)
+        head = head if marker else f"{template}\n\n"
+        return f"{head}{Config.COMPACT_PROMPT_NOTE}\n\n{Config.PROMPT_RESPONSE_MARKER}\n"
 
-            self.prompts.append(prompt)
+    @staticmethod
+    def normalize_price(value: Any) -> str:
+        """Normalizes a price value so that "3.5", 3.50 and "3.50" compare equal."""
+        if value is None or value == "":
+            return ""
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return str(value).strip()
+        if math.isnan(number):
+            return ""
+        return f"{number:.2f}"
+
+    @staticmethod
+    def promo_description(item: Dict[str, Any]) -> str:
+        """Returns the promo description of an item, with a missing one as "" whether the reader gave None, NaN or blanks."""
+        value = item.get("promo_description")
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ""
+        return str(value).strip()
+
+    @staticmethod
+    def promo_signature(item: Dict[str, Any]) -> Tuple[str, str, str]:
+        """Returns the normalized (regular_price, sale_price, promo_description) tuple of an item."""
+        description = " ".join(BatchInputProcessor.promo_description(item).split()).casefold()
+        return (
+            BatchInputProcessor.normalize_price(item.get("regular_price")),
+            BatchInputProcessor.normalize_price(item.get("sale_price")),
+            description,
+        )
+
+    @staticmethod
+    def request_body(custom_id: str, content: str, max_tokens: Any, response_format: Optional[Dict[str, Any]] = None, model: str = Config.OPENAI_MODEL) -> Dict[str, Any]:
+        request = {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "You are an expert at calculating the price details of products. Your expertise in analyzing the promo description and calculation of the price is exceptional.",
+                    },
+                    {"role": "user", "content": content},
+                ],
+                "max_tokens": max_tokens,
+                "temperature": 0.2,
+                "top_p":0.1,
+                
+            },
+        }
+        if response_format:
+            request["body"]["response_format"] = response_format
+        return request
+
+    def build_request(self, custom_id: str, content: str, max_tokens: int) -> str:
+        """Returns the serialized request line for a rendered prompt."""
+        self.prompt_count += 1
+        return self.encoder.encode_content(custom_id, content, max_tokens)
+
+    def build_item_request(self, custom_id: str, item: Dict[str, Any], max_tokens: int) -> str:
+        """Returns the serialized request line for the prompt template filled in with one item."""
+        self.prompt_count += 1
+        return self.encoder.encode(custom_id, item, max_tokens)
+
+    def render_pack(self, items: List[Dict[str, Any]]) -> str:
+        """Renders the prompt for several items, asking for a JSON array with one object per item."""
+        note = (Config.COMPACT_PACKED_PROMPT_NOTE if self.compact else Config.PACKED_PROMPT_NOTE).format(count=len(items))
+        head, marker, tail = self.prompt_txt.rpartition(Config.PROMPT_RESPONSE_MARKER)
+        template = f"{head}{note}\n\n{marker}{tail}" if marker else f"{self.prompt_txt}\n{note}\n"
+        return template.replace("{INPUT}", json.dumps(items, indent=1))
+
+    def pack_max_tokens(self, count: int) -> int:
+        if self.compact:
+            max_tokens = Config.COMPACT_MAX_TOKENS + Config.COMPACT_MAX_TOKENS_PER_ITEM * (count - 1)
+        else:
+            max_tokens = Config.PACKED_MAX_TOKENS_PER_ITEM * count
+        return min(max_tokens, Config.PACKED_MAX_TOKENS)
+
+    def flush_pack(self) -> List[str]:
+        """Returns the request for the pending pack of items, if any, and starts a new pack."""
+        if not self.pack:
+            return []
+        request = self.build_request(self.pack_id, self.render_pack(self.pack), self.pack_max_tokens(len(self.pack)))
+        self.pack, self.pack_tokens = [], 0
+        return [request]
+
+    def minify(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the fields of an item sent to the model."""
+        item_minified = {
+            "id": item["id"], 
+            "regular_price": item.get("regular_price", ""), 
+            "sale_price": item.get("sale_price", ""), 
+            "promo_description": item["promo_description"], 
+            "promo_price": item.get("promo_price", ""), 
+            "unit_price": item.get("unit_price", "")
+        }
+        # Compact requests carry only the fields the model needs; its answer is rejoined with
+        # the row in the output stage.
+        if self.compact:
+            item_minified = {"id": 0, **{field: item_minified[field] for field in self.COMPACT_FIELDS}}
+        return item_minified
+
+    @property
+    def item_max_tokens(self) -> int:
+        return Config.COMPACT_MAX_TOKENS if self.compact else 1000
+
+    def item_requests(self, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        """Returns one unpacked request per custom_id of the rows, sent under that custom_id.
+
+        Used to resend the items of a pack one at a time; the prompt template must be loaded.
+        """
+        requests: Dict[str, str] = {}
+        for row in rows:
+            if row["custom_id"] not in requests:
+                requests[row["custom_id"]] = self.build_item_request(row["custom_id"], self.minify(row), self.item_max_tokens)
+        return list(requests.values())
+
+    def prepare_item(self, item: Dict[str, Any]) -> List[str]:
+        """Resolves an item locally or records its custom_id, returning the request lines completed by it."""
+        # The frame reader gives a missing CSV value as NaN and the stream reader as "".
+        if not self.promo_description(item):
+            logger.warning(f"No descriptions found for the following items: {item['id']}")
+            self.skipped_count += 1
+            return []
+
+        if self.calculator:
+            result = self.calculator.calculate(item)
+            if result:
+                item.update(result)
+                return []
+
+        item_minified = self.minify(item)
+
+        # Items unchanged since an earlier run are answered from the result store; the others
+        # record their key so the output stage can store their new result. The key is built from
+        # the normalized signature, so the frame and stream readers' value types do not matter.
+        signature = self.promo_signature(item)
+        if self.results is not None:
+            key = ResultStore.key(self.template_digest, signature)
+            result = self.results.get(key)
+            if result is not None:
+                item.update(result)
+                return []
+            item["result_key"] = key
+
+        # Every row records the custom_id of the request answering it; rows sharing
+        # a promo signature share one request.
+        self.grouped_count += 1
+        if signature in self.signatures:
+            item["custom_id"] = self.signatures[signature]
+            return []
+
+        if not self.packing:
+            custom_id = str(uuid4())
+            self.signatures[signature] = item["custom_id"] = custom_id
+            return [self.build_item_request(custom_id, item_minified, self.item_max_tokens)]
+
+        # Packed items are keyed "<request custom_id>#<position>" and sent with their position as id.
+        requests = []
+        tokens = len(json.dumps(item_minified)) // 4
+        if self.pack and (
+            (self.pack_size > 1 and len(self.pack) >= self.pack_size)
+            or (self.pack_token_budget and self.pack_tokens + tokens > self.pack_token_budget)
+        ):
+            requests = self.flush_pack()
+        if not self.pack:
+            self.pack_id = f"{Config.PACK_PREFIX}{uuid4()}"
+        self.signatures[signature] = item["custom_id"] = f"{self.pack_id}#{len(self.pack)}"
+        self.pack.append({**item_minified, "id": len(self.pack)})
+        self.pack_tokens += tokens
+        return requests
+
+    def generate_prompts(self) -> None:
+        with metrics.stage("generate_prompts") as stage:
+            self.data = list(iter_records(self.frame))
+            for item in self.data:
+                self.prompts.extend(self.prepare_item(item))
+            self.prompts.extend(self.flush_pack())
+            stage["rows"] = len(self.data)
 
     def save_prompts(self) -> None:
-        with open(Config.PROMPTS_DIR / self.output_filename, "w") as f:
-            for prompt in self.prompts:
-                f.write(json.dumps(prompt) + "\n")
+        prompts_path = Config.PROMPTS_DIR / self.output_filename
+        with metrics.stage("save_prompts") as stage:
+            with open(prompts_path, "w", buffering=Config.WRITE_BUFFER_BYTES) as f:
+                f.writelines(self.prompts)
+            stage["rows"] = len(self.prompts)
+            stage["bytes"] = prompts_path.stat().st_size
+
+    def write_prompts(self, rows: Iterable[Dict[str, Any]], prompts_file: TextIO) -> Iterator[Dict[str, Any]]:
+        """Writes the prompt of each row as it passes through and yields the row."""
+        for item in rows:
+            prompts_file.writelines(self.prepare_item(item))
+            yield item
+        prompts_file.writelines(self.flush_pack())
+
+    def stream_prompts(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Writes prompts and side store rows to disk as each row is read, without keeping them in memory.
+
+        Loading, modifiers and prompt generation are interleaved here, so they are recorded as one stage.
+        """
+        prompts_path = Config.PROMPTS_DIR / self.output_filename
+        with metrics.stage("stream_prompts") as stage:
+            with open(prompts_path, "w", buffering=Config.WRITE_BUFFER_BYTES) as prompts_file, SideStore.create(self.side_store) as store:
+                stage["rows"] = store.write(self.write_prompts(rows, prompts_file))
+            stage["bytes"] = prompts_path.stat().st_size + self.side_store.stat().st_size
+
+    def save_rules_report(self) -> None:
+        """Logs and saves the per-pattern hit rates of the local promo calculator."""
+        report = self.calculator.report()
+        with open(self.rules_report, "w") as f:
+            json.dump(report, f, indent=4)
+        logger.info(f"Calculated {report['parsed']}/{report['items']} items locally (hit rate {report['hit_rate']:.1%}).")
+        for name, stats in report["patterns"].items():
+            logger.info(f"  {name}: {stats['hits']} ({stats['hit_rate']:.1%})")
 
     def process(self, count=0) -> None:
-        self.load_input_file(count)
         self.load_prompt_template()
-        self.generate_prompts()
-        self.save_prompts()
-        logger.info(f"Generated {len(self.prompts)} prompts.")
+        if self.result_store:
+            self.results = ResultStore(self.result_store)
+            self.template_digest = ResultStore.template_digest(self.model, self.prompt_txt)
+        try:
+            if self.stream:
+                self.stream_prompts(self.file.stream(self.input_filename, modifiers=self.input_modifiers(), count=count))
+            else:
+                self.load_input_file(count)
+                self.generate_prompts()
+                self.save_prompts()
+                self.save_temp_data()
+        finally:
+            if self.results is not None:
+                logger.info(f"Answered {self.results.hits} items from the result store.")
+                self.results.close()
+                self.results = None
+        if self.calculator:
+            self.save_rules_report()
+        if self.skipped_count:
+            logger.warning(f"Skipped {self.skipped_count} items without a promo description.")
+        logger.info(f"Generated {self.prompt_count} prompts for {self.grouped_count} items.")
 
 if __name__ == "__main__":
     processor = BatchInputProcessor("input_files/jewelesco_new.json", "marianos_batch_inputs_test.jsonl")
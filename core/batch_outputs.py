@@ -1,31 +1,72 @@
+import importlib.util
 import json
+import time
+from collections import Counter
 import pandas as pd
+from openpyxl import Workbook
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from core.loggers import logger
+from core.metrics import metrics
 from core.config import Config
+from core.promo_rules import PromoCalculator
+from core.result_store import ResultStore
+from core.side_store import SideStore
+from core.verifier import STRING_DTYPE, ResultVerifier
 
 
 class BatchOutputProcessor:
-    def __init__(self, input_filename: str, output_filename: str, format: str = "json"):
+    def __init__(self, input_filename: str, output_filename: str, format: str = "json", side_store: Path = Config.SIDE_STORE_FILE, result_store: Optional[Path] = None):
         self.input_filename = input_filename
+        self.side_store = Path(side_store)
+        self.result_store = result_store
+        self.errors: Dict[str, str] = {}
         self.output_filename = Path(output_filename).with_suffix('')
         self.format =  Path(output_filename).suffix or f".{format.lower()}"
 
     @staticmethod
-    def load_data(file_path: Path) -> List[Dict[str, Any]]:
-        """Loads JSON lines from the file and returns as a list of dictionaries."""
+    def load_data(file_path: Path) -> Iterator[Dict[str, Any]]:
+        """Yields the JSON lines of the file one dictionary at a time."""
         with open(file_path, "r") as f:
-            return [json.loads(line) for line in f]
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def api_error(item: Dict[str, Any]) -> Optional[Any]:
+        """Returns the error of an output line the API did not answer successfully, or None.
+
+        Lines of a Batch API error file carry their error in a non-200 response body, with
+        `error` left empty.
+        """
+        if item.get("error"):
+            return item["error"]
+        response = item.get("response")
+        if response is None:
+            return {"message": "No response"}
+        if response.get("status_code", 200) != 200:
+            body = response.get("body")
+            return body.get("error", body) if isinstance(body, dict) else body
+        return None
 
     @staticmethod
     def process_item(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Processes an item and returns the 'content' if no error, otherwise None."""
-        if item.get("error"):
-            print(item["error"])
+        error = BatchOutputProcessor.api_error(item)
+        if error is not None:
+            logger.error(f"Request {item['custom_id']} failed: {error}")
             return None
-        content: str = item["response"]["body"]["choices"][0]["message"]["content"]
+        message = item["response"]["body"]["choices"][0]["message"]
+        content: Optional[str] = message.get("content")
+        if content is None:
+            logger.error(f"No content in response {item['custom_id']}: {message.get('refusal')}")
+            return None
+        # Structured output responses are plain JSON; free-form ones may need fences and ellipses removed.
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            pass
         content = content.replace("...", ",") \
                     .replace("```json", "") \
                     .replace("```", "")
@@ -36,71 +77,239 @@ class BatchOutputProcessor:
             return None
     
     @staticmethod
-    def clean_url(url: str) -> str:
-        return url.replace("\/", "/")
+    def unpack(custom_id: str, processed_item: Any) -> Dict[str, Dict[str, Any]]:
+        """Maps a parsed response to the item keys it answers.
 
-    @staticmethod
-    def load_json_file(file_path: Path) -> List[Dict[str, Any]]:
-        try:
-            with open(file_path, "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
+        Packed responses are JSON arrays whose elements carry the position of their item as id.
+        Elements are matched by that id; only when no element has a usable id are they matched
+        by position, so items missing from an incomplete array stay unanswered and are resent on
+        their own under their item key, "<pack custom_id>#<position>". Compact responses hold
+        the same elements in an items array, with a single element for unpacked requests.
+        """
+        packed = custom_id.startswith(Config.PACK_PREFIX) and "#" not in custom_id
+        if isinstance(processed_item, dict) and isinstance(processed_item.get("items"), list):
+            processed_item = processed_item["items"]
+            if not packed:
+                processed_item = processed_item[0] if processed_item else None
+
+        if not packed:
+            return {custom_id: processed_item} if isinstance(processed_item, dict) else {}
+
+        elements = processed_item if isinstance(processed_item, list) else [processed_item]
+        elements = [element for element in elements if isinstance(element, dict)]
+        positions = []
+        for element in elements:
+            try:
+                positions.append(int(element.get("id")))
+            except (TypeError, ValueError):
+                positions.append(None)
+        if all(position is None for position in positions):
+            positions = list(range(len(elements)))
+        return {f"{custom_id}#{position}": element for position, element in zip(positions, elements) if position is not None}
 
     @staticmethod
-    def merge_data(temp_data: List[Dict[str, Any]], filtered_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def merge_data(temp_data: Iterable[Dict[str, Any]], results: Dict[str, Dict[str, Any]], new_results: Optional[Dict[str, Tuple[str, Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+        """Joins every row with the result of the request recorded against it, in one pass.
+
+        Rows carrying a result store key have their (key, result) pair recorded in new_results under the row id.
+        """
         new_out = []
         for t_item in temp_data:
-            updated = False
-            for f_item in filtered_data:
-                if t_item["id"] == f_item["id"]:
-                    new_out.append({**t_item, **f_item})
-                    updated = True
-                    break
-            if not updated:
+            result_key = t_item.pop("result_key", None)
+            result = results.get(t_item.pop("custom_id", None))
+            if result is None:
                 new_out.append(t_item)
+            else:
+                new_out.append({**t_item, **result, "id": t_item["id"]})
+                if result_key and new_results is not None:
+                    new_results[t_item["id"]] = (result_key, result)
         return new_out
 
+    URL_COLUMNS = ['store_logo', 'url', 'image_url']
+    PRICE_COLUMNS = ["regular_price", "sale_price", "promo_price", "unit_price"]
+
     @staticmethod
     def clean_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-        for column in ['store_logo', 'url', 'image_url']:
-            if column in df.columns:
-                df[column] = df[column].apply(lambda x: BatchOutputProcessor.clean_url(x) if isinstance(x, str) else x)
-        
-        for column in ["regular_price", "sale_price", "promo_price", "unit_price"]:
-            if column in df.columns:
-                df[column] = df[column].apply(lambda x: float(x) if x and isinstance(x, str) else x)
+        """Unescapes URLs and converts non-empty price strings to floats with vectorized operations."""
+        for column in BatchOutputProcessor.URL_COLUMNS:
+            if column in df.columns and pd.api.types.infer_dtype(df[column], skipna=True) == "string":
+                df[column] = df[column].astype(STRING_DTYPE).str.replace("\\/", "/", regex=False)
+
+        for column in BatchOutputProcessor.PRICE_COLUMNS:
+            if column in df.columns and df[column].dtype == object:
+                prices = pd.to_numeric(df[column], errors="coerce").astype(object)
+                df[column] = prices.where(df[column].ne(""), "")
                 
         return df.drop_duplicates()
 
     @staticmethod
-    def save_data(output_file: Path, data: List[Dict[str, Any]], format: str) -> None:
-        """Saves the processed data to a file in the specified format."""
-        filtered_data = [item for item in data if item is not None]
-        temp_data = BatchOutputProcessor.load_json_file(Path("output/temp_data.json"))
-        merged_data = BatchOutputProcessor.merge_data(temp_data, filtered_data)
-        df = BatchOutputProcessor.clean_dataframe(pd.DataFrame(merged_data))
+    def arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+        """Gives every column a single type so the frame can be written as Parquet."""
+        df = df.copy()
+        for column in df.columns:
+            if column in BatchOutputProcessor.PRICE_COLUMNS:
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+            elif df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=True) != "string":
+                df[column] = df[column].astype("string")
+        return df
+
+    @staticmethod
+    def to_parquet(df: pd.DataFrame, path: str) -> None:
+        if importlib.util.find_spec("pyarrow") is None:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow")
+        BatchOutputProcessor.arrow_safe(df).to_parquet(path, index=False, compression=Config.PARQUET_COMPRESSION)
+
+    @staticmethod
+    def to_jsonl(df: pd.DataFrame, path: str) -> None:
+        """Writes one JSON record per line, a chunk of rows at a time."""
+        with open(path, "w") as f:
+            for start in range(0, len(df), Config.OUTPUT_CHUNK_ROWS):
+                chunk = df.iloc[start:start + Config.OUTPUT_CHUNK_ROWS].to_json(orient='records', lines=True)
+                f.write(chunk if chunk.endswith("\n") else chunk + "\n")
+
+    @staticmethod
+    def to_excel(df: pd.DataFrame, path: str) -> None:
+        """Writes an Excel file with openpyxl's write-only mode, a chunk of rows at a time."""
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Sheet1")
+        sheet.append([str(column) for column in df.columns])
+        for start in range(0, len(df), Config.OUTPUT_CHUNK_ROWS):
+            chunk = df.iloc[start:start + Config.OUTPUT_CHUNK_ROWS].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None):
+                sheet.append(row)
+        workbook.save(path)
+
+    @staticmethod
+    def save_data(output_file: Path, results: Dict[str, Dict[str, Any]], format: str, side_store: Path = Config.SIDE_STORE_FILE, result_store: Optional[Path] = None, verify: bool = Config.VERIFY_OUTPUT) -> None:
+        """Saves the processed data to a file in the specified format, keeping new results in the result store.
+
+        With verify, the prices are checked by ResultVerifier and the failing rows saved as a re-query
+        set. Results of failing rows are not kept in the result store, so the re-query asks the model again.
+        """
+        with metrics.stage("merge") as stage:
+            new_results: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+            with SideStore(side_store) as store:
+                merged_data = BatchOutputProcessor.merge_data(store, results, new_results)
+            df = BatchOutputProcessor.clean_dataframe(pd.DataFrame(merged_data))
+            stage["rows"] = len(df)
+
+        failed_keys: Set[str] = set()
+        if verify:
+            with metrics.stage("verify") as stage:
+                failed = ResultVerifier().run(df, output_file)
+                # Rows sharing a key got the same result, so one failing row rejects the key.
+                failed_keys = {new_results[row_id][0] for row_id in df.loc[failed, "id"] if row_id in new_results}
+                stage["rows"] = len(df)
+
+        if result_store:
+            with ResultStore(result_store) as store:
+                entries = {key: result for key, result in new_results.values() if key not in failed_keys}
+                logger.info(f"Saved {store.put_many(entries.items())} new results to the result store, skipped {len(failed_keys)} that failed verification.")
 
         format_handlers = {
             '.json': lambda: df.to_json(f"{output_file}.json", orient='records', indent=4),
+            '.jsonl': lambda: BatchOutputProcessor.to_jsonl(df, f"{output_file}.jsonl"),
             '.csv': lambda: df.to_csv(f"{output_file}.csv", index=False),
             '.tsv': lambda: df.to_csv(f"{output_file}.tsv", sep='\t', index=False),
-            '.excel': lambda: df.to_excel(f"{output_file}.xlsx", index=False, engine='openpyxl')
+            '.parquet': lambda: BatchOutputProcessor.to_parquet(df, f"{output_file}.parquet"),
+            '.excel': lambda: BatchOutputProcessor.to_excel(df, f"{output_file}.xlsx"),
+            '.xlsx': lambda: BatchOutputProcessor.to_excel(df, f"{output_file}.xlsx")
         }
 
         format_lower = format.lower()
         if format_lower in format_handlers:
-            format_handlers[format_lower]()
+            with metrics.stage("write") as stage:
+                format_handlers[format_lower]()
+                stage["rows"] = len(df)
+                stage["bytes"] = Path(f"{output_file}{'.xlsx' if format_lower == '.excel' else format_lower}").stat().st_size
         else:
             raise ValueError(f"Unsupported format: {format}")
         
-    def process(self) -> str:
+    def parse_responses(self, lines: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Parses output lines into results keyed by item, recording why unparsed requests failed."""
+        results: Dict[str, Dict[str, Any]] = {}
+        parse_seconds, parsed, failures, api_errors = 0.0, 0, 0, 0
+        for item in lines:
+            start = time.perf_counter()
+            processed_item = self.process_item(item)
+            if processed_item is None:
+                if self.api_error(item) is not None:
+                    self.errors[item["custom_id"]] = "api_error"
+                    api_errors += 1
+                else:
+                    self.errors[item["custom_id"]] = "parse_error"
+                    failures += 1
+            else:
+                self.errors.pop(item["custom_id"], None)
+            results.update(self.unpack(item["custom_id"], processed_item))
+            parse_seconds += time.perf_counter() - start
+            parsed += 1
+        metrics.add("parse", parse_seconds, calls=1, rows=parsed, parse_failures=failures, api_errors=api_errors)
+        return results
+
+    def failed_requests(self, results: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """Maps the key of every request or item to resend to the reason it failed.
+
+        A request that failed as a whole is resent as it was, under its custom_id. An item
+        missing from or unusable in an answered pack is resent on its own under its item key,
+        "<pack custom_id>#<position>". Reasons are api_error, parse_error, missing_id (the
+        response has no result for an item) and invalid_price (promo_price or unit_price is
+        empty or not a number).
+        """
+        with SideStore(self.side_store) as store:
+            keys = store.custom_ids()
+        failed: Dict[str, str] = {}
+        for key in keys:
+            result = results.get(key)
+            if PromoCalculator.has_prices(result):
+                continue
+            request_id = key.split("#", 1)[0]
+            if result is None and request_id in self.errors:
+                failed.setdefault(request_id, self.errors[request_id])
+            else:
+                failed[key] = "invalid_price" if result is not None else self.errors.get(key, "missing_id")
+        return failed
+
+    def process(
+        self,
+        responses: Optional[Iterable[Dict[str, Any]]] = None,
+        retry: Optional[Callable[[Set[str], int], Iterable[Dict[str, Any]]]] = None,
+        rounds: int = Config.RETRY_ROUNDS,
+    ) -> str:
+        """Parses the batch output, resends failed requests and saves the merged rows.
+
+        :param responses: Output lines to consume as they arrive, e.g. from a streaming download.
+                          The batch output file is read when omitted.
+        :param retry: Called with the custom_ids of the failed requests and the round number;
+                      returns the output lines of the resent requests.
+        :param rounds: Maximum number of retry rounds.
+        """
         input_file = Config.OUTPUT_DIR / self.input_filename
         output_file = Config.OUTPUT_DIR / self.output_filename
-        data = self.load_data(input_file)
-        processed_items = [self.process_item(item) for item in data if self.process_item(item) is not None]
-        self.save_data(output_file, processed_items, self.format)
-        logger.info(f"Processed {len(processed_items)} items.")
+        # Lines are pulled from the download (or the saved file) as they are parsed, so the
+        # time spent waiting for each line and the time spent parsing it are timed separately.
+        lines = metrics.timed("download" if responses is not None else "read_output", responses if responses is not None else self.load_data(input_file))
+        results = self.parse_responses(lines)
+
+        failed = self.failed_requests(results)
+        for round in range(1, rounds + 1):
+            if not failed or retry is None:
+                break
+            logger.info(f"Retrying {len(failed)} failed requests (round {round}/{rounds}): {dict(Counter(failed.values()))}")
+            with metrics.stage("retry") as stage:
+                stage["rows"] = len(failed)
+                retried = self.parse_responses(retry(set(failed), round))
+            # A retried result only replaces an earlier one when it is usable.
+            for key, result in retried.items():
+                if key not in results or PromoCalculator.has_prices(result):
+                    results[key] = result
+            failed = self.failed_requests(results)
+        if failed:
+            logger.warning(f"{len(failed)} requests still failed: {dict(Counter(failed.values()))}")
+
+        self.save_data(output_file, results, self.format, self.side_store, self.result_store)
+        logger.info(f"Processed {len(results)} items.")
         return self.format
 
 if __name__ == "__main__":
@@ -9,13 +9,127 @@ class Config:
     INPUT_DIR = BASE_DIR / "input_files"
     OUTPUT_DIR = BASE_DIR / "output"
     PROMPTS_DIR = BASE_DIR / "prompts"
+    JOBS_DIR = OUTPUT_DIR / "jobs"
     
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY_ORG")
-    OPENAI_MODEL = "gpt-4o-mini"
+    OPENAI_MODEL = os.getenv("GRC_MODEL", "gpt-4o-mini")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    
+    BACKEND = os.getenv("GRC_BACKEND", "batch")  # batch or realtime
+    BACKEND_API_KEY = os.getenv("GRC_BACKEND_API_KEY")  # for base URLs other than OPENAI_BASE_URL
     
     PROMPT_TEMPLATE_FILE = BASE_DIR / "prompt.txt"
     BATCH_INPUT_FILE = PROMPTS_DIR / "batch_inputs.jsonl"
     BATCH_OUTPUT_FILE = PROMPTS_DIR / "batch_output.jsonl"
+    PROMO_RULES_REPORT_FILE = OUTPUT_DIR / "promo_rules_report.json"
+    SIDE_STORE_FILE = OUTPUT_DIR / "rows.sqlite"
+    SIDE_STORE_MMAP_BYTES = 256 * 1024 * 1024
+    OUTPUT_CHUNK_ROWS = 10_000
+    WRITE_BUFFER_BYTES = 1024 * 1024
+    PARQUET_COMPRESSION = "zstd"
+    
+    METRICS_TEXTFILE = os.getenv("GRC_METRICS_TEXTFILE")
+    
+    INPUT_CACHE = True
+    INPUT_CACHE_DIR = OUTPUT_DIR / ".cache" / "inputs"
+    INPUT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+    LOAD_WORKERS = 0  # 0 uses one worker process per CPU
+    
+    LOCAL_PROMO_RULES = True
+    
+    RESULT_STORE = True
+    RESULT_STORE_FILE = OUTPUT_DIR / "results.sqlite"
+    RESULT_STORE_TTL_DAYS = 7
+    RESULT_STORE_MAX_ENTRIES = 1_000_000
+    SQLITE_BUSY_TIMEOUT_SECONDS = 30
+    
+    PACK_SIZE = 1
+    PACK_TOKEN_BUDGET = 0
+    PACK_PREFIX = "pack-"
+    PACKED_MAX_TOKENS_PER_ITEM = 200
+    PACKED_MAX_TOKENS = 16_000
+    PROMPT_RESPONSE_MARKER = "The JSON Response:"
+    PACKED_PROMPT_NOTE = (
+        "The input is a JSON array of {count} products. Apply the task to every product independently and "
+        "respond with a JSON array of {count} objects in the format above, in the same order, "
+        "each keeping the numeric id of its product."
+    )
+    
+    COMPACT_RESPONSES = False
+    COMPACT_MAX_TOKENS = 60
+    COMPACT_MAX_TOKENS_PER_ITEM = 30
+    PROMPT_FORMAT_MARKER = "Do not include explanations."
+    COMPACT_PROMPT_NOTE = (
+        "Do not include explanations. Respond with an object whose items array holds one object per "
+        "product, each with the id of its product and the calculated promo_price and unit_price as numbers."
+    )
+    COMPACT_PACKED_PROMPT_NOTE = (
+        "The input is a JSON array of {count} products. Apply the task to every product independently and "
+        "answer all {count} of them in the items array, in the same order."
+    )
+    COMPACT_RESPONSE_FORMAT = {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "promo_prices",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "id": {"type": "integer"},
+                                "promo_price": {"type": "number"},
+                                "unit_price": {"type": "number"},
+                            },
+                            "required": ["id", "promo_price", "unit_price"],
+                            "additionalProperties": False,
+                        },
+                    },
+                },
+                "required": ["items"],
+                "additionalProperties": False,
+            },
+        },
+    }
+    
+    RETRY_ROUNDS = 2
+    
+    VERIFY_OUTPUT = True
+    VERIFY_PRICE_TOLERANCE = 0.01  # dollars per item
+    VERIFY_OUTLIER_MIN_GROUP = 20  # rows a promo signature needs before its outliers are flagged
+    VERIFY_OUTLIER_THRESHOLD = 5.0  # robust z-score of log(unit_price / base price) within the signature
+    VERIFY_OUTLIER_MIN_SCALE = 0.05  # floor on the robust spread, so tight groups do not flag rounding noise
+    
+    # USD per million input and output tokens, used by the plan command's cost estimate.
+    MODEL_PRICES = {
+        "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+        "gpt-4o": {"input": 2.50, "output": 10.00},
+    }
+    BATCH_PRICE_FACTOR = 0.5
+    TOKENIZER_ENCODING = "o200k_base"  # tiktoken encoding for models tiktoken does not know
     
     COMPLETION_WINDOW = "24h"
     BATCH_METADATA = {"description": "STS Get Promo Price"}
+    BATCH_MAX_REQUESTS = 50_000
+    BATCH_MAX_BYTES = 200 * 1024 * 1024
+    BATCH_MAX_CONCURRENCY = 8
+    DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+    
+    REALTIME_CONCURRENCY = 16
+    REALTIME_REQUESTS_PER_MINUTE = 500
+    REALTIME_TOKENS_PER_MINUTE = 200_000
+    REALTIME_MAX_RETRIES = 5
+    REALTIME_BACKOFF_BASE = 1.0
+    REALTIME_BACKOFF_MAX = 60.0
+    REALTIME_TIMEOUT = 60.0
+    LOCAL_REQUESTS_PER_MINUTE = 0  # 0 disables the client-side limit for self-hosted servers
+    LOCAL_TOKENS_PER_MINUTE = 0
+    
+    WATCH_POLL_SECONDS = 30
+    WATCH_MAX_JOBS = 20  # jobs in flight at once; further files wait in the queue
+    WATCH_WORKERS = 8  # threads for blocking API calls and output stages
+    WATCH_STATE_FILE = OUTPUT_DIR / "watch_state.json"
+    WATCH_REPORT_FILE = OUTPUT_DIR / "watch_report.json"
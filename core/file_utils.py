@@ -1,20 +1,94 @@
+import csv
+import hashlib
+import inspect
 import json
+import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
 from uuid import uuid4
-from typing import List, Dict, Union, Callable, Any
+from typing import List, Dict, Set, Union, Callable, Any, Collection, Iterable, Iterator, TextIO
 
+from core.config import Config
+from core.input_cache import InputCache
 from core.loggers import logger
+from core.metrics import metrics
+
+
+def read_jsonl(path: Union[str, Path]) -> pd.DataFrame:
+    return pd.read_json(path, lines=True)
+
+
+LOADERS: Dict[str, Callable[[Union[str, Path]], pd.DataFrame]] = {
+    '.csv': pd.read_csv,
+    '.xls': pd.read_excel,
+    '.xlsx': pd.read_excel,
+    '.json': pd.read_json,
+    '.jsonl': read_jsonl
+}
+
+def iter_records(df: pd.DataFrame) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the rows of a DataFrame as dictionaries of native Python values.
+
+    Equivalent to `df.to_dict(orient='records')`, but converts each column once instead of
+    boxing every value separately, which makes it several times faster on large frames.
+
+    :param df: DataFrame to convert.
+    :return: Iterator over the rows.
+    """
+    columns = list(df.columns)
+    for row in zip(*(df[column].tolist() for column in columns)):
+        yield dict(zip(columns, row))
+
+
+# Loaders that can skip columns while parsing, through their `usecols` argument.
+PROJECTING_LOADERS = ('.csv', '.xls', '.xlsx')
+
+
+def load_frame(file_path: Union[str, Path], use_cache: bool = Config.INPUT_CACHE, exclude: Collection[str] = ()) -> pd.DataFrame:
+    """
+    Parse one file into a deduplicated DataFrame, going through the parsed-input cache.
+
+    Defined at module level so it can run in the worker processes of `FileHandler.iter_frames`.
+
+    :param file_path: Path to the file to be parsed.
+    :param use_cache: Read and fill the on-disk parsed-input cache.
+    :param exclude: Columns left out of the frame. They are skipped while parsing where the
+                    loader or the cache allows it, and rows are deduplicated without them.
+    :return: DataFrame of the file contents.
+    :raises ValueError: If the file format is unsupported.
+    """
+    file_path = Path(file_path)
+    extension = file_path.suffix.lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported file format: {extension}")
+
+    cache = InputCache() if use_cache and InputCache.available() else None
+    if cache is not None:
+        df = cache.get(file_path, exclude)
+        if df is not None:
+            logger.info(f"Loaded {file_path} from the input cache")
+            return df.drop_duplicates() if exclude else df
+
+    # The cache keeps every column, so columns are only skipped while parsing when it is off.
+    projected = bool(exclude) and cache is None and extension in PROJECTING_LOADERS
+    reader_kwargs = {'usecols': lambda column: column not in exclude} if projected else {}
+    df = LOADERS[extension](file_path, **reader_kwargs).drop_duplicates()
+    if cache is not None:
+        cache.put(file_path, df)
+    excluded = [column for column in exclude if column in df.columns]
+    if excluded:
+        df = df.drop(columns=excluded).drop_duplicates()
+    return df
 
 
 class FileHandler:
-    def __init__(self):
-        self.loaders = {
-            '.csv': pd.read_csv,
-            '.xls': pd.read_excel,
-            '.xlsx': pd.read_excel,
-            '.json': pd.read_json
-        }
+    def __init__(self, use_cache: bool = Config.INPUT_CACHE, workers: int = Config.LOAD_WORKERS):
+        self.loaders = LOADERS
+        self.use_cache = use_cache
+        self.workers = workers or os.cpu_count() or 1
         self.supported_extensions = tuple(self.loaders.keys())
         self.data = None
 
@@ -31,7 +105,7 @@ class FileHandler:
 
         if extension in self.loaders:
             logger.info(f"Loading file: {file_path}")
-            return self.loaders[extension](file_path).drop_duplicates().to_dict(orient='records')
+            return list(iter_records(load_frame(file_path, self.use_cache)))
         else:
             logger.error(f"Unsupported file format: {extension}")
             raise ValueError(f"Unsupported file format: {extension}")
@@ -56,23 +130,207 @@ class FileHandler:
 
     def load_directory(self, directory_path: Union[str, Path]) -> List[Dict[str, Any]]:
         """
-        Load data from all supported files in a directory.
+        Load data from all supported files in a directory, parsing the files in parallel.
 
         :param directory_path: Path to the directory.
         :return: List of dictionaries representing the data from all files.
         """
-        directory = Path(directory_path)
-        files = [f for f in directory.glob('*') if f.suffix.lower() in self.supported_extensions]
-        
         all_data = []
         logger.info(f"Loading data from directory: {directory_path}")
-        for file in files:
+        for df in self.iter_frames(directory_path):
+            all_data.extend(iter_records(df))
+        return all_data
+
+    def iter_frames(self, directory_path: Union[str, Path], exclude: Collection[str] = ()) -> Iterator[pd.DataFrame]:
+        """
+        Parse all supported files in a directory into DataFrames, in parallel worker processes
+        when there are several files.
+
+        :param directory_path: Path to the directory.
+        :param exclude: Columns left out of the frames.
+        :return: Iterator over the DataFrames of the files, in file name order.
+        """
+        directory = Path(directory_path)
+        files = sorted(f for f in directory.glob('*') if f.suffix.lower() in self.supported_extensions)
+        exclude = frozenset(exclude)
+
+        if len(files) < 2 or self.workers < 2:
+            for file in files:
+                logger.info(f"Loading file: {file}")
+                try:
+                    yield load_frame(file, self.use_cache, exclude)
+                except ValueError as e:
+                    logger.warning(f"Could not load file {file}: {e}")
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(files))) as executor:
+            futures = [(file, executor.submit(load_frame, file, self.use_cache, exclude)) for file in files]
+            for file, future in futures:
+                try:
+                    yield future.result()
+                except ValueError as e:
+                    logger.warning(f"Could not load file {file}: {e}")
+
+    def load_data_frame(self, path: Union[str, Path], exclude: Collection[str] = ()) -> pd.DataFrame:
+        """
+        Load data from a file or a directory into one DataFrame.
+
+        :param path: Path to the file or directory.
+        :param exclude: Columns left out of the frame.
+        :return: DataFrame of the data.
+        :raises ValueError: If the path is invalid or the file format is unsupported.
+        """
+        path = Path(path)
+
+        if path.is_file():
+            logger.info(f"Loading file: {path}")
+            return load_frame(path, self.use_cache, frozenset(exclude))
+        elif path.is_dir():
+            logger.info(f"Loading data from directory: {path}")
+            frames = list(self.iter_frames(path, exclude))
+            return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        else:
+            logger.error(f"Invalid path: {path}")
+            raise ValueError(f"Invalid path: {path}")
+
+    def scan(
+        self,
+        input_path: Union[str, Path],
+        modifiers: Union[None, Callable, List[Dict[str, Any]]] = None
+    ) -> "LazyFrame":
+        """
+        Start a columnar modifier pipeline over the input without loading it yet.
+
+        :param input_path: Path to the input data file or directory.
+        :param modifiers: Optional modifier function or list of modifier dictionaries, as for `load`.
+        :return: LazyFrame that loads the input and applies the modifiers on `collect`.
+        """
+        return LazyFrame(self, input_path, modifiers)
+
+    @staticmethod
+    def iter_json_array(f: TextIO, chunk_size: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+        """
+        Incrementally parse a JSON array of objects without reading the whole file.
+
+        :param f: Open text file positioned at the start of the array.
+        :param chunk_size: Number of characters read at a time.
+        :return: Iterator over the objects of the array.
+        :raises ValueError: If the file does not contain a JSON array.
+        """
+        decoder = json.JSONDecoder()
+        buffer, pos = f.read(chunk_size).lstrip(), 0
+        if not buffer.startswith("["):
+            raise ValueError("Streaming a .json file requires a top-level JSON array")
+        pos = 1
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buffer, pos = chunk, 0
+                continue
+            if buffer[pos] == "]":
+                return
             try:
-                all_data.extend(self.load_file(file))
-            except ValueError as e:
-                logger.warning(f"Could not load file {file}: {e}")
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield item
+            if pos > chunk_size:
+                buffer, pos = buffer[pos:], 0
 
-        return all_data
+    def iter_file(self, file_path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the rows of a file one dictionary at a time.
+
+        JSON arrays, JSON lines and CSV files are read incrementally. Excel files cannot be
+        streamed and are loaded in full before their rows are yielded.
+
+        :param file_path: Path to the file to be streamed.
+        :return: Iterator over dictionaries representing the file rows.
+        :raises ValueError: If the file format is unsupported.
+        """
+        file_path = Path(file_path)
+        extension = file_path.suffix.lower()
+        logger.info(f"Streaming file: {file_path}")
+
+        if extension == '.json':
+            with open(file_path, "r") as f:
+                yield from self.iter_json_array(f)
+        elif extension == '.jsonl':
+            with open(file_path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        elif extension == '.csv':
+            with open(file_path, "r", newline="") as f:
+                yield from csv.DictReader(f)
+        elif extension in self.loaders:
+            logger.warning(f"{extension} files cannot be streamed, loading {file_path} in full")
+            yield from iter_records(load_frame(file_path, self.use_cache))
+        else:
+            logger.error(f"Unsupported file format: {extension}")
+            raise ValueError(f"Unsupported file format: {extension}")
+
+    def iter_data(self, path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+        """
+        Stream data from a file or from all supported files in a directory.
+
+        :param path: Path to the file or directory.
+        :return: Iterator over dictionaries representing the data.
+        :raises ValueError: If the path is invalid.
+        """
+        path = Path(path)
+
+        if path.is_file():
+            yield from self.iter_file(path)
+        elif path.is_dir():
+            for file in sorted(path.glob('*')):
+                if file.suffix.lower() in self.supported_extensions:
+                    yield from self.iter_file(file)
+        else:
+            logger.error(f"Invalid path: {path}")
+            raise ValueError(f"Invalid path: {path}")
+
+    def stream(
+        self,
+        input_path: Union[str, Path],
+        modifiers: Union[None, Callable, List[Dict[str, Any]]] = None,
+        dedupe: bool = True,
+        count: int = 0
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream data from input with optional modifier functions applied lazily.
+
+        Modifiers are given in the same form as for `load` and are chained as generators, so
+        only one row is held in memory at a time. As in `LazyFrame.collect`, the columns the
+        pipeline prunes are dropped before deduplicating, so both paths keep the same rows.
+
+        :param input_path: Path to the input data file or directory.
+        :param modifiers: Optional modifier function or list of modifier dictionaries.
+        :param dedupe: Drop duplicate rows using a set of row digests.
+        :param count: Stop after this many rows if greater than 0.
+        :return: Iterator over the modified rows.
+        """
+        pipeline = LazyFrame(self, input_path, modifiers)
+        data: Iterable[Dict[str, Any]] = self.iter_data(input_path)
+        pruned = pipeline.pruned_columns()
+        if pruned:
+            data = Modifiers.remove_columns(data, sorted(pruned))
+        if dedupe:
+            data = Modifiers.drop_duplicates(data)
+
+        for step in pipeline.steps:
+            logger.info(f"Applying modifier `{step['modifier'].__name__}` function to stream")
+            data = step['modifier'](data, *step['args'], **step['kwargs'])
+
+        return islice(data, count) if count > 0 else iter(data)
     
     def to_json(self, output_file: Union[str, Path]) -> None:
         """
@@ -129,8 +387,15 @@ class FileHandler:
                               'kwargs': Dict[str, Any]
                           }
         """
-        self.data = self.load_data(input_path)
+        with metrics.stage("load") as stage:
+            self.data = self.load_data(input_path)
+            stage["rows"] = len(self.data)
         
+        with metrics.stage("modifiers") as stage:
+            self.apply_modifiers(modifiers)
+            stage["rows"] = len(self.data)
+
+    def apply_modifiers(self, modifiers: Union[None, Callable, List[Dict[str, Any]]]) -> None:
         if modifiers:
             if callable(modifiers):
                 logger.info(f"Applying modifier `{modifiers.__name__}` function to data")
@@ -147,54 +412,187 @@ class FileHandler:
                 raise TypeError("modifiers must be a callable or a list of modifier dictionaries")
             
 class Modifiers:
+    """
+    Row modifiers for `FileHandler.load`, `FileHandler.stream` and `FileHandler.scan`.
+
+    Each modifier returns a DataFrame when given a DataFrame, applying itself as a vectorized
+    operation, a list when given a list and a lazy generator when given any other iterable, so
+    the same functions work on scanned, loaded and streamed data.
+    """
+
+    @staticmethod
+    def _same_kind(data: Iterable[Dict[str, Any]], items: Iterator[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        return list(items) if isinstance(data, list) else items
+
     @staticmethod
-    def column_exists(data: List[Dict[str, Any]], column: str) -> List[Dict[str, Any]]:
+    def column_exists(data: Iterable[Dict[str, Any]], column: str) -> Iterable[Dict[str, Any]]:
         """
         Filter data to include only items that have the specified column.
 
-        :param data: List of dictionaries to filter.
+        :param data: DataFrame, list or iterable of dictionaries to filter.
         :param column: Column to check for existence.
-        :return: Filtered list of dictionaries.
+        :return: Filtered DataFrame, list or iterator of dictionaries.
         """
-        return [item for item in data if column in item]
+        if isinstance(data, pd.DataFrame):
+            return data if column in data.columns else data.iloc[0:0]
+        return Modifiers._same_kind(data, (item for item in data if column in item))
 
     @staticmethod
-    def filter_items_by_column(data: List[Dict[str, Any]], column: str, value: str) -> List[Dict[str, Any]]:
+    def filter_items_by_column(data: Iterable[Dict[str, Any]], column: str, value: str) -> Iterable[Dict[str, Any]]:
         """
         Filter data based on a specific column and value.
 
-        :param data: List of dictionaries to filter.
+        :param data: DataFrame, list or iterable of dictionaries to filter.
         :param column: Column to check.
         :param value: Value to filter by.
-        :return: Filtered list of dictionaries.
+        :return: Filtered DataFrame, list or iterator of dictionaries.
         """
-        return [item for item in data if item.get(column) == value]
+        if isinstance(data, pd.DataFrame):
+            return data[data[column] == value] if column in data.columns else data.iloc[0:0]
+        return Modifiers._same_kind(data, (item for item in data if item.get(column) == value))
 
     @staticmethod
-    def add_id_column(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def add_id_column(data: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
         """
         Add a new column with unique IDs based on a specific column.
-        :param data: List of dictionaries to modify.
-        :return: Modified list of dictionaries.
+        :param data: DataFrame, list or iterable of dictionaries to modify.
+        :return: Modified DataFrame, list or iterator of dictionaries.
         """
-        for item in data:
-            item['id'] = str(uuid4())
-        return data
+        if isinstance(data, pd.DataFrame):
+            return data.assign(id=[str(uuid4()) for _ in range(len(data))])
+
+        def add_ids(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for item in items:
+                item['id'] = str(uuid4())
+                yield item
+        return Modifiers._same_kind(data, add_ids(data))
     
     @staticmethod
-    def remove_columns(data: List[Dict[str, Any]], columns: List[str]) -> List[Dict[str, Any]]:
+    def remove_columns(data: Iterable[Dict[str, Any]], columns: List[str]) -> Iterable[Dict[str, Any]]:
         """
         Remove specified columns from the data.
-        :param data: List of dictionaries to modify.
+        :param data: DataFrame, list or iterable of dictionaries to modify.
         :param columns: List of column names to remove.
-        :return: Modified list of dictionaries.
+        :return: Modified DataFrame, list or iterator of dictionaries.
         """
         logger.warning(f"Removing columns: {columns}")
-        for item in data:
-            for column in columns:
-                if column in item:
-                    del item[column]
-        return data
+        if isinstance(data, pd.DataFrame):
+            return data.drop(columns=[column for column in columns if column in data.columns])
+
+        def remove(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            for item in items:
+                for column in columns:
+                    if column in item:
+                        del item[column]
+                yield item
+        return Modifiers._same_kind(data, remove(data))
+
+    @staticmethod
+    def drop_duplicates(data: Iterable[Dict[str, Any]]) -> Iterable[Dict[str, Any]]:
+        """
+        Drop duplicate rows, keeping a set of 16-byte row digests instead of the rows themselves.
+        :param data: DataFrame, list or iterable of dictionaries to deduplicate.
+        :return: Deduplicated DataFrame, list or iterator of dictionaries.
+        """
+        if isinstance(data, pd.DataFrame):
+            return data.drop_duplicates()
+
+        def unique(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+            seen = set()
+            for item in items:
+                digest = hashlib.blake2b(
+                    json.dumps(item, sort_keys=True, default=str).encode(), digest_size=16
+                ).digest()
+                if digest not in seen:
+                    seen.add(digest)
+                    yield item
+        return Modifiers._same_kind(data, unique(data))
+
+
+class LazyFrame:
+    """
+    Modifier pipeline over a DataFrame, recorded lazily and applied on `collect`.
+
+    Modifiers run as vectorized DataFrame operations instead of row by row. Columns removed by
+    `Modifiers.remove_columns` that no earlier modifier reads are pushed down to the loader, so
+    they are never parsed where the loader or the input cache can skip them.
+    """
+
+    # Modifiers whose reads are known, so columns removed after them can still be pushed down.
+    KNOWN_MODIFIERS = (
+        Modifiers.add_id_column,
+        Modifiers.column_exists,
+        Modifiers.filter_items_by_column,
+        Modifiers.remove_columns,
+        Modifiers.drop_duplicates,
+    )
+
+    def __init__(
+        self,
+        handler: FileHandler,
+        input_path: Union[str, Path],
+        modifiers: Union[None, Callable, List[Dict[str, Any]]] = None
+    ):
+        self.handler = handler
+        self.input_path = input_path
+        self.steps: List[Dict[str, Any]] = []
+        if callable(modifiers):
+            self.pipe(modifiers)
+        elif isinstance(modifiers, list):
+            for modifier_dict in modifiers:
+                self.pipe(modifier_dict['modifier'], *modifier_dict.get('args', []), **modifier_dict.get('kwargs', {}))
+        elif modifiers is not None:
+            raise TypeError("modifiers must be a callable or a list of modifier dictionaries")
+
+    def pipe(self, modifier: Callable, *args: Any, **kwargs: Any) -> "LazyFrame":
+        """
+        Record a modifier to apply on `collect`.
+
+        :param modifier: Modifier function taking the DataFrame as its first argument.
+        :return: This pipeline, for chaining.
+        """
+        self.steps.append({'modifier': modifier, 'args': list(args), 'kwargs': kwargs})
+        return self
+
+    def pruned_columns(self) -> Set[str]:
+        """
+        Return the columns removed by the pipeline that no earlier modifier reads.
+
+        Pushdown stops at the first modifier that is not one of `Modifiers`, since it may read any column.
+        """
+        pruned: Set[str] = set()
+        referenced: Set[str] = set()
+        for step in self.steps:
+            modifier = step['modifier']
+            if modifier not in self.KNOWN_MODIFIERS:
+                break
+            arguments = inspect.signature(modifier).bind(None, *step['args'], **step['kwargs']).arguments
+            if 'column' in arguments:
+                referenced.add(arguments['column'])
+            if modifier is Modifiers.remove_columns:
+                pruned.update(column for column in arguments['columns'] if column not in referenced)
+        return pruned
+
+    def collect(self) -> pd.DataFrame:
+        """
+        Load the input and apply the recorded modifiers.
+
+        :return: The modified DataFrame.
+        """
+        pruned = self.pruned_columns()
+        if pruned:
+            logger.info(f"Skipping removed columns while loading: {sorted(pruned)}")
+
+        with metrics.stage("load") as stage:
+            df = self.handler.load_data_frame(self.input_path, pruned)
+            stage["rows"] = len(df)
+
+        with metrics.stage("modifiers") as stage:
+            for step in self.steps:
+                logger.info(f"Applying modifier `{step['modifier'].__name__}` function to frame")
+                df = step['modifier'](df, *step['args'], **step['kwargs'])
+            stage["rows"] = len(df)
+        return df
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+from typing import Collection, Optional, Union
+
+import pandas as pd
+
+from core.config import Config
+from core.loggers import logger
+
+# Parquet schema metadata listing the columns stored as JSON text.
+_JSON_COLUMNS_KEY = b"grc_json_columns"
+
+
+class InputCache:
+    """On-disk cache of parsed input files, stored as Parquet and keyed by path, mtime and size.
+
+    Object columns that are not plain strings (mixed numbers and strings, or strings with
+    missing values) are stored as JSON text, so a cached frame reads back with the same values
+    as a freshly parsed one. The least recently used entries are evicted once the cache grows
+    past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: Path = Config.INPUT_CACHE_DIR, max_bytes: int = Config.INPUT_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def available() -> bool:
+        """The cache needs pyarrow, and is silently disabled without it."""
+        return importlib.util.find_spec("pyarrow") is not None
+
+    @staticmethod
+    def key(file_path: Union[str, Path]) -> str:
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        return hashlib.sha256(f"{file_path}|{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()
+
+    def entry(self, file_path: Union[str, Path]) -> Path:
+        return self.cache_dir / f"{self.key(file_path)}.parquet"
+
+    def get(self, file_path: Union[str, Path], exclude: Collection[str] = ()) -> Optional[pd.DataFrame]:
+        """Returns the cached frame of a file, or None if the file changed or was never cached.
+
+        Columns listed in `exclude` are not read from the entry.
+        """
+        import pyarrow.parquet as pq
+
+        entry = self.entry(file_path)
+        if not entry.is_file():
+            return None
+        try:
+            columns = None
+            if exclude:
+                columns = [name for name in pq.read_schema(entry).names if name not in exclude]
+            table = pq.read_table(entry, columns=columns)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {entry.name}: {e}")
+            entry.unlink(missing_ok=True)
+            return None
+        # Touch the entry so eviction removes the least recently used files first.
+        os.utime(entry)
+        json_columns = json.loads((table.schema.metadata or {}).get(_JSON_COLUMNS_KEY, b"[]"))
+        df = table.to_pandas()
+        for column in json_columns:
+            if column not in df.columns:
+                continue
+            df[column] = pd.Series([json.loads(value) for value in df[column]], index=df.index, dtype=object)
+        return df
+
+    def put(self, file_path: Union[str, Path], df: pd.DataFrame) -> None:
+        """Stores the parsed frame of a file, skipping frames Parquet cannot round-trip."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        json_columns = [
+            column for column in df.columns
+            if df[column].dtype == object and pd.api.types.infer_dtype(df[column], skipna=False) != "string"
+        ]
+        stored = df.copy() if json_columns else df
+        try:
+            for column in json_columns:
+                stored[column] = [json.dumps(value) for value in df[column]]
+            table = pa.Table.from_pandas(stored, preserve_index=False)
+        except (TypeError, ValueError, pa.ArrowException) as e:
+            logger.debug(f"Not caching {file_path}: {e}")
+            return
+
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            _JSON_COLUMNS_KEY: json.dumps(json_columns).encode(),
+        })
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self.entry(file_path)
+        tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path, compression=Config.PARQUET_COMPRESSION)
+        os.replace(tmp_path, entry)
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in self.cache_dir.glob("*.parquet"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Evicted input cache entry {entry.name}")
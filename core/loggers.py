@@ -1,6 +1,11 @@
 import logging
+import os
+import threading
+import time
+from collections import deque
 from colorlog import ColoredFormatter
-import requests
+
+NTFY_URL = os.getenv("NTFY_URL", "https://ntfy.sh")
 
 STATUS = 35
 logging.addLevelName(STATUS, "STATUS")
@@ -25,23 +30,124 @@ def create_colored_formatter():
     )
 
 class NtfyHandler(logging.Handler):
-    def __init__(self, name, channel="sts"):
+    """Sends log records to ntfy from a background thread so logging never blocks on the network.
+
+    Records go into a bounded buffer that drops the oldest messages when full. The worker posts
+    at most one notification every `min_interval` seconds, coalescing everything buffered since
+    the previous post into a single message.
+    """
+
+    MAX_MESSAGE_BYTES = 4000
+
+    def __init__(
+        self,
+        name,
+        channel="sts",
+        base_url=NTFY_URL,
+        timeout: float = 5.0,
+        min_interval: float = 2.0,
+        max_buffer: int = 100,
+    ):
         super().__init__()
         self.name = name
         self.channel = channel
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.min_interval = min_interval
+        self.buffer = deque(maxlen=max_buffer)
+        self.dropped = 0
+        self.closed = False
+        self.flushing = False
+        self.sending = False
+        self.condition = threading.Condition()
+        # requests is imported by the worker on the first post, keeping it off the startup path.
+        self.session = None
+        self.worker = threading.Thread(target=self.run, name=f"ntfy-{channel}", daemon=True)
+        self.worker.start()
     
     def send_notification(self, message: str, title: str = "Logger", priority: str = "default"):
-        url = f"https://ntfy.sh/{self.channel}"
+        import requests
+
+        if self.session is None:
+            self.session = requests.Session()
+        url = f"{self.base_url}/{self.channel}"
         headers = {"Title": title, "Priority": priority}
         try:
-            response = requests.post(url, data=message.encode("utf-8"), headers=headers)
+            response = self.session.post(url, data=message.encode("utf-8"), headers=headers, timeout=self.timeout)
             response.raise_for_status()
         except requests.RequestException as e:
             pass
 
     def emit(self, record):
-        log_entry = self.format(record)
-        self.send_notification(log_entry, title=f"GRC: {self.name}", priority="default")
+        try:
+            log_entry = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self.condition:
+            if self.closed:
+                return
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(log_entry)
+            self.condition.notify()
+
+    def take(self):
+        """Removes and joins everything buffered into one message, or returns None if empty."""
+        if not self.buffer:
+            return None
+        messages = list(self.buffer)
+        self.buffer.clear()
+        if self.dropped:
+            messages.insert(0, f"({self.dropped} older messages dropped)")
+            self.dropped = 0
+        message = "\n".join(messages)
+        if len(message.encode("utf-8")) > self.MAX_MESSAGE_BYTES:
+            message = message.encode("utf-8")[-self.MAX_MESSAGE_BYTES:].decode("utf-8", "ignore")
+        return message
+
+    def run(self):
+        last_sent = 0.0
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.buffer:
+                    return
+                # Wait out the rate limit, letting more records pile up to coalesce.
+                # Every emit notifies, so keep waiting until the deadline, not just the next notify.
+                delay = last_sent + self.min_interval - time.monotonic()
+                while delay > 0 and not (self.closed or self.flushing):
+                    self.condition.wait(delay)
+                    delay = last_sent + self.min_interval - time.monotonic()
+                message = self.take()
+                self.sending = message is not None
+            if message:
+                self.send_notification(message, title=f"GRC: {self.name}", priority="default")
+                last_sent = time.monotonic()
+            with self.condition:
+                self.sending = False
+                self.condition.notify_all()
+
+    def flush(self):
+        """Waits at most `timeout` seconds for the buffered records to be sent."""
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            while (self.buffer or self.sending) and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            self.flushing = False
+
+    def close(self):
+        # logging.shutdown closes every handler at interpreter exit, so the buffer is sent before exiting.
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.worker.join(self.timeout)
+        if self.session is not None:
+            self.session.close()
+        super().close()
 
 def setup_logger(name: str, level: int = logging.DEBUG, ntfy_channel: str = "sts") -> logging.Logger:
     logger = logging.getLogger(name)
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from core.config import Config
+
+
+class JobManifest:
+    """Persists the progress of one job under output/jobs/<job_id> so it can be resumed."""
+
+    STAGES = ["created", "inputs_generated", "submitted", "batches_finished", "downloaded", "output_written"]
+
+    def __init__(self, job_id: str, data: Optional[Dict[str, Any]] = None):
+        self.job_id = job_id
+        self.data: Dict[str, Any] = data or {"job_id": job_id, "stage": "created", "shards": []}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def job_dir(job_id: str) -> Path:
+        return Config.JOBS_DIR / job_id
+
+    @property
+    def dir(self) -> Path:
+        return self.job_dir(self.job_id)
+
+    @property
+    def path(self) -> Path:
+        return self.dir / "manifest.json"
+
+    @classmethod
+    def create(cls, **params: Any) -> "JobManifest":
+        """Creates and saves the manifest of a new job with the given run parameters."""
+        job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid4().hex[:6]}"
+        manifest = cls(job_id)
+        manifest.data.update({
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "params": params,
+            "batch_input_file": str(manifest.dir / "batch_inputs.jsonl"),
+            "batch_output_file": str(manifest.dir / "batch_output.jsonl"),
+        })
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, job_id: str) -> "JobManifest":
+        """Loads the manifest of an existing job.
+
+        :raises ValueError: If the job does not exist.
+        """
+        path = cls.job_dir(job_id) / "manifest.json"
+        if not path.is_file():
+            raise ValueError(f"Unknown job: {job_id}")
+        with open(path, "r") as f:
+            return cls(job_id, json.load(f))
+
+    @classmethod
+    def list_jobs(cls) -> List["JobManifest"]:
+        if not Config.JOBS_DIR.is_dir():
+            return []
+        return [cls.load(path.parent.name) for path in sorted(Config.JOBS_DIR.glob("*/manifest.json"))]
+
+    def save(self) -> None:
+        """Atomically writes the manifest to disk."""
+        with self._lock:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            self.data["updated_at"] = datetime.now().isoformat(timespec="seconds")
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.data, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def update(self, **values: Any) -> None:
+        with self._lock:
+            self.data.update(values)
+            self.save()
+
+    def update_shard(self, index: int, **values: Any) -> None:
+        with self._lock:
+            self.data["shards"][index].update(values)
+            self.save()
+
+    @property
+    def stage(self) -> str:
+        return self.data["stage"]
+
+    def set_stage(self, stage: str) -> None:
+        self.update(stage=stage)
+
+    def reached(self, stage: str) -> bool:
+        """Returns True if the job has completed the given stage."""
+        return self.STAGES.index(self.stage) >= self.STAGES.index(stage)
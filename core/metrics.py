@@ -0,0 +1,226 @@
+import cProfile
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Set
+
+from core.loggers import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_bytes() -> int:
+    """Returns the peak resident set size of the process so far, or 0 where it is unavailable."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Metrics:
+    """Collects the wall time, peak RSS, rows, bytes, parse failures and API errors of each pipeline stage.
+
+    Stages are recorded with the `stage` context manager, with `timed` for time spent pulling
+    from an iterator, or with `add` for figures measured by the caller. Repeated and concurrent
+    calls of the same stage add up.
+
+    The pipeline records to the module-level `metrics`, which forwards to the instance made
+    current with `use`, so jobs running side by side each collect their own figures.
+    """
+
+    COUNTERS = ("rows", "bytes", "parse_failures", "api_errors")
+    PROFILE_STAGES = (
+        "inputs", "load", "modifiers", "generate_prompts", "save_prompts", "side_store", "stream_prompts",
+        "batch", "queue_wait", "realtime_requests", "output", "merge", "verify", "write",
+    )
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.profile_stages: Set[str] = set()
+        self.profile_dir: Optional[Path] = None
+        self._profiling = False
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stages.clear()
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+
+    @contextmanager
+    def use(self) -> Iterator["Metrics"]:
+        """Makes this the instance `metrics` records to in the current context."""
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def merge(self, other: "Metrics") -> None:
+        """Adds the stages of another instance, such as a finished job's, to this one."""
+        with other._lock:
+            stages = {name: dict(record) for name, record in other.stages.items()}
+        for name, record in stages.items():
+            self.add(name, record["wall_seconds"], record["calls"], **{counter: record[counter] for counter in self.COUNTERS})
+
+    def record(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            return self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "peak_rss_bytes": 0, **dict.fromkeys(self.COUNTERS, 0)})
+
+    def add(self, name: str, wall_seconds: float = 0.0, calls: int = 0, **counts: int) -> None:
+        """Adds measured figures to a stage and updates its peak RSS."""
+        record = self.record(name)
+        with self._lock:
+            record["calls"] += calls
+            record["wall_seconds"] += wall_seconds
+            for counter, value in counts.items():
+                record[counter] += value
+            record["peak_rss_bytes"] = max(record["peak_rss_bytes"], peak_rss_bytes())
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, int]]:
+        """Times the enclosed block as one call of a stage.
+
+        Yields a dictionary of counters (rows, bytes, parse_failures, api_errors) for the block to fill in.
+        The block runs under cProfile when the stage was selected with `profile`.
+        """
+        counts = dict.fromkeys(self.COUNTERS, 0)
+        profiler = self._start_profile(name)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            wall_seconds = time.perf_counter() - start
+            if profiler is not None:
+                self._stop_profile(name, profiler)
+            self.add(name, wall_seconds, calls=1, **counts)
+            logger.debug(f"Stage {name} took {wall_seconds:.3f}s")
+
+    def timed(self, name: str, items: Iterable[Any]) -> Iterator[Any]:
+        """Yields the items of an iterator, recording the time spent producing them as a stage."""
+        iterator = iter(items)
+        wall_seconds, rows = 0.0, 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    wall_seconds += time.perf_counter() - start
+                    return
+                wall_seconds += time.perf_counter() - start
+                rows += 1
+                yield item
+        finally:
+            self.add(name, wall_seconds, calls=1, rows=rows)
+
+    def profile(self, stages: Iterable[str], output_dir: Path) -> None:
+        """Runs the given stages under cProfile, saving `profile-<stage>.prof` files to output_dir."""
+        self.profile_stages = set(stages)
+        self.profile_dir = Path(output_dir)
+
+    def _start_profile(self, name: str) -> Optional[cProfile.Profile]:
+        if name not in self.profile_stages or self._profiling:
+            return None
+        self._profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, name: str, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        self._profiling = False
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        path = self.profile_dir / f"profile-{name}.prof"
+        profiler.dump_stats(path)
+        logger.info(f"Saved the {name} profile to {path} (view with: python -m pstats {path})")
+
+    def report(self, **info: Any) -> Dict[str, Any]:
+        """Returns the run report with per-stage figures and rows per second."""
+        with self._lock:
+            stages = {name: dict(record) for name, record in self.stages.items()}
+        for record in stages.values():
+            record["wall_seconds"] = round(record["wall_seconds"], 6)
+            record["rows_per_second"] = round(record["rows"] / record["wall_seconds"], 1) if record["wall_seconds"] and record["rows"] else 0.0
+        return {
+            **info,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_seconds": round(time.perf_counter() - self.started, 6),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "stages": stages,
+        }
+
+    @staticmethod
+    def write_atomic(path: Path, text: str) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def write_report(self, path: Path, **info: Any) -> Dict[str, Any]:
+        """Writes the run report as JSON and returns it."""
+        report = self.report(**info)
+        self.write_atomic(path, json.dumps(report, indent=4))
+        logger.info(f"Run report saved to {path}")
+        return report
+
+    @staticmethod
+    def write_prometheus(path: Path, report: Dict[str, Any]) -> None:
+        """Writes the report in the Prometheus text format, for node_exporter's textfile collector."""
+        job = report.get("job_id", "")
+        metrics = [
+            ("wall_seconds", "Wall time spent in the stage."),
+            ("peak_rss_bytes", "Peak resident set size of the process at the end of the stage."),
+            ("rows", "Rows processed by the stage."),
+            ("bytes", "Bytes written or downloaded by the stage."),
+            ("parse_failures", "Responses that could not be parsed."),
+            ("api_errors", "Requests the API answered with an error."),
+            ("rows_per_second", "Rows processed per second of stage wall time."),
+        ]
+        lines = []
+        for metric, help_text in metrics:
+            lines.append(f"# HELP grc_stage_{metric} {help_text}")
+            lines.append(f"# TYPE grc_stage_{metric} gauge")
+            for name, record in report["stages"].items():
+                lines.append(f'grc_stage_{metric}{{job="{job}",stage="{name}"}} {record[metric]}')
+        lines.append("# HELP grc_run_wall_seconds Wall time of the whole run.")
+        lines.append("# TYPE grc_run_wall_seconds gauge")
+        lines.append(f'grc_run_wall_seconds{{job="{job}"}} {report["wall_seconds"]}')
+        Metrics.write_atomic(path, "\n".join(lines) + "\n")
+
+
+_current: "contextvars.ContextVar[Metrics]" = contextvars.ContextVar("metrics")
+
+
+class CurrentMetrics:
+    """Forwards to the Metrics made current with `Metrics.use`, or to a process-wide default."""
+
+    def __init__(self):
+        self.default = Metrics()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(_current.get(self.default), name)
+
+
+def in_context(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Binds function to a copy of the caller's context, so that metrics it records on a worker
+    thread go to the caller's current Metrics."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+
+metrics = CurrentMetrics()
@@ -0,0 +1,170 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.batch_inputs import BatchInputProcessor
+from core.config import Config
+from core.loggers import logger
+from core.request_encoder import dumps
+from core.result_store import ResultStore
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken when it is installed and has its encoding cached, otherwise
+    estimates 4 characters per token like the rest of the pipeline."""
+
+    def __init__(self, model: str):
+        self.encoding = None
+        try:
+            import tiktoken
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding(Config.TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.debug(f"Estimating tokens from characters, tiktoken is unavailable: {e}")
+        self.name = f"tiktoken {self.encoding.name}" if self.encoding is not None else "4 characters per token"
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+class ByteCounter:
+    """Write-only stand-in for the prompts file that counts the bytes written to it."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.bytes += len(line.encode())
+
+
+class RequestPlanner(BatchInputProcessor):
+    """Streams an input through prompt generation without writing or sending anything, and totals
+    the rows, requests, bytes, tokens and cost the run would take.
+
+    Prompt tokens are counted as the template, counted once, plus the serialized items of each
+    request, so a plan costs about as much as generating the prompts.
+    """
+
+    # Chat format tokens per request: each of the two messages and the reply primer take about 3.
+    MESSAGE_OVERHEAD_TOKENS = 9
+    # Tokens the model adds to an echoed item for its two calculated prices.
+    ECHO_PRICE_TOKENS = 8
+
+    def __init__(self, input_filename: str, **kwargs: Any):
+        super().__init__(input_filename, "", stream=True, **kwargs)
+        self.tokens = TokenCounter(self.model)
+        self.sink = ByteCounter()
+        self.rows = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.max_output_tokens = 0
+        self.template_tokens = 0
+        self.note_tokens: Dict[int, int] = {}
+        self.compact_tokens: Dict[int, int] = {}
+
+    def load_prompt_template(self) -> None:
+        super().load_prompt_template()
+        system = self.request_body("", "", 0)["body"]["messages"][0]["content"]
+        self.template_tokens = (
+            self.MESSAGE_OVERHEAD_TOKENS
+            + self.tokens.count(system)
+            + sum(self.tokens.count(part) for part in self.prompt_txt.split("{INPUT}"))
+        )
+
+    def pack_note_tokens(self, count: int) -> int:
+        if count not in self.note_tokens:
+            note = (Config.COMPACT_PACKED_PROMPT_NOTE if self.compact else Config.PACKED_PROMPT_NOTE).format(count=count)
+            self.note_tokens[count] = self.tokens.count(note)
+        return self.note_tokens[count]
+
+    def answer_tokens(self, items_tokens: int, count: int) -> int:
+        """Estimates the output tokens of an answer for `count` items whose input took items_tokens."""
+        if not self.compact:
+            return items_tokens + self.ECHO_PRICE_TOKENS * count
+        if count not in self.compact_tokens:
+            answer = {"items": [{"id": i, "promo_price": 10.99, "unit_price": 10.99} for i in range(count)]}
+            self.compact_tokens[count] = self.tokens.count(dumps(answer))
+        return self.compact_tokens[count]
+
+    def record(self, items_tokens: int, count: int, max_tokens: int, extra_tokens: int = 0) -> None:
+        self.input_tokens += self.template_tokens + extra_tokens + items_tokens
+        self.output_tokens += min(self.answer_tokens(items_tokens, count), max_tokens)
+        self.max_output_tokens += max_tokens
+
+    def build_item_request(self, custom_id: str, item: Dict[str, Any], max_tokens: int) -> str:
+        self.record(self.tokens.count(dumps(item)), 1, max_tokens)
+        return super().build_item_request(custom_id, item, max_tokens)
+
+    def flush_pack(self) -> List[str]:
+        if self.pack:
+            count = len(self.pack)
+            self.record(self.tokens.count(json.dumps(self.pack, indent=1)), count, self.pack_max_tokens(count), self.pack_note_tokens(count))
+        return super().flush_pack()
+
+    def cost(self, backend: str, base_url: Optional[str]) -> Optional[float]:
+        """Returns the estimated USD cost, or None for unpriced models and self-hosted servers."""
+        prices = Config.MODEL_PRICES.get(self.model)
+        if prices is None or (base_url and base_url.rstrip("/") != Config.OPENAI_BASE_URL.rstrip("/")):
+            return None
+        cost = (self.input_tokens * prices["input"] + self.output_tokens * prices["output"]) / 1_000_000
+        return cost * Config.BATCH_PRICE_FACTOR if backend == "batch" else cost
+
+    def plan(self, count: int = 0, backend: str = Config.BACKEND, base_url: Optional[str] = None) -> Dict[str, Any]:
+        """Runs the input through prompt generation and returns the plan."""
+        self.load_prompt_template()
+        # The result store is only read, so a plan leaves it as it was.
+        if self.result_store and Path(self.result_store).is_file():
+            self.results = ResultStore(self.result_store)
+            self.template_digest = ResultStore.template_digest(self.model, self.prompt_txt)
+        try:
+            rows = self.file.stream(self.input_filename, modifiers=self.input_modifiers(), count=count)
+            for _ in self.write_prompts(rows, self.sink):
+                self.rows += 1
+        finally:
+            store_hits = self.results.hits if self.results is not None else 0
+            if self.results is not None:
+                self.results.close(save=False)
+                self.results = None
+
+        cost = self.cost(backend, base_url)
+        return {
+            "input_file": str(self.input_filename),
+            "model": self.model,
+            "backend": backend,
+            "rows": self.rows,
+            "skipped_rows": self.skipped_count,
+            "local_rule_rows": self.calculator.report()["parsed"] if self.calculator else 0,
+            "result_store_rows": store_hits,
+            "model_rows": self.grouped_count,
+            "requests": self.prompt_count,
+            "jsonl_bytes": self.sink.bytes,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "tokenizer": self.tokens.name,
+            "estimated_cost_usd": None if cost is None else round(cost, 4),
+        }
+
+    @staticmethod
+    def format_report(report: Dict[str, Any]) -> str:
+        cost = report["estimated_cost_usd"]
+        lines = [
+            f"Plan for {report['input_file']} ({report['model']}, {report['backend']})",
+            f"  rows:                 {report['rows']:,}",
+            f"  skipped (no promo):   {report['skipped_rows']:,}",
+            f"  local rules:          {report['local_rule_rows']:,}",
+            f"  result store:         {report['result_store_rows']:,}",
+            f"  sent to the model:    {report['model_rows']:,}",
+            f"  requests:             {report['requests']:,}",
+            f"  JSONL size:           {report['jsonl_bytes'] / 1e6:,.2f} MB",
+            f"  input tokens:         {report['input_tokens']:,}",
+            f"  output tokens:        {report['output_tokens']:,} (max {report['max_output_tokens']:,})",
+            f"  tokenizer:            {report['tokenizer']}",
+            f"  estimated cost:       {'n/a' if cost is None else f'${cost:,.2f}'}",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,149 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_MONEY = r"\$\s*(\d+(?:\.\d+)?)"
+_LABEL = re.compile(r"^[a-z ]*(?:deal|coupon|offer)\s*:\s*", re.IGNORECASE)
+_DETAILS = re.compile(r"\s*in-store or online\s*∙\s*details\.?$", re.IGNORECASE)
+# Anything after the matched promo that introduces a condition or a second promo.
+_UNSAFE_TAIL = re.compile(
+    r"\b(?:buy|when|spend|get|with|purchase[ds]?|transaction|order|free|each|save|must)\b|[$%∙]",
+    re.IGNORECASE,
+)
+
+
+def _spend_threshold(base: float, match: re.Match) -> Tuple[float, float]:
+    discount, threshold = float(match.group(1)), float(match.group(2))
+    promo_price = base - discount if base >= threshold else base
+    return promo_price, promo_price
+
+
+def _multi_buy(base: float, match: re.Match) -> Optional[Tuple[float, float]]:
+    quantity, total = int(match.group(1)), float(match.group(2))
+    if quantity < 1:
+        return None
+    return total, total / quantity
+
+
+def _buy_get(base: float, match: re.Match) -> Optional[Tuple[float, float]]:
+    bought, free = int(match.group(1)), int(match.group(2))
+    percent = 100.0 if match.group(3).lower() == "free" else float(match.group(4))
+    if bought < 1 or percent > 100:
+        return None
+    total_cost = bought * base + free * base * (1 - percent / 100)
+    unit_price = total_cost / (bought + free)
+    # prompt.txt sets promo_price to the per-item cost for buy/get offers.
+    return unit_price, unit_price
+
+
+def _percent_off(base: float, match: re.Match) -> Optional[Tuple[float, float]]:
+    percent = float(match.group(1) or match.group(2))
+    if percent > 100:
+        return None
+    promo_price = base * (1 - percent / 100)
+    return promo_price, promo_price
+
+
+def _fixed_off(base: float, match: re.Match) -> Tuple[float, float]:
+    promo_price = max(base - float(match.group(1)), 0.0)
+    return promo_price, promo_price
+
+
+PROMO_RULES: List[Tuple[str, re.Pattern, Callable[[float, re.Match], Optional[Tuple[float, float]]]]] = [
+    ("spend_threshold", re.compile(rf"{_MONEY}\s+off\s*:?\s*when you spend\s+{_MONEY}", re.IGNORECASE), _spend_threshold),
+    ("multi_buy", re.compile(rf"(?:buy\s+)?(\d+)\s+for\s+{_MONEY}(?:\s*save up to\s*:?\s*\$\s*[\d.]+\s+on\s+\d+)?", re.IGNORECASE), _multi_buy),
+    ("buy_get", re.compile(r"buy\s+(\d+)\s*,?\s+get\s+(\d+)\s+(free|(\d+(?:\.\d+)?)%\s+off)", re.IGNORECASE), _buy_get),
+    ("percent_off", re.compile(r"(?:save\s+(\d+(?:\.\d+)?)%(?:\s+off)?|(\d+(?:\.\d+)?)%\s+off)", re.IGNORECASE), _percent_off),
+    ("fixed_off", re.compile(rf"{_MONEY}\s+off\b\s*:?", re.IGNORECASE), _fixed_off),
+]
+
+
+class PromoCalculator:
+    """Computes promo_price and unit_price locally for the fixed promo patterns listed in prompt.txt."""
+
+    def __init__(self):
+        self.hits: Counter = Counter()
+        self.total = 0
+
+    @staticmethod
+    def parse_price(value: Any) -> Optional[float]:
+        if value is None or value == "":
+            return None
+        try:
+            price = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(price) else price
+
+    @staticmethod
+    def has_prices(result: Any) -> bool:
+        """Returns True if a result has numeric promo_price and unit_price values."""
+        return (
+            isinstance(result, dict)
+            and PromoCalculator.parse_price(result.get("promo_price")) is not None
+            and PromoCalculator.parse_price(result.get("unit_price")) is not None
+        )
+
+    @staticmethod
+    def base_price(item: Dict[str, Any]) -> Optional[float]:
+        """Returns sale_price when present, otherwise regular_price."""
+        sale_price = PromoCalculator.parse_price(item.get("sale_price"))
+        if sale_price is not None:
+            return sale_price
+        return PromoCalculator.parse_price(item.get("regular_price"))
+
+    @staticmethod
+    def normalize_description(description: str) -> Optional[str]:
+        """Strips labels and trailing boilerplate, returning None for multi-promo descriptions."""
+        text = " ".join(str(description).split())
+        if ";" in text:
+            return None
+        text = _LABEL.sub("", text)
+        text = _DETAILS.sub("", text)
+        return text
+
+    @staticmethod
+    def match(description: str, base: float) -> Optional[Tuple[str, float, float]]:
+        """Returns (rule name, promo_price, unit_price) for the first rule that fully explains the description."""
+        text = PromoCalculator.normalize_description(description)
+        if not text:
+            return None
+        for name, pattern, calculate in PROMO_RULES:
+            match = pattern.match(text)
+            if not match or _UNSAFE_TAIL.search(text[match.end():]):
+                continue
+            prices = calculate(base, match)
+            if prices is None:
+                return None
+            return name, prices[0], prices[1]
+        return None
+
+    def calculate(self, item: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """Returns the promo_price and unit_price of an item, or None if it needs the LLM."""
+        self.total += 1
+        base = self.base_price(item)
+        result = self.match(item.get("promo_description", ""), base) if base is not None else None
+        if result is None:
+            self.hits["unparsed"] += 1
+            return None
+        name, promo_price, unit_price = result
+        self.hits[name] += 1
+        return {"promo_price": round(promo_price, 2), "unit_price": round(unit_price, 2)}
+
+    def report(self) -> Dict[str, Any]:
+        """Returns the per-pattern hit counts and hit rates of all calculated items."""
+        parsed = self.total - self.hits["unparsed"]
+        return {
+            "items": self.total,
+            "parsed": parsed,
+            "hit_rate": round(parsed / self.total, 4) if self.total else 0.0,
+            "patterns": {
+                name: {
+                    "hits": self.hits[name],
+                    "hit_rate": round(self.hits[name] / self.total, 4) if self.total else 0.0,
+                }
+                for name, _, _ in PROMO_RULES
+            },
+            "unparsed": self.hits["unparsed"],
+        }
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set
+from uuid import uuid4
+
+import httpx
+
+from core.backends import Backend
+from core.config import Config
+from core.loggers import logger
+from core.manifest import JobManifest
+from core.metrics import metrics
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at `per_minute` tokens per minute; 0 never waits."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1) -> None:
+        if not self.rate:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class RealtimeProcessor(Backend):
+    """Sends batch request lines straight to /chat/completions and writes batch-shaped output lines.
+
+    Works against OpenAI or any OpenAI-compatible server, such as a local vLLM or llama.cpp
+    server. One pooled HTTP client on a private event loop is shared by every run of the
+    processor, so retry rounds reuse the open connections; `close` releases them. Other base
+    URLs than OPENAI_BASE_URL default to the LOCAL_* rate limits, which are off by default.
+    """
+
+    RETRY_STATUSES = {408, 409, 429}
+
+    def __init__(
+        self,
+        api_key: Optional[str] = Config.OPENAI_API_KEY,
+        base_url: str = Config.OPENAI_BASE_URL,
+        concurrency: int = Config.REALTIME_CONCURRENCY,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        max_retries: int = Config.REALTIME_MAX_RETRIES,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        hosted = self.base_url == Config.OPENAI_BASE_URL.rstrip("/")
+        if requests_per_minute is None:
+            requests_per_minute = Config.REALTIME_REQUESTS_PER_MINUTE if hosted else Config.LOCAL_REQUESTS_PER_MINUTE
+        if tokens_per_minute is None:
+            tokens_per_minute = Config.REALTIME_TOKENS_PER_MINUTE if hosted else Config.LOCAL_TOKENS_PER_MINUTE
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def http_client(self) -> httpx.AsyncClient:
+        """Returns the pooled client shared by every run, creating it on first use."""
+        if self.client is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            self.client = httpx.AsyncClient(base_url=self.base_url, headers=headers, limits=limits, timeout=Config.REALTIME_TIMEOUT)
+        return self.client
+
+    def close(self) -> None:
+        if self.loop is None:
+            return
+        if self.client is not None:
+            self.loop.run_until_complete(self.client.aclose())
+            self.client = None
+        self.loop.close()
+        self.loop = None
+
+    @staticmethod
+    def estimate_tokens(body: Dict[str, Any]) -> int:
+        """Roughly estimates the tokens a request counts against the TPM limit (4 characters per token)."""
+        characters = sum(len(message.get("content") or "") for message in body.get("messages", []))
+        return characters // 4 + body.get("max_tokens", 0)
+
+    @staticmethod
+    def output_line(request: Dict[str, Any], status_code: Optional[int], body: Any, error: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Builds an output line with the same shape as a Batch API output file."""
+        return {
+            "id": f"batch_req_{uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": None if status_code is None else {
+                "status_code": status_code,
+                "request_id": body.get("id", "") if isinstance(body, dict) else "",
+                "body": body,
+            },
+            "error": error,
+        }
+
+    def retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and response.headers.get("retry-after"):
+            try:
+                return float(response.headers["retry-after"])
+            except ValueError:
+                pass
+        delay = min(Config.REALTIME_BACKOFF_BASE * 2 ** attempt, Config.REALTIME_BACKOFF_MAX)
+        return delay + random.uniform(0, delay / 2)
+
+    async def send(self, client: httpx.AsyncClient, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends one request, retrying with backoff on 429, 5xx and connection errors."""
+        body = request["body"]
+        tokens = self.estimate_tokens(body)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+            response = None
+            try:
+                response = await client.post(request["url"].removeprefix("/v1"), json=body)
+            except httpx.TransportError as e:
+                error = {"code": "connection_error", "message": str(e)}
+            else:
+                if response.status_code == 200:
+                    return self.output_line(request, 200, response.json())
+                error = {"code": str(response.status_code), "message": response.text}
+                if response.status_code not in self.RETRY_STATUSES and response.status_code < 500:
+                    break
+
+            if attempt < self.max_retries:
+                delay = self.retry_delay(attempt, response)
+                logger.warning(f"Request {request['custom_id']} failed ({error['code']}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        status_code = response.status_code if response is not None else None
+        try:
+            error_body = response.json() if response is not None else None
+        except ValueError:
+            error_body = {"error": error}
+        return self.output_line(request, status_code, error_body, error)
+
+    @staticmethod
+    def completed_ids(output_path: Path) -> Set[str]:
+        """Returns the custom_ids that already have a successful line in the output file."""
+        if not output_path.is_file():
+            return set()
+        completed = set()
+        with open(output_path, "r") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    if not item.get("error"):
+                        completed.add(item["custom_id"])
+        return completed
+
+    async def worker(self, client: httpx.AsyncClient, queue: asyncio.Queue, out) -> None:
+        while True:
+            request = await queue.get()
+            try:
+                try:
+                    line = await self.send(client, request)
+                except Exception as e:
+                    logger.error(f"Request {request['custom_id']} failed: {e}")
+                    line = self.output_line(request, None, None, {"code": "client_error", "message": str(e)})
+                out.write(json.dumps(line) + "\n")
+                self.processed += 1
+                if self.processed % 100 == 0:
+                    logger.status(f"Processed: {self.processed}/{self.total}")
+            finally:
+                queue.task_done()
+
+    async def run(self, batch_input_file: Path, output_path: Path) -> None:
+        self.request_bucket = TokenBucket(self.requests_per_minute)
+        self.token_bucket = TokenBucket(self.tokens_per_minute)
+        completed = self.completed_ids(output_path)
+        self.processed = self.total = 0
+
+        client = self.http_client()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        with open(output_path, "a") as out:
+            workers = [asyncio.create_task(self.worker(client, queue, out)) for _ in range(self.concurrency)]
+            with open(batch_input_file, "r") as f:
+                for line in f:
+                    request = json.loads(line)
+                    if request["custom_id"] in completed:
+                        continue
+                    self.total += 1
+                    await queue.put(request)
+            await queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        logger.info(f"Sent {self.total} requests, skipped {len(completed)} already completed.")
+
+    def process(self, batch_input_file: Any, batch_output_file, manifest: Optional[JobManifest] = None) -> None:
+        """Runs every request of the batch input file in realtime and saves batch-shaped output."""
+        output_path = Config.OUTPUT_DIR / batch_output_file
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        with metrics.stage("realtime_requests") as stage:
+            self.loop.run_until_complete(self.run(Path(batch_input_file), output_path))
+            stage["rows"] = self.total
+        if manifest is not None:
+            manifest.set_stage("downloaded")
+        logger.info(f"Realtime processing completed. Data saved to {batch_output_file}")
+
+    def run_requests(self, batch_input_file: Path, manifest: JobManifest) -> None:
+        self.process(batch_input_file, manifest.data["batch_output_file"], manifest)
+
+    def iter_responses(self, manifest: JobManifest, filename: str) -> Iterator[Dict[str, Any]]:
+        """Yields the lines of the output file, which run_requests writes as the answers arrive."""
+        with open(Config.OUTPUT_DIR / filename, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        manifest.set_stage("downloaded")
@@ -0,0 +1,61 @@
+import json
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """Serializes to compact JSON, with orjson when it is installed.
+
+    The fallback keeps non-ASCII text unescaped, as orjson does, so both write the same bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def escape(text: str) -> str:
+    """Returns text JSON-escaped, without the surrounding quotes."""
+    return dumps(text)[1:-1]
+
+
+class RequestEncoder:
+    """Serializes batch request lines with the prompt template and request envelope compiled once.
+
+    The template is split at {INPUT} and each part JSON-escaped up front, and the envelope (model,
+    system message, sampling parameters) is serialized once around placeholders, so encoding a
+    row only serializes the item itself.
+    """
+
+    CUSTOM_ID = "__custom_id__"
+    CONTENT = "__content__"
+    MAX_TOKENS = "__max_tokens__"
+
+    def __init__(self, template: str, envelope: Dict[str, Any]):
+        """
+        :param template: Prompt template with an {INPUT} placeholder for the item.
+        :param envelope: Request dictionary holding CUSTOM_ID, CONTENT and MAX_TOKENS as placeholder values.
+        """
+        self.template_parts: List[str] = [escape(part) for part in template.split("{INPUT}")]
+        text = dumps(envelope)
+        self.envelope: List[str] = []
+        for placeholder in (self.CUSTOM_ID, self.CONTENT, self.MAX_TOKENS):
+            head, found, text = text.partition(dumps(placeholder))
+            if not found:
+                raise ValueError(f"Request envelope is missing the {placeholder} placeholder")
+            self.envelope.append(head)
+        self.envelope.append(text)
+
+    def encode_content(self, custom_id: str, content: str, max_tokens: int) -> str:
+        """Returns the request line for a fully rendered prompt."""
+        head, after_id, after_content, tail = self.envelope
+        return f"{head}{dumps(custom_id)}{after_id}{dumps(content)}{after_content}{max_tokens}{tail}\n"
+
+    def encode(self, custom_id: str, item: Any, max_tokens: int) -> str:
+        """Returns the request line for the template rendered with the item as JSON."""
+        head, after_id, after_content, tail = self.envelope
+        content = escape(dumps(item)).join(self.template_parts)
+        return f'{head}{dumps(custom_id)}{after_id}"{content}"{after_content}{max_tokens}{tail}\n'
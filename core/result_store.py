@@ -0,0 +1,107 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.config import Config
+from core.promo_rules import PromoCalculator
+
+
+class ResultStore:
+    """Persistent SQLite store of parsed model results shared by all runs.
+
+    Results are keyed by a hash of the model, the prompt template and the normalized promo
+    signature of the item (regular price, sale price and description), so a product whose prices
+    and promo are unchanged since an earlier crawl is answered from the store instead of being
+    resubmitted, however the input was read. Only the computed promo_price and unit_price are
+    kept, so a hit never overwrites the row's own input fields. Entries expire after
+    `ttl_days`, and the least recently used entries are evicted above `max_entries`.
+    """
+
+    # The fields of a result that are stored and applied to the rows it answers.
+    FIELDS = ("promo_price", "unit_price")
+
+    def __init__(self, path: Path = Config.RESULT_STORE_FILE, ttl_days: float = Config.RESULT_STORE_TTL_DAYS, max_entries: int = Config.RESULT_STORE_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.touched: List[Tuple[float, str]] = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Concurrent jobs share the store, so a writer waits for the others instead of failing.
+        self.connection = sqlite3.connect(self.path, timeout=Config.SQLITE_BUSY_TIMEOUT_SECONDS)
+        self.connection.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_SECONDS * 1000)}")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, data TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def __enter__(self) -> "ResultStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self, save: bool = True) -> None:
+        """Records the hits of this run, evicts stale entries and closes the database.
+
+        With save=False the database is closed unchanged, for runs that only look results up.
+        """
+        if save:
+            with self.connection:
+                self.connection.executemany("UPDATE results SET used = ? WHERE key = ?", self.touched)
+            self.evict()
+        self.touched.clear()
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def template_digest(model: str, template: str) -> str:
+        return hashlib.blake2b(f"{model}\0{template}".encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def key(template_digest: str, signature: Tuple[str, ...]) -> str:
+        """Returns the key of an item from its normalized promo signature."""
+        content = "\0".join(signature)
+        return hashlib.blake2b(f"{template_digest}\0{content}".encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the promo_price and unit_price stored under key if unexpired, or None."""
+        now = time.time()
+        row = self.connection.execute("SELECT data, created FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl_seconds:
+            return None
+        self.hits += 1
+        self.touched.append((now, key))
+        data = json.loads(row[0])
+        # Entries written before only prices were stored also hold the echoed input fields.
+        return {field: data[field] for field in self.FIELDS if field in data}
+
+    def put_many(self, entries: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Stores the promo_price and unit_price of cacheable results under their keys, and returns how many were stored."""
+        now = time.time()
+        rows = [
+            (key, json.dumps({field: result[field] for field in self.FIELDS}, separators=(",", ":")), now, now)
+            for key, result in entries
+            # Only results with numeric promo and unit prices are worth keeping.
+            if PromoCalculator.has_prices(result)
+        ]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results (key, data, created, used) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def evict(self) -> None:
+        """Deletes expired entries, then the least recently used ones above max_entries."""
+        with self.connection:
+            self.connection.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl_seconds,))
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY used LIMIT ?)", (excess,)
+                )
@@ -0,0 +1,83 @@
+import json
+import sqlite3
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+from core.config import Config
+
+
+class SideStore:
+    """Per-job SQLite store of the pass-through rows, keyed by row id and indexed by custom_id.
+
+    Rows are stored as compact JSON in insertion order, so the output stage can stream them
+    back in one pass or fetch only the rows of given requests, as retry rounds do for the items
+    of a pack they resend one by one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"PRAGMA mmap_size={Config.SIDE_STORE_MMAP_BYTES}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS rows (seq INTEGER PRIMARY KEY, id TEXT UNIQUE, custom_id TEXT, data TEXT NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS rows_custom_id ON rows (custom_id)")
+
+    @classmethod
+    def create(cls, path: Path) -> "SideStore":
+        """Creates an empty store at path, replacing any store left by an earlier attempt."""
+        path = Path(path)
+        for stale in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+            stale.unlink(missing_ok=True)
+        return cls(path)
+
+    def __enter__(self) -> "SideStore":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def write(self, rows: Iterable[Dict[str, Any]], chunk_size: int = 10_000) -> int:
+        """Appends rows in chunked transactions and returns the number of rows written."""
+        rows = iter(rows)
+        written = 0
+        while True:
+            chunk = [
+                (row.get("id"), row.get("custom_id"), json.dumps(row, separators=(",", ":")))
+                for row in islice(rows, chunk_size)
+            ]
+            if not chunk:
+                return written
+            with self.connection:
+                self.connection.executemany("INSERT INTO rows (id, custom_id, data) VALUES (?, ?, ?)", chunk)
+            written += len(chunk)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yields all rows in insertion order."""
+        for (data,) in self.connection.execute("SELECT data FROM rows ORDER BY seq"):
+            yield json.loads(data)
+
+    def rows_for(self, custom_ids: Iterable[str], chunk_size: int = 500) -> List[Dict[str, Any]]:
+        """Returns the rows answered by the given request custom_ids, in insertion order per chunk of ids."""
+        custom_ids = iter(custom_ids)
+        rows = []
+        while True:
+            chunk = list(islice(custom_ids, chunk_size))
+            if not chunk:
+                return rows
+            placeholders = ",".join("?" * len(chunk))
+            query = f"SELECT data FROM rows WHERE custom_id IN ({placeholders}) ORDER BY seq"
+            rows.extend(json.loads(data) for (data,) in self.connection.execute(query, chunk))
+
+    def custom_ids(self) -> List[str]:
+        """Returns the distinct custom_ids recorded against the rows."""
+        return [custom_id for (custom_id,) in self.connection.execute("SELECT DISTINCT custom_id FROM rows WHERE custom_id IS NOT NULL")]
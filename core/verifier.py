@@ -0,0 +1,163 @@
+import importlib.util
+import json
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.config import Config
+from core.loggers import logger
+
+# Arrow-backed strings run .str operations in native code instead of a Python loop.
+STRING_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else "string"
+# "2 for $5.00", "Buy 3 for $10": the quantity the promo price pays for.
+_MULTI_BUY = r"(?i)(\d+)\s+for\s+\$"
+_NUMBER = r"\d+(?:\.\d+)?"
+# Scales the median absolute deviation to the standard deviation of a normal distribution.
+_MAD_SCALE = 1.4826
+
+
+class ResultVerifier:
+    """Checks the promo_price and unit_price of every row of a merged output frame for consistency
+    with its base price (sale_price, else regular_price) and its promo description.
+
+    Every check runs as one array operation over the whole frame. Descriptions repeat across
+    products, so they are factorized and their text is parsed once per distinct description.
+
+    - negative_price: promo_price or unit_price is below zero.
+    - promo_above_base: promo_price is above the base price times the quantity of a multi-buy offer.
+    - unit_above_promo: unit_price is above promo_price.
+    - quantity_mismatch: unit_price times the multi-buy quantity is not promo_price.
+    - outlier: unit_price / base price is far from the other rows with the same promo signature,
+      the description with its numbers masked.
+
+    Rows without both prices are not checked.
+    """
+
+    CHECKS = ("negative_price", "promo_above_base", "unit_above_promo", "quantity_mismatch", "outlier")
+
+    def __init__(
+        self,
+        tolerance: float = Config.VERIFY_PRICE_TOLERANCE,
+        min_group: int = Config.VERIFY_OUTLIER_MIN_GROUP,
+        threshold: float = Config.VERIFY_OUTLIER_THRESHOLD,
+        min_scale: float = Config.VERIFY_OUTLIER_MIN_SCALE,
+    ):
+        self.tolerance = tolerance
+        self.min_group = min_group
+        self.threshold = threshold
+        self.min_scale = min_scale
+
+    @staticmethod
+    def prices(df: pd.DataFrame, column: str) -> np.ndarray:
+        """Returns a column as floats, with NaN for missing, empty and non-numeric values."""
+        if column not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+    @staticmethod
+    def descriptions(df: pd.DataFrame) -> Tuple[np.ndarray, pd.Series]:
+        """Returns the position of every row's description in the distinct descriptions, and those."""
+        if "promo_description" not in df.columns:
+            return np.zeros(len(df), dtype=np.intp), pd.Series([""], dtype=STRING_DTYPE)
+        codes, uniques = pd.factorize(df["promo_description"])
+        # Missing descriptions get code -1, which indexes the empty description appended last.
+        uniques = pd.Series([*uniques, ""], dtype=object).astype(str).astype(STRING_DTYPE)
+        return codes, uniques
+
+    @staticmethod
+    def signatures(descriptions: pd.Series) -> np.ndarray:
+        """Returns a code per description, shared by descriptions that only differ in their numbers."""
+        signatures = (
+            descriptions.str.lower()
+            .str.replace(_NUMBER, "#", regex=True)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+        )
+        return pd.factorize(signatures)[0]
+
+    def outliers(self, keys: np.ndarray, unit: np.ndarray, base: np.ndarray) -> np.ndarray:
+        """Flags rows whose log(unit_price / base price) has a robust z-score above the threshold
+        within their signature, for signatures with at least min_group such rows."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.log(unit / base)
+        ratio[~np.isfinite(ratio)] = np.nan
+        groups = pd.Series(ratio).groupby(keys)
+        deviation = np.abs(ratio - groups.transform("median").to_numpy())
+        spread = pd.Series(deviation).groupby(keys).transform("median").to_numpy()
+        size = groups.transform("count").to_numpy()
+        scale = np.fmax(_MAD_SCALE * spread, self.min_scale)
+        with np.errstate(invalid="ignore"):
+            return (size >= self.min_group) & (deviation > self.threshold * scale)
+
+    def verify(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Returns a boolean frame with a column per check, True where a row fails the check."""
+        promo = self.prices(df, "promo_price")
+        unit = self.prices(df, "unit_price")
+        sale = self.prices(df, "sale_price")
+        base = np.where(np.isnan(sale), self.prices(df, "regular_price"), sale)
+        codes, descriptions = self.descriptions(df)
+        quantity = pd.to_numeric(descriptions.str.extract(_MULTI_BUY, expand=False), errors="coerce").to_numpy(dtype=float, na_value=np.nan)[codes]
+        checked = ~np.isnan(promo) & ~np.isnan(unit)
+        tolerance = self.tolerance
+
+        # NaN comparisons are False, so a missing base price or quantity passes the checks using it.
+        with np.errstate(invalid="ignore"):
+            failures = {
+                "negative_price": (promo < -tolerance) | (unit < -tolerance),
+                "promo_above_base": promo > base * np.fmax(quantity, 1) + tolerance,
+                "unit_above_promo": unit > promo + tolerance,
+                "quantity_mismatch": (quantity >= 1) & (np.abs(unit * quantity - promo) > tolerance * quantity),
+                "outlier": self.outliers(self.signatures(descriptions)[codes], unit, base),
+            }
+        return pd.DataFrame({check: failures[check] & checked for check in self.CHECKS}, index=df.index)
+
+    def summary(self, df: pd.DataFrame, failures: pd.DataFrame) -> Dict[str, Any]:
+        failed = failures.any(axis=1)
+        checked = int((~np.isnan(self.prices(df, "promo_price")) & ~np.isnan(self.prices(df, "unit_price"))).sum())
+        return {
+            "rows": len(df),
+            "checked": checked,
+            "passed": checked - int(failed.sum()),
+            "failed": int(failed.sum()),
+            "checks": {check: int(failures[check].sum()) for check in self.CHECKS},
+        }
+
+    @staticmethod
+    def requery_set(df: pd.DataFrame, failures: pd.DataFrame) -> pd.DataFrame:
+        """Returns the failing rows with the names of their failed checks in a verify_failures column."""
+        failed = failures.any(axis=1).to_numpy()
+        requery = df.loc[failed].copy()
+        labels = pd.Series("", index=requery.index, dtype=object)
+        for check in ResultVerifier.CHECKS:
+            labels += np.where(failures[check].to_numpy()[failed], f"{check},", "")
+        requery["verify_failures"] = labels.str.rstrip(",")
+        return requery
+
+    def run(self, df: pd.DataFrame, output_file: Path) -> pd.Series:
+        """Verifies the frame, saving the summary to <output_file>.verify.json and any failing rows
+        to <output_file>.requery.jsonl, and returns a boolean Series that is True for failing rows.
+
+        The re-query set is a valid input file, so its rows can be sent again with
+        `main.py -I <output_file>.requery.jsonl`. Without failures no re-query set is written,
+        and one left by an earlier run is removed.
+        """
+        failures = self.verify(df)
+        failed = failures.any(axis=1)
+        requery_path = Path(f"{output_file}.requery.jsonl")
+        if failed.any():
+            with open(requery_path, "w") as f:
+                f.write(self.requery_set(df, failures).to_json(orient="records", lines=True))
+        else:
+            requery_path.unlink(missing_ok=True)
+
+        summary = {**self.summary(df, failures), "requery_file": str(requery_path) if failed.any() else None}
+        with open(f"{output_file}.verify.json", "w") as f:
+            json.dump(summary, f, indent=4)
+        message = f"Verified {summary['checked']} rows: {summary['passed']} passed, {summary['failed']} failed {summary['checks']}"
+        if summary["failed"]:
+            logger.warning(f"{message}. Re-query set saved to {requery_path}")
+        else:
+            logger.info(message)
+        return failed
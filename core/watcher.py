@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from core.config import Config
+from core.file_utils import LOADERS
+from core.loggers import logger
+from core.manifest import JobManifest
+from core.metrics import Metrics
+
+Signature = Tuple[int, int]
+
+
+class FolderWatcher:
+    """Watches a directory for new input files and runs a job for each of them from one event loop.
+
+    A file is queued once its size and modification time are unchanged between two scans, so
+    files still being written are left alone. Every job generates its inputs on one worker
+    thread, submits its batches and then only sleeps on the loop between status checks, so
+    many batches can be in flight at once; each store's output is written as soon as its own
+    batches complete.
+
+    The jobs of the files are kept in a state file. On start, unfinished jobs are resumed from
+    their manifests, and files already present on the first start are skipped unless
+    include_existing is set. A file that changes after its job started is processed again once
+    that job has finished, never by two jobs at once.
+
+    Every job collects its stage metrics in its own Metrics, saved as the job's run report and
+    added to the watch report when the job ends.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        create_job: Callable[[Path], Any],
+        resume_job: Callable[[str], Any],
+        poll_interval: float = Config.WATCH_POLL_SECONDS,
+        max_jobs: int = Config.WATCH_MAX_JOBS,
+        include_existing: bool = False,
+        state_file: Path = Config.WATCH_STATE_FILE,
+        metrics_textfile: Optional[str] = Config.METRICS_TEXTFILE,
+    ):
+        """
+        :param directory: Directory to watch.
+        :param create_job: Creates the BatchProcessingManager of a new input file.
+        :param resume_job: Recreates the BatchProcessingManager of a job id.
+        :param poll_interval: Seconds between directory scans, and between batch status checks of a job.
+        :param max_jobs: Jobs in flight at once.
+        :param include_existing: Also process the files already in the directory on the first start.
+        :param state_file: JSON file recording the job of every file seen.
+        :param metrics_textfile: Also write the watch report in the Prometheus text format to this path.
+        """
+        self.directory = Path(directory)
+        self.create_job = create_job
+        self.resume_job = resume_job
+        self.poll_interval = poll_interval
+        self.max_jobs = max_jobs
+        self.include_existing = include_existing
+        self.state_file = Path(state_file)
+        self.metrics_textfile = metrics_textfile
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.candidates: Dict[str, Signature] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.running: Dict[str, asyncio.Task] = {}
+        self.metrics = Metrics()
+        self.slots: Optional[asyncio.Semaphore] = None
+        # Input generation is CPU-bound and writes the shared promo rules report, so it runs
+        # one job at a time; the other blocking calls share a small pool.
+        self.inputs_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="watch-inputs")
+        self.pool = ThreadPoolExecutor(max_workers=Config.WATCH_WORKERS, thread_name_prefix="watch")
+
+    @staticmethod
+    def output_name(path: Path) -> str:
+        """Returns the output file name of an input file; the extension is kept so that a.json
+        and a.csv do not write to the same output."""
+        return f"{path.stem}_{path.suffix.lstrip('.').lower()}"
+
+    @staticmethod
+    def signature(path: Path) -> Signature:
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def input_files(self) -> Dict[str, Signature]:
+        """Returns the supported input files in the directory with their signatures."""
+        files = {}
+        for path in self.directory.iterdir():
+            if path.name.startswith((".", "~$")) or path.suffix.lower() not in LOADERS or not path.is_file():
+                continue
+            try:
+                files[str(path)] = self.signature(path)
+            except FileNotFoundError:
+                continue
+        return files
+
+    def load_state(self) -> None:
+        if self.state_file.is_file():
+            with open(self.state_file, "r") as f:
+                self.files = json.load(f)["files"]
+        elif not self.include_existing:
+            self.files = {path: {"signature": list(signature), "job_id": None, "status": "skipped"} for path, signature in self.input_files().items()}
+            self.save_state()
+            logger.info(f"Skipping {len(self.files)} files already in {self.directory}")
+
+    def save_state(self) -> None:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_file.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=4)
+        os.replace(tmp_path, self.state_file)
+
+    def set_status(self, path: str, **values: Any) -> None:
+        self.files[path].update(values)
+        self.save_state()
+
+    def scan(self) -> None:
+        """Starts a job for every new or changed file whose signature held since the previous scan.
+
+        A file whose job is still running is looked at again once the job has finished.
+        """
+        current = self.input_files()
+        for path, signature in current.items():
+            if path in self.running:
+                continue
+            known = self.files.get(path)
+            if known is not None and tuple(known["signature"]) == signature:
+                continue
+            if self.candidates.get(path) == signature:
+                del self.candidates[path]
+                self.files[path] = {"signature": list(signature), "job_id": None, "status": "queued"}
+                self.save_state()
+                self.start(path)
+            else:
+                self.candidates[path] = signature
+        for path in set(self.candidates) - set(current):
+            del self.candidates[path]
+
+    def start(self, path: str, job_id: Optional[str] = None) -> None:
+        task = asyncio.get_running_loop().create_task(self.run_job(path, job_id))
+        self.tasks.add(task)
+        self.running[path] = task
+        task.add_done_callback(partial(self.finished, path))
+
+    def finished(self, path: str, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if self.running.get(path) is task:
+            del self.running[path]
+
+    async def blocking(self, pool: ThreadPoolExecutor, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs function on the pool in a copy of the job's context, so it records to the job's metrics."""
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(pool, partial(context.run, function, *args))
+
+    async def run_job(self, path: str, job_id: Optional[str]) -> None:
+        async with self.slots:
+            manager = None
+            try:
+                if job_id is None:
+                    manager = await self.blocking(self.pool, self.create_job, Path(path))
+                    self.set_status(path, job_id=manager.manifest.job_id, status="running")
+                else:
+                    manager = await self.blocking(self.pool, self.resume_job, job_id)
+                job_id = manager.manifest.job_id
+                logger.info(f"Job {job_id} started for {Path(path).name} at stage: {manager.manifest.stage}")
+                with manager.metrics.use():
+                    await self.run_stages(manager)
+                self.set_status(path, status="done")
+                logger.status(f"Job {job_id} finished {Path(path).name}, output: {manager.output_file}")
+            except Exception as e:
+                logger.error(f"Job {job_id} for {Path(path).name} failed: {e}")
+                self.set_status(path, status="failed", error=str(e))
+            finally:
+                if manager is not None:
+                    await self.blocking(self.pool, manager.close)
+                    manager.write_report()
+                    self.metrics.merge(manager.metrics)
+                self.write_report()
+
+    async def run_stages(self, manager: Any) -> None:
+        await self.blocking(self.inputs_pool, manager.generate_inputs)
+        manifest = manager.manifest
+        if not manifest.reached("batches_finished"):
+            if not manifest.data["requests"]:
+                manager.process_batch()
+            else:
+                backend = await self.blocking(self.pool, manager.backend, manager.mode)
+                await self.blocking(self.pool, backend.start_requests, manager.batch_input_file, manifest)
+                while not await self.blocking(self.pool, backend.requests_finished, manifest):
+                    await asyncio.sleep(self.poll_interval)
+        await self.blocking(self.pool, manager.write_output)
+
+    def write_report(self) -> None:
+        """Writes the stage metrics of every job since the watcher started, and the job counts."""
+        counts: Dict[str, int] = {}
+        for entry in self.files.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        report = self.metrics.write_report(Config.WATCH_REPORT_FILE, job_id="watch", directory=str(self.directory), files=counts)
+        if self.metrics_textfile:
+            Metrics.write_prometheus(Path(self.metrics_textfile), report)
+
+    async def watch(self, stop_when_idle: bool = False) -> None:
+        """Scans the directory every poll interval until cancelled.
+
+        :param stop_when_idle: Return once no job is running and no new file is settling.
+        """
+        self.slots = asyncio.Semaphore(self.max_jobs)
+        self.load_state()
+        for path, entry in self.files.items():
+            if entry["status"] in ("queued", "running"):
+                if entry["job_id"] is None or not JobManifest.job_dir(entry["job_id"]).is_dir():
+                    # The job was never created, so the file starts over.
+                    self.start(path)
+                else:
+                    self.start(path, entry["job_id"])
+        logger.info(f"Watching {self.directory} every {self.poll_interval:g}s ({len(self.tasks)} jobs resumed)")
+
+        while True:
+            self.scan()
+            if stop_when_idle and not self.tasks and not self.candidates:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+    def run(self, stop_when_idle: bool = False) -> None:
+        """Runs the watcher on a new event loop until interrupted or, with stop_when_idle, idle."""
+        try:
+            asyncio.run(self.watch(stop_when_idle))
+        except KeyboardInterrupt:
+            logger.info("Stopped watching; unfinished jobs resume on the next start.")
+        finally:
+            self.pool.shutdown(wait=True)
+            self.inputs_pool.shutdown(wait=True)
@@ -1,61 +1,351 @@
 import argparse
-from typing import Optional
+import json
+import logging
+import sys
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set
 
 from core.loggers import logger
-from core.batch_inputs import BatchInputProcessor
-from core.batch_outputs import BatchOutputProcessor
-from core.batch import BatchProcessor
+from core.backends import BACKENDS, Backend, create_backend
 from core.config import Config
+from core.manifest import JobManifest
+from core.side_store import SideStore
+from core.metrics import Metrics
 from pathlib import Path
 
+# The input and output processors import pandas, so they are only imported by the stages that
+# use them, keeping --help, --status and plan fast to start.
+if TYPE_CHECKING:
+    from core.batch_inputs import BatchInputProcessor
+    from core.batch_outputs import BatchOutputProcessor
+
 
 class BatchProcessingManager:
-    def __init__(self, input_file: str, output_file: str, prompt_file: Optional[str] = None, format: Optional[str] = "json", count: int = 0):
+    def __init__(
+        self,
+        input_file: str,
+        output_file: str,
+        *,
+        prompt_file: Optional[str] = None,
+        format: Optional[str] = "json",
+        count: int = 0,
+        mode: str = Config.BACKEND,
+        stream: bool = False,
+        pack_size: int = Config.PACK_SIZE,
+        pack_token_budget: int = Config.PACK_TOKEN_BUDGET,
+        use_result_store: bool = Config.RESULT_STORE,
+        retry_rounds: int = Config.RETRY_ROUNDS,
+        retry_mode: Optional[str] = None,
+        compact: bool = Config.COMPACT_RESPONSES,
+        base_url: Optional[str] = None,
+        model: str = Config.OPENAI_MODEL,
+        manifest: Optional[JobManifest] = None,
+    ):
         self.input_file = input_file
         self.output_file = output_file
         self.format = format
         self.count = int(count)
+        self.mode = mode
+        self.stream = stream
+        self.pack_size = int(pack_size)
+        self.pack_token_budget = int(pack_token_budget)
+        self.use_result_store = use_result_store
+        self.retry_rounds = int(retry_rounds)
+        self.retry_mode = retry_mode or mode
+        self.compact = compact
+        self.base_url = base_url
+        self.model = model
         self.prompt_file = prompt_file or Config.PROMPT_TEMPLATE_FILE
-        self.input_processor: Optional[BatchInputProcessor] = None
-        self.processor: Optional[BatchProcessor] = None 
-        self.output_processor: Optional[BatchOutputProcessor] = None
+        self.manifest = manifest or JobManifest.create(
+            input_file=str(input_file), output_file=output_file, prompt_file=prompt_file, format=format, count=self.count, mode=mode, stream=stream,
+            pack_size=self.pack_size, pack_token_budget=self.pack_token_budget, use_result_store=use_result_store,
+            retry_rounds=self.retry_rounds, retry_mode=self.retry_mode, compact=compact,
+            base_url=base_url, model=model
+        )
+        self.input_processor: Optional["BatchInputProcessor"] = None
+        self.processor: Optional[Backend] = None
+        self.backends: Dict[str, Backend] = {}
+        self.output_processor: Optional["BatchOutputProcessor"] = None
+        self.metrics = Metrics()
+
+    @classmethod
+    def resume(cls, job_id: str) -> "BatchProcessingManager":
+        """Recreates the manager of an existing job from its manifest."""
+        manifest = JobManifest.load(job_id)
+        # The manifest records the run parameters under the names of the keyword arguments.
+        return cls(**manifest.data["params"], manifest=manifest)
+
+    @property
+    def batch_input_file(self) -> Path:
+        return Path(self.manifest.data["batch_input_file"])
+
+    @property
+    def batch_output_file(self) -> Path:
+        return Path(self.manifest.data["batch_output_file"])
+
+    @property
+    def side_store(self) -> Path:
+        return self.manifest.dir / "rows.sqlite"
+
+    @property
+    def rules_report(self) -> Path:
+        return self.manifest.dir / "promo_rules_report.json"
+
+    @property
+    def result_store(self) -> Optional[Path]:
+        return Config.RESULT_STORE_FILE if self.use_result_store else None
+
+    def backend(self, name: str) -> Backend:
+        """Returns the backend of the given name, shared by the main run and the retry rounds."""
+        if name not in self.backends:
+            self.backends[name] = create_backend(name, self.base_url)
+        return self.backends[name]
 
     def initialize_input_processor(self) -> None:
-        self.input_processor = BatchInputProcessor(self.input_file, Config.BATCH_INPUT_FILE)
+        from core.batch_inputs import BatchInputProcessor
+
+        self.input_processor = BatchInputProcessor(self.input_file, self.batch_input_file, stream=self.stream, side_store=self.side_store,
+                                                   rules_report=self.rules_report,
+                                                   pack_size=self.pack_size, pack_token_budget=self.pack_token_budget, result_store=self.result_store,
+                                                   compact=self.compact, model=self.model)
         self.input_processor.process(self.count)
+        self.manifest.update(requests=self.input_processor.prompt_count)
+        self.manifest.set_stage("inputs_generated")
 
     def process_batch(self) -> None:
-        self.processor = BatchProcessor()
-        self.processor.process(Config.BATCH_INPUT_FILE, Config.BATCH_OUTPUT_FILE)
+        if not self.manifest.data["requests"]:
+            logger.info("All items were answered locally or from the result store, skipping the batch.")
+            self.batch_output_file.write_text("")
+            self.manifest.set_stage("downloaded")
+            return
+        self.processor = self.backend(self.mode)
+        self.processor.run_requests(self.batch_input_file, self.manifest)
+
+    def download_responses(self) -> Iterator[Dict[str, Any]]:
+        """Streams the batch output, yielding lines to the output stage while they download."""
+        self.processor = self.backend(self.mode)
+        return self.processor.iter_responses(self.manifest, self.batch_output_file)
+
+    def retry_requests(self, custom_ids: Set[str], round: int) -> Iterable[Dict[str, Any]]:
+        """Resends only the given requests through the retry backend and returns their output lines.
+
+        Item keys of packs ("<pack custom_id>#<position>") are resent as unpacked requests of
+        their own. Each round is a sub-job under the job directory, so a resumed job picks up an
+        unfinished round.
+        """
+        job_id = f"{self.manifest.job_id}/retry-{round}"
+        try:
+            manifest = JobManifest.load(job_id)
+        except ValueError:
+            manifest = JobManifest(job_id)
+            manifest.data.update(
+                batch_input_file=str(manifest.dir / "batch_inputs.jsonl"),
+                batch_output_file=str(manifest.dir / "batch_output.jsonl"),
+                requests=len(custom_ids),
+            )
+            manifest.dir.mkdir(parents=True, exist_ok=True)
+            with open(self.batch_input_file, "r") as f, open(manifest.data["batch_input_file"], "w") as out:
+                for line in f:
+                    if json.loads(line)["custom_id"] in custom_ids:
+                        out.write(line)
+                out.writelines(self.item_requests({custom_id for custom_id in custom_ids if "#" in custom_id}))
+            manifest.save()
+
+        batch_input_file = Path(manifest.data["batch_input_file"])
+        batch_output_file = Path(manifest.data["batch_output_file"])
+        if not manifest.reached("downloaded"):
+            backend = self.backend(self.retry_mode)
+            backend.run_requests(batch_input_file, manifest)
+            if not manifest.reached("downloaded"):
+                return backend.iter_responses(manifest, batch_output_file)
+        from core.batch_outputs import BatchOutputProcessor
+
+        return BatchOutputProcessor.load_data(batch_output_file)
+
+    def item_requests(self, custom_ids: Set[str]) -> List[str]:
+        """Returns an unpacked request for each of the given pack items, built from its row in the side store."""
+        if not custom_ids:
+            return []
+        from core.batch_inputs import BatchInputProcessor
+
+        processor = BatchInputProcessor(self.input_file, self.batch_input_file, compact=self.compact, model=self.model)
+        processor.load_prompt_template()
+        with SideStore(self.side_store) as store:
+            return processor.item_requests(store.rows_for(custom_ids))
+
+    def process_output(self, responses: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+        from core.batch_outputs import BatchOutputProcessor
+
+        self.output_processor = BatchOutputProcessor(self.batch_output_file, self.output_file, self.format, self.side_store, self.result_store)
+        output_format = self.output_processor.process(responses, self.retry_requests, self.retry_rounds)
+        self.manifest.set_stage("output_written")
+        return output_format
+
+    def run(self, profile: Optional[List[str]] = None, metrics_textfile: Optional[str] = Config.METRICS_TEXTFILE) -> None:
+        """Runs the remaining stages of the job and writes its run report, even if a stage fails.
 
-    def process_output(self) -> None:
-        self.output_processor = BatchOutputProcessor(Config.BATCH_OUTPUT_FILE, self.output_file, self.format)
-        return self.output_processor.process()
+        :param profile: Stages to run under cProfile, saved as profile-<stage>.prof in the job directory.
+        :param metrics_textfile: Also write the run report in the Prometheus text format to this path.
+        """
+        self.metrics.profile(profile or [], self.manifest.dir)
+        with self.metrics.use():
+            try:
+                self.run_stages()
+            finally:
+                self.close()
+                self.write_report(metrics_textfile)
 
-    def run(self) -> None:
+    def write_report(self, metrics_textfile: Optional[str] = None) -> None:
+        """Writes the stage metrics of the job to run_report.json in the job directory."""
+        report = self.metrics.write_report(self.manifest.dir / "run_report.json", job_id=self.manifest.job_id, stage=self.manifest.stage)
+        if metrics_textfile:
+            Metrics.write_prometheus(Path(metrics_textfile), report)
+
+    def generate_inputs(self) -> None:
+        if not self.manifest.reached("inputs_generated"):
+            with self.metrics.stage("inputs"):
+                self.initialize_input_processor()
+
+    def write_output(self) -> None:
+        responses = None
+        if not self.manifest.reached("downloaded"):
+            responses = self.download_responses()
+        if not self.manifest.reached("output_written"):
+            with self.metrics.stage("output"):
+                self.process_output(responses)
+
+    def close(self) -> None:
+        for backend in self.backends.values():
+            backend.close()
+        self.backends.clear()
+
+    def run_stages(self) -> None:
+        logger.info(f"Job {self.manifest.job_id} at stage: {self.manifest.stage}")
         logger.info("Starting batch processing and output processing...")
-        self.initialize_input_processor()
+        self.generate_inputs()
         logger.info("Batch input processing completed.")
         logger.info("Starting batch processing...")
-        self.process_batch()
+        if not self.manifest.reached("batches_finished"):
+            with self.metrics.stage("batch"):
+                self.process_batch()
         logger.info("Batch processing completed.")
         logger.info("Starting output processing...")
-        self.process_output()        
+        self.write_output()
         logger.info("Output processing completed.")
 
 
+def show_status(job_id: Optional[str] = None) -> None:
+    """Logs the stage of every job, or the live batch status of one job."""
+    if job_id is None:
+        for manifest in JobManifest.list_jobs():
+            logger.info(f"{manifest.job_id}: {manifest.stage} ({manifest.data['params']['input_file']})")
+        return
+
+    manifest = JobManifest.load(job_id)
+    if manifest.reached("submitted") and not manifest.reached("batches_finished"):
+        with create_backend("batch", manifest.data["params"].get("base_url")) as backend:
+            backend.refresh_statuses(manifest)
+    logger.info(f"{manifest.job_id}: {manifest.stage}")
+    for shard in manifest.data["shards"]:
+        logger.info(f"  {shard.get('batch_id')}: {shard.get('status')} {shard.get('completed', 0)}/{shard.get('total', 0)}")
+
+
+def job_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Returns the BatchProcessingManager keyword arguments given on the command line."""
+    return {
+        "prompt_file": args.prompt_file,
+        "format": args.format,
+        "count": args.count,
+        "mode": args.mode,
+        "stream": args.stream,
+        "pack_size": args.pack_size,
+        "pack_token_budget": args.pack_token_budget,
+        "use_result_store": args.result_store,
+        "retry_rounds": args.retry_rounds,
+        "retry_mode": args.retry_mode,
+        "compact": args.compact,
+        "base_url": args.base_url,
+        "model": args.model,
+    }
+
+
+def watch(args: argparse.Namespace) -> None:
+    """Runs the watch-folder daemon, writing each input file's output under its name and extension."""
+    from core.watcher import FolderWatcher
+
+    def create_job(path: Path) -> BatchProcessingManager:
+        return BatchProcessingManager(str(path), FolderWatcher.output_name(path), **job_options(args))
+
+    watcher = FolderWatcher(Path(args.watch), create_job, BatchProcessingManager.resume, args.poll_interval,
+                            include_existing=args.watch_existing, metrics_textfile=args.metrics_textfile)
+    watcher.run()
+
+
+def plan(argv: List[str]) -> None:
+    """Prints the rows, requests, bytes, tokens and cost a run would take, without calling the API."""
+    parser = argparse.ArgumentParser(prog="main.py plan", description="Estimate the size and cost of a run without calling the API")
+    parser.add_argument("-I", "--input_file", required=True, help="Path to the input file or directory")
+    parser.add_argument("-c", "--count", type=int, default=0, help="Only plan the first N rows")
+    parser.add_argument("-m", "--mode", "--backend", choices=list(BACKENDS), default=Config.BACKEND, help=f"Backend the run would use, for the price (default: {Config.BACKEND})")
+    parser.add_argument("--base-url", help="OpenAI-compatible base URL the run would use; other servers than OpenAI are not priced")
+    parser.add_argument("--model", default=Config.OPENAI_MODEL, help=f"Model name (default: {Config.OPENAI_MODEL})")
+    parser.add_argument("--pack-size", type=int, default=Config.PACK_SIZE, help="Number of items packed into one request (default: 1)")
+    parser.add_argument("--pack-token-budget", type=int, default=Config.PACK_TOKEN_BUDGET, help="Close a pack once its items reach this many estimated input tokens (default: off)")
+    parser.add_argument("--compact", action="store_true", default=Config.COMPACT_RESPONSES, help="Plan compact structured responses")
+    parser.add_argument("--no-result-store", dest="result_store", action="store_false", default=Config.RESULT_STORE, help="Count items the result store would answer as requests")
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON")
+    args = parser.parse_args(argv)
+
+    from core.planner import RequestPlanner
+
+    # The plan reports skipped rows in total instead of logging a warning per row.
+    logger.setLevel(logging.ERROR)
+    planner = RequestPlanner(args.input_file, pack_size=args.pack_size, pack_token_budget=args.pack_token_budget,
+                             result_store=Config.RESULT_STORE_FILE if args.result_store else None, compact=args.compact, model=args.model)
+    report = planner.plan(args.count, args.mode, args.base_url)
+    print(json.dumps(report, indent=4) if args.json else RequestPlanner.format_report(report))
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Batch Processing CLI")
-    parser.add_argument("-I", "--input_file", required=True, help="Path to the input file")
-    parser.add_argument("-O", "--output_filename", required=True, help="Output file name (without extension)")
-    parser.add_argument("-f", "--format", choices=["json", "csv", "tsv", "excel"], default="json", help="Output file format (default: json)")
+    if len(sys.argv) > 1 and sys.argv[1] == "plan":
+        return plan(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description="Batch Processing CLI", epilog="Run `main.py plan -h` to estimate the size and cost of a run without calling the API.")
+    parser.add_argument("-I", "--input_file", help="Path to the input file")
+    parser.add_argument("-O", "--output_filename", help="Output file name (without extension)")
+    parser.add_argument("-f", "--format", choices=["json", "jsonl", "csv", "tsv", "excel", "parquet"], default="json", help="Output file format (default: json)")
     parser.add_argument("-p", "--prompt_file", help="Path to the prompt file (optional)")
     parser.add_argument("-c", "--count", help="Path to the prompt file (optional)", default=0)
+    parser.add_argument("-m", "--mode", "--backend", choices=list(BACKENDS), default=Config.BACKEND, help=f"Use the Batch API or send requests in realtime (default: {Config.BACKEND})")
+    parser.add_argument("--base-url", help="Send requests to this OpenAI-compatible base URL, e.g. a local vLLM or llama.cpp server")
+    parser.add_argument("--model", default=Config.OPENAI_MODEL, help=f"Model name sent with every request (default: {Config.OPENAI_MODEL})")
+    parser.add_argument("--stream", action="store_true", help="Stream the input and write prompts straight to disk for very large files")
+    parser.add_argument("--pack-size", type=int, default=Config.PACK_SIZE, help="Number of items packed into one request (default: 1)")
+    parser.add_argument("--pack-token-budget", type=int, default=Config.PACK_TOKEN_BUDGET, help="Close a pack once its items reach this many estimated input tokens (default: off)")
+    parser.add_argument("--no-result-store", dest="result_store", action="store_false", default=Config.RESULT_STORE, help="Send every item to the model instead of reusing results from earlier runs")
+    parser.add_argument("--retry-rounds", type=int, default=Config.RETRY_ROUNDS, help=f"Resend failed requests up to this many times (default: {Config.RETRY_ROUNDS})")
+    parser.add_argument("--retry-mode", choices=list(BACKENDS), help="Send retries as a batch or in realtime (default: same as --mode)")
+    parser.add_argument("--compact", action="store_true", default=Config.COMPACT_RESPONSES, help="Ask for only promo_price and unit_price through a JSON schema and rejoin the other fields locally")
+    parser.add_argument("--resume", metavar="JOB", help="Resume a job from its last completed stage")
+    parser.add_argument("--watch", metavar="DIR", nargs="?", const=str(Config.INPUT_DIR), help=f"Keep running and process every new input file dropped into DIR, with the other options applied to each (default: {Config.INPUT_DIR.name})")
+    parser.add_argument("--watch-existing", action="store_true", help="Also process the files already in the watched directory on the first start")
+    parser.add_argument("--poll-interval", type=float, default=Config.WATCH_POLL_SECONDS, help=f"Seconds between directory scans and batch status checks when watching (default: {Config.WATCH_POLL_SECONDS})")
+    parser.add_argument("--status", metavar="JOB", nargs="?", const="", help="Show the status of all jobs, or of one job")
+    parser.add_argument("--profile", metavar="STAGE", action="append", choices=Metrics.PROFILE_STAGES, help=f"Run a stage under cProfile, can be repeated ({', '.join(Metrics.PROFILE_STAGES)})")
+    parser.add_argument("--metrics-textfile", default=Config.METRICS_TEXTFILE, help="Also write the run report in the Prometheus text format to this file")
     
     args = parser.parse_args()
+    if args.status is not None:
+        return show_status(args.status or None)
+    if args.resume:
+        return BatchProcessingManager.resume(args.resume).run(args.profile, args.metrics_textfile)
+    if args.watch is not None:
+        return watch(args)
+    if not args.input_file or not args.output_filename:
+        parser.error("the following arguments are required: -I/--input_file, -O/--output_filename")
+
     supported_file_formats = ["csv", "json", "tsv", "xlsx"]
-    manager = BatchProcessingManager(args.input_file, args.output_filename, args.prompt_file, args.format, args.count)
-    manager.run()
+    manager = BatchProcessingManager(args.input_file, args.output_filename, **job_options(args))
+    manager.run(args.profile, args.metrics_textfile)
 
 if __name__ == "__main__":
     main()
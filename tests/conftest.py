@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from core.config import Config
+from core.input_cache import InputCache
+from core.loggers import NtfyHandler, logger
+
+# Tests must never post notifications.
+for handler in [handler for handler in logger.handlers if isinstance(handler, NtfyHandler)]:
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def workspace(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Points every output path of the pipeline at a temporary directory."""
+    output_dir = tmp_path / "output"
+    prompts_dir = tmp_path / "prompts"
+    output_dir.mkdir()
+    prompts_dir.mkdir()
+    monkeypatch.setattr(Config, "OUTPUT_DIR", output_dir)
+    monkeypatch.setattr(Config, "PROMPTS_DIR", prompts_dir)
+    monkeypatch.setattr(Config, "JOBS_DIR", output_dir / "jobs")
+    monkeypatch.setattr(Config, "PROMO_RULES_REPORT_FILE", output_dir / "promo_rules_report.json")
+    monkeypatch.setattr(Config, "RESULT_STORE_FILE", output_dir / "results.sqlite")
+    monkeypatch.setattr(Config, "WATCH_STATE_FILE", output_dir / "watch_state.json")
+    monkeypatch.setattr(Config, "WATCH_REPORT_FILE", output_dir / "watch_report.json")
+    # The input cache directory is bound as a default argument, so the cache is turned off instead.
+    monkeypatch.setattr(InputCache, "available", staticmethod(lambda: False))
+    return tmp_path
+
+
+def write_json(path: Path, rows: List[Dict[str, Any]]) -> Path:
+    with open(path, "w") as f:
+        json.dump(rows, f)
+    return path
@@ -0,0 +1,107 @@
+import json
+import threading
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+import pytest
+
+from benchmarks.stub_server import StubHandler, StubServer, completion
+from core.batch_inputs import BatchInputProcessor
+from core.config import Config
+from core.realtime import RealtimeProcessor
+from main import BatchProcessingManager
+from tests.conftest import write_json
+
+ROWS = [
+    {"product_title": "Diapers", "regular_price": "19.99", "sale_price": "", "promo_description": "Buy 2, get 1 at half price with card"},
+    {"product_title": "Wipes", "regular_price": "4.5", "sale_price": "3.99", "promo_description": "Save more with the app"},
+]
+
+
+class RecordingHandler(StubHandler):
+    """Answers with canned completions, recording the headers, model and connection of every request."""
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server: RecordingServer = self.server
+        with server.lock:
+            server.authorizations.append(self.headers.get("Authorization"))
+            server.models.append(body.get("model"))
+            server.connections.add(self.client_address)
+        data = json.dumps(completion(body)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class RecordingServer(StubServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RecordingHandler)
+        self.lock = threading.Lock()
+        self.authorizations: List[str] = []
+        self.models: List[str] = []
+        self.connections: Set[Tuple[str, int]] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+
+@pytest.fixture
+def server() -> Iterator[RecordingServer]:
+    server = RecordingServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_json(path: Any) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def test_job_sends_the_backend_key_and_model_to_a_custom_base_url(workspace, server, monkeypatch):
+    monkeypatch.setattr(Config, "OPENAI_API_KEY", "openai-key")
+    monkeypatch.setattr(Config, "BACKEND_API_KEY", "local-key")
+    input_file = write_json(workspace / "input.json", ROWS)
+
+    manager = BatchProcessingManager(str(input_file), "local", mode="realtime", base_url=server.base_url, model="local-model",
+                                     use_result_store=False, retry_rounds=0)
+    manager.run(metrics_textfile=None)
+
+    assert len(server.models) == len(ROWS)
+    assert set(server.authorizations) == {"Bearer local-key"}
+    assert set(server.models) == {"local-model"}
+    rows = read_json(Config.OUTPUT_DIR / "local.json")
+    assert sorted(row["product_title"] for row in rows) == ["Diapers", "Wipes"]
+
+
+def test_resumed_job_keeps_its_base_url_and_model(workspace, server, monkeypatch):
+    monkeypatch.setattr(Config, "BACKEND_API_KEY", "local-key")
+    input_file = write_json(workspace / "input.json", ROWS)
+    manager = BatchProcessingManager(str(input_file), "local", mode="realtime", base_url=server.base_url, model="local-model",
+                                     use_result_store=False, retry_rounds=0)
+    manager.generate_inputs()
+
+    resumed = BatchProcessingManager.resume(manager.manifest.job_id)
+    resumed.run(metrics_textfile=None)
+
+    assert resumed.base_url == server.base_url
+    assert set(server.models) == {"local-model"}
+    assert len(read_json(Config.OUTPUT_DIR / "local.json")) == len(ROWS)
+
+
+def test_realtime_runs_reuse_pooled_connections(workspace, server):
+    batch_input_file = workspace / "batch_inputs.jsonl"
+    with open(batch_input_file, "w") as f:
+        for custom_id in ("a", "b", "c"):
+            f.write(json.dumps(BatchInputProcessor.request_body(custom_id, f"prompt {custom_id}", 100)) + "\n")
+
+    with RealtimeProcessor(api_key="local-key", base_url=server.base_url, concurrency=1) as processor:
+        processor.process(batch_input_file, "first.jsonl")
+        processor.process(batch_input_file, "second.jsonl")
+
+    assert len(server.models) == 6
+    assert len(server.connections) == 1
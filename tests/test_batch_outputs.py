@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAI, canned_output_line
+from core.batch import BatchProcessor
+from core.batch_inputs import BatchInputProcessor
+from core.batch_outputs import BatchOutputProcessor
+from core.config import Config
+from core.manifest import JobManifest
+from core.metrics import metrics
+from core.result_store import ResultStore
+from core.side_store import SideStore
+from tests.conftest import write_json
+
+
+def request(custom_id: str) -> dict:
+    item = {"regular_price": "4.00", "sale_price": "", "promo_description": "Weekly deal"}
+    return BatchInputProcessor.request_body(custom_id, f"### Input:\n{json.dumps(item)}\n\n### Input Example", 100)
+
+
+def error_file_line(custom_id: str) -> dict:
+    """A line of a Batch API error file: the error is in the response body, `error` is empty."""
+    return {
+        "id": "batch_req_error",
+        "custom_id": custom_id,
+        "response": {"status_code": 400, "request_id": "req_error", "body": {"error": {"message": "Invalid request", "code": "invalid_request"}}},
+        "error": None,
+    }
+
+
+def test_batch_error_file_lines_are_api_errors(workspace):
+    client = FakeOpenAI()
+    client.files.data["file-out"] = (json.dumps(canned_output_line(request("a"), 0)) + "\n").encode()
+    client.files.data["file-err"] = (json.dumps(error_file_line("b")) + "\n").encode()
+    manifest = JobManifest("test-job")
+    manifest.data["shards"] = [{"output_file_id": "file-out", "error_file_id": "file-err"}]
+
+    metrics.reset()
+    processor = BatchOutputProcessor("batch_output.jsonl", "out")
+    results = processor.parse_responses(BatchProcessor(client=client).iter_responses(manifest, "batch_output.jsonl"))
+
+    assert set(results) == {"a"}
+    assert processor.errors == {"b": "api_error"}
+    assert metrics.report()["stages"]["parse"]["api_errors"] == 1
+    assert metrics.report()["stages"]["parse"]["parse_failures"] == 0
+    # The error lines are saved with the output, so a resumed job reads them too.
+    saved = [json.loads(line)["custom_id"] for line in open(Config.OUTPUT_DIR / "batch_output.jsonl")]
+    assert saved == ["a", "b"]
+
+
+def test_process_item_logs_errors_instead_of_printing(capsys):
+    line = {"custom_id": "a", "response": None, "error": {"code": "server_error", "message": "boom"}}
+
+    assert BatchOutputProcessor.process_item(line) is None
+    assert capsys.readouterr().out == ""
+
+
+def save_rows(workspace, results: dict) -> None:
+    rows = [
+        {"id": "row-ok", "custom_id": "ok", "result_key": "key-ok", "regular_price": 4.0, "sale_price": "", "promo_description": "Weekly deal"},
+        {"id": "row-bad", "custom_id": "bad", "result_key": "key-bad", "regular_price": 7.0, "sale_price": "", "promo_description": "Buy 2 for $12"},
+    ]
+    with SideStore.create(workspace / "rows.sqlite") as store:
+        store.write(rows)
+    BatchOutputProcessor.save_data(Config.OUTPUT_DIR / "out", results, ".json", workspace / "rows.sqlite", Config.RESULT_STORE_FILE)
+
+
+def test_results_failing_verification_are_not_stored(workspace):
+    save_rows(workspace, {
+        "ok": {"promo_price": 3.5, "unit_price": 3.5},
+        # 2 for $12 is $6 a unit, not $12.
+        "bad": {"promo_price": 12.0, "unit_price": 12.0},
+    })
+
+    with ResultStore(Config.RESULT_STORE_FILE) as store:
+        assert store.get("key-ok") is not None
+        assert store.get("key-bad") is None
+    requery = [json.loads(line) for line in open(Config.OUTPUT_DIR / "out.requery.jsonl")]
+    assert [row["id"] for row in requery] == ["row-bad"]
+
+
+def test_no_requery_file_without_failures(workspace):
+    stale = Config.OUTPUT_DIR / "out.requery.jsonl"
+    stale.write_text("{}\n")
+
+    save_rows(workspace, {
+        "ok": {"promo_price": 3.5, "unit_price": 3.5},
+        "bad": {"promo_price": 12.0, "unit_price": 6.0},
+    })
+
+    assert not stale.exists()
+    with open(Config.OUTPUT_DIR / "out.verify.json") as f:
+        assert json.load(f)["requery_file"] is None
+    with ResultStore(Config.RESULT_STORE_FILE) as store:
+        assert len(store) == 2
+
+
+@pytest.mark.parametrize("pack_size", [1, 2])
+def test_compact_responses_are_merged_back_into_full_rows(workspace, pack_size):
+    rows = [
+        {"product_title": f"Product {i}", "regular_price": f"{i + 1}.99", "sale_price": "", "promo_description": f"Member deal number {i}", "url": f"https://example.com/{i}"}
+        for i in range(3)
+    ]
+    input_processor = BatchInputProcessor(write_json(workspace / "input.json", rows), workspace / "batch_inputs.jsonl", local_rules=False,
+                                          side_store=workspace / "rows.sqlite", pack_size=pack_size, compact=True)
+    input_processor.process()
+    with open(workspace / "batch_inputs.jsonl") as f:
+        requests = [json.loads(line) for line in f]
+    assert all(request["body"]["response_format"] == Config.COMPACT_RESPONSE_FORMAT for request in requests)
+
+    processor = BatchOutputProcessor("batch_output.jsonl", "out")
+    results = processor.parse_responses(canned_output_line(request, i) for i, request in enumerate(requests))
+    assert all(set(result) == {"id", "promo_price", "unit_price"} for result in results.values())
+
+    with SideStore(workspace / "rows.sqlite") as store:
+        merged = BatchOutputProcessor.merge_data(store, results)
+    assert processor.errors == {}
+    merged = sorted(merged, key=lambda row: row["product_title"])
+    assert len({row.pop("id") for row in merged}) == len(rows)
+    # The pandas loader reads the prices as numbers.
+    assert merged == [{**row, "regular_price": float(row["regular_price"]), "promo_price": float(row["regular_price"]), "unit_price": float(row["regular_price"])} for row in rows]
@@ -0,0 +1,95 @@
+import io
+import json
+from typing import Any, Dict, List
+
+import pandas as pd
+import pytest
+
+from core.file_utils import FileHandler, Modifiers, iter_records
+from tests.conftest import write_json
+
+MODIFIERS = [
+    {'modifier': Modifiers.add_id_column},
+    {'modifier': Modifiers.remove_columns, 'args': [["coupon_description"]]},
+]
+ROWS = [
+    {"product_title": "Diapers", "promo_description": "2 for $5", "coupon_description": "Limit 4"},
+    {"product_title": "Diapers", "promo_description": "2 for $5", "coupon_description": "Limit 4"},
+    # Differs from the rows above only in a removed column.
+    {"product_title": "Diapers", "promo_description": "2 for $5", "coupon_description": "Limit 2"},
+    {"product_title": "Wipes", "promo_description": "Save 25%", "coupon_description": ""},
+]
+
+
+def without_ids(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(({k: v for k, v in row.items() if k != "id"} for row in rows), key=lambda row: row["product_title"])
+
+
+def test_pruned_columns_stop_at_unknown_modifiers():
+    handler = FileHandler(use_cache=False)
+    assert handler.scan("input.json", MODIFIERS).pruned_columns() == {"coupon_description"}
+
+    reads_everything = [{'modifier': lambda data: data}, *MODIFIERS]
+    assert handler.scan("input.json", reads_everything).pruned_columns() == set()
+
+
+def test_lazy_frame_matches_the_eager_path(workspace):
+    input_file = write_json(workspace / "input.json", ROWS[:2] + ROWS[3:])
+    handler = FileHandler(use_cache=False)
+
+    collected = handler.scan(input_file, MODIFIERS).collect()
+    handler.load(input_file, MODIFIERS)
+
+    assert isinstance(collected, pd.DataFrame)
+    assert "coupon_description" not in collected.columns
+    assert without_ids(list(iter_records(collected))) == without_ids(handler.data)
+
+
+def test_stream_and_frame_drop_duplicates_after_pruning(workspace):
+    input_file = write_json(workspace / "input.json", ROWS)
+    handler = FileHandler(use_cache=False)
+
+    collected = list(iter_records(handler.scan(input_file, MODIFIERS).collect()))
+    streamed = list(handler.stream(input_file, MODIFIERS))
+
+    assert without_ids(streamed) == without_ids(collected) == [
+        {"product_title": "Diapers", "promo_description": "2 for $5"},
+        {"product_title": "Wipes", "promo_description": "Save 25%"},
+    ]
+    assert len({row["id"] for row in streamed}) == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8, 64])
+def test_iter_json_array_across_chunk_boundaries(chunk_size):
+    rows = [
+        {"promo_description": "Buy 2 ] get 1 [free]", "details": {"tags": ["x]", {"k": "}"}], "n": 1.5}},
+        {"promo_description": "He said \"2 for $5\", then \\ left", "details": {}},
+        {"promo_description": "", "details": {"nested": {"deeper": [[], [{"a": None}]]}}},
+    ]
+    text = json.dumps(rows, indent=2)
+
+    assert list(FileHandler.iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == rows
+
+
+GENERATOR_MODIFIERS = [
+    (Modifiers.column_exists, ["coupon_description"]),
+    (Modifiers.column_exists, ["missing"]),
+    (Modifiers.filter_items_by_column, ["product_title", "Diapers"]),
+    (Modifiers.filter_items_by_column, ["missing", "Diapers"]),
+    (Modifiers.remove_columns, [["coupon_description", "missing"]]),
+    (Modifiers.drop_duplicates, []),
+    (Modifiers.add_id_column, []),
+]
+
+
+@pytest.mark.parametrize("modifier, args", GENERATOR_MODIFIERS)
+def test_modifiers_agree_on_frames_lists_and_generators(modifier, args):
+    frame = modifier(pd.DataFrame(ROWS), *args)
+    as_list = modifier([dict(row) for row in ROWS], *args)
+    generated = modifier((dict(row) for row in ROWS), *args)
+
+    assert isinstance(frame, pd.DataFrame)
+    assert isinstance(as_list, list)
+    assert not isinstance(generated, (list, pd.DataFrame))
+    expected = without_ids(list(iter_records(frame)))
+    assert without_ids(as_list) == without_ids(list(generated)) == expected
@@ -0,0 +1,74 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from core.file_utils import LOADERS
+from core.input_cache import InputCache
+from tests.conftest import write_json
+
+pytest.importorskip("pyarrow")
+
+ROWS = [
+    {"product_title": "Diapers", "regular_price": "19.99", "sale_price": 3, "promo_description": "2 for $5 ∙ café", "size": "12 oz"},
+    {"product_title": "Wipes", "regular_price": 4.5, "sale_price": None, "promo_description": None, "size": 3},
+]
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> InputCache:
+    # Built directly, since the workspace fixture turns the cache off for every other test.
+    return InputCache(cache_dir=tmp_path / "cache", max_bytes=1 << 20)
+
+
+def parse(path: Path) -> pd.DataFrame:
+    return LOADERS[path.suffix](path)
+
+
+def test_round_trip_keeps_mixed_and_missing_values(tmp_path, cache):
+    input_file = write_json(tmp_path / "input.json", ROWS)
+    df = parse(input_file)
+
+    cache.put(input_file, df)
+    cached = cache.get(input_file)
+
+    pd.testing.assert_frame_equal(cached, df)
+    assert cached["size"].tolist() == ["12 oz", 3]
+    assert cached["promo_description"].tolist() == ["2 for $5 ∙ café", None]
+    assert cache.get(input_file, exclude=["promo_description"]).columns.tolist() == ["product_title", "regular_price", "sale_price", "size"]
+
+
+def test_changed_file_misses(tmp_path, cache):
+    input_file = write_json(tmp_path / "input.json", ROWS)
+    cache.put(input_file, parse(input_file))
+    stat = input_file.stat()
+
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.get(input_file) is None
+
+    write_json(input_file, ROWS[:1])
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert input_file.stat().st_size != stat.st_size
+    assert cache.get(input_file) is None
+
+    write_json(input_file, ROWS)
+    os.utime(input_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert cache.get(input_file) is not None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, cache):
+    files = [write_json(tmp_path / f"input_{i}.json", ROWS) for i in range(3)]
+    for i, input_file in enumerate(files[:2]):
+        cache.put(input_file, parse(input_file))
+        os.utime(cache.entry(input_file), (1_000_000 + i, 1_000_000 + i))
+    # Reading the older entry makes the other one the least recently used.
+    assert cache.get(files[0]) is not None
+    cache.max_bytes = 2 * cache.entry(files[0]).stat().st_size
+
+    cache.put(files[2], parse(files[2]))
+
+    assert cache.entry(files[0]).is_file()
+    assert not cache.entry(files[1]).is_file()
+    assert cache.entry(files[2]).is_file()
+    assert cache.get(files[1]) is None
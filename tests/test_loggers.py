@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List
+
+import pytest
+
+from core.loggers import NtfyHandler
+
+
+class NtfyStandIn(ThreadingHTTPServer):
+    """Records the bodies posted to it, taking `delay` seconds to answer each."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), NtfyRequestHandler)
+        self.delay = 0.0
+        self.messages: List[str] = []
+        self.times: List[float] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class NtfyRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        time.sleep(self.server.delay)
+        self.server.messages.append(body)
+        self.server.times.append(time.monotonic())
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def ntfy() -> Iterator[NtfyStandIn]:
+    server = NtfyStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def record(message: str) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 0, message, None, None)
+
+
+def test_emit_does_not_wait_for_a_slow_endpoint(ntfy):
+    ntfy.delay = 1.0
+    handler = NtfyHandler("test", base_url=ntfy.url, timeout=5.0, min_interval=0.0)
+    start = time.monotonic()
+    for i in range(100):
+        handler.emit(record(f"message {i}"))
+    elapsed = time.monotonic() - start
+    handler.close()
+
+    assert elapsed < 0.5
+    assert "message 99" in "\n".join(ntfy.messages)
+
+
+def test_records_are_coalesced_under_the_rate_limit(ntfy):
+    handler = NtfyHandler("test", base_url=ntfy.url, timeout=5.0, min_interval=0.5)
+    for i in range(20):
+        handler.emit(record(f"message {i}"))
+    handler.flush()
+    handler.close()
+
+    assert 1 <= len(ntfy.messages) <= 2
+    assert "\n".join(ntfy.messages).split("\n") == [f"message {i}" for i in range(20)]
+
+
+def test_steady_logging_posts_at_most_once_per_interval(ntfy):
+    handler = NtfyHandler("test", base_url=ntfy.url, timeout=5.0, min_interval=0.5)
+    for i in range(40):
+        handler.emit(record(f"message {i}"))
+        time.sleep(0.05)
+    handler.flush()
+    handler.close()
+
+    # 2 seconds of records at a 0.5s interval: the first post, then one per interval.
+    assert len(ntfy.times) <= 6
+    assert all(later - earlier >= 0.45 for earlier, later in zip(ntfy.times, ntfy.times[1:]))
+    assert "\n".join(ntfy.messages).split("\n") == [f"message {i}" for i in range(40)]
+
+
+def test_full_buffer_drops_the_oldest_records(ntfy):
+    ntfy.delay = 0.5
+    handler = NtfyHandler("test", base_url=ntfy.url, timeout=5.0, min_interval=0.0, max_buffer=5)
+    handler.emit(record("first"))
+    time.sleep(0.2)  # the worker is now posting "first"
+    for i in range(20):
+        handler.emit(record(f"message {i}"))
+    handler.flush()
+    handler.close()
+
+    assert ntfy.messages[0] == "first"
+    assert ntfy.messages[1].split("\n") == ["(15 older messages dropped)"] + [f"message {i}" for i in range(15, 20)]
+
+
+def test_close_gives_up_on_an_unresponsive_endpoint(ntfy):
+    ntfy.delay = 5.0
+    handler = NtfyHandler("test", base_url=ntfy.url, timeout=0.3, min_interval=0.0)
+    handler.emit(record("lost"))
+    start = time.monotonic()
+    handler.flush()
+    handler.close()
+
+    assert time.monotonic() - start < 2.0
@@ -0,0 +1,85 @@
+import json
+import re
+
+from benchmarks.fake_openai import FakeOpenAI
+from core.batch import BatchProcessor
+from core.batch_inputs import BatchInputProcessor
+from core.batch_outputs import BatchOutputProcessor
+from core.config import Config
+from core.side_store import SideStore
+from main import BatchProcessingManager
+from tests.conftest import write_json
+
+PRICES = {"promo_price": 2.0, "unit_price": 2.0}
+ROWS = [
+    {"product_title": f"Product {i}", "regular_price": f"{i + 1}.99", "sale_price": "", "promo_description": f"Member deal number {i}"}
+    for i in range(3)
+]
+
+
+def test_render_pack_numbers_the_items():
+    processor = BatchInputProcessor("", "", pack_size=2)
+    processor.load_prompt_template()
+    items = [{"id": 0, "promo_description": "a"}, {"id": 1, "promo_description": "b"}]
+
+    prompt = processor.render_pack(items)
+
+    assert Config.PACKED_PROMPT_NOTE.format(count=2) in prompt
+    assert json.dumps(items, indent=1) in prompt
+
+
+def test_unpack_matches_elements_by_id():
+    answer = [{"id": 2, **PRICES}, {"id": 0, **PRICES}]
+    assert BatchOutputProcessor.unpack("pack-a", answer) == {"pack-a#2": answer[0], "pack-a#0": answer[1]}
+
+
+def test_unpack_keeps_missing_items_unanswered():
+    # A short array without ids can only be matched by position.
+    assert set(BatchOutputProcessor.unpack("pack-a", [PRICES, PRICES])) == {"pack-a#0", "pack-a#1"}
+    assert set(BatchOutputProcessor.unpack("pack-a", [{"id": 1, **PRICES}, {"id": "x"}])) == {"pack-a#1"}
+
+
+def test_unpack_non_array_bodies():
+    assert BatchOutputProcessor.unpack("pack-a", "not json") == {}
+    assert BatchOutputProcessor.unpack("pack-a", {"id": 1, **PRICES}) == {"pack-a#1": {"id": 1, **PRICES}}
+    # An item resent on its own is answered by a single object.
+    assert BatchOutputProcessor.unpack("pack-a#1", PRICES) == {"pack-a#1": PRICES}
+    assert BatchOutputProcessor.unpack("pack-a#1", {"items": [{"id": 0, **PRICES}]}) == {"pack-a#1": {"id": 0, **PRICES}}
+
+
+def test_failed_items_of_an_answered_pack_are_resent_one_by_one(workspace):
+    side_store = workspace / "rows.sqlite"
+    with SideStore.create(side_store) as store:
+        store.write({"id": custom_id, "custom_id": custom_id} for custom_id in ("pack-a#0", "pack-a#1", "pack-a#2", "pack-b#0", "single"))
+    processor = BatchOutputProcessor("batch_output.jsonl", "out", side_store=side_store)
+    processor.errors = {"pack-b": "api_error"}
+    results = {"pack-a#0": PRICES, "pack-a#2": {"promo_price": "", "unit_price": ""}}
+
+    assert processor.failed_requests(results) == {
+        "pack-a#1": "missing_id",
+        "pack-a#2": "invalid_price",
+        "pack-b": "api_error",
+        "single": "missing_id",
+    }
+
+
+def test_retry_sends_pack_items_unpacked(workspace):
+    input_file = write_json(workspace / "input.json", ROWS)
+    manager = BatchProcessingManager(str(input_file), "out", mode="batch", pack_size=3, use_result_store=False)
+    manager.backends["batch"] = BatchProcessor(client=FakeOpenAI())
+    manager.generate_inputs()
+    with SideStore(manager.side_store) as store:
+        [pack_id] = {row["custom_id"].split("#")[0] for row in store}
+    item_key = f"{pack_id}#1"
+
+    lines = manager.retry_requests({item_key}, 1)
+    results = BatchOutputProcessor("batch_output.jsonl", "out").parse_responses(lines)
+
+    with open(manager.manifest.dir / "retry-1" / "batch_inputs.jsonl") as f:
+        [request] = [json.loads(line) for line in f]
+    assert request["custom_id"] == item_key
+    prompt = request["body"]["messages"][-1]["content"]
+    [item] = [json.loads(match) for match in re.findall(r"### Input:\n(.*?)\n\n### Input Example", prompt, re.DOTALL)]
+    assert item["promo_description"] == "Member deal number 1"
+    assert list(results) == [item_key]
+    assert float(results[item_key]["promo_price"]) == 2.99
@@ -0,0 +1,69 @@
+import csv
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from core.batch_inputs import BatchInputProcessor
+from core.config import Config
+from core.file_utils import FileHandler
+from core.planner import RequestPlanner
+from core.result_store import ResultStore
+
+ROWS = [
+    {"product_title": "Diapers", "regular_price": "19.99", "sale_price": "", "promo_description": "Buy 2, get 1 at half price with card"},
+    {"product_title": "Wipes", "regular_price": "4.5", "sale_price": "3.99", "promo_description": "Save more with the app"},
+    {"product_title": "Wipes 2-pack", "regular_price": "4.50", "sale_price": "3.99", "promo_description": "Save  more with the APP"},
+    {"product_title": "Lotion", "regular_price": "7.99", "sale_price": "", "promo_description": ""},
+]
+
+
+def write_csv(path: Path, rows: List[Dict[str, Any]]) -> Path:
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def run_inputs(workspace: Path, input_file: Path, stream: bool) -> BatchInputProcessor:
+    processor = BatchInputProcessor(input_file, workspace / "prompts.jsonl", local_rules=False, stream=stream,
+                                    side_store=workspace / "rows.sqlite", result_store=Config.RESULT_STORE_FILE)
+    processor.file = FileHandler(use_cache=False)
+    processor.process()
+    return processor
+
+
+def plan(input_file: Path) -> Dict[str, Any]:
+    planner = RequestPlanner(input_file, local_rules=False, result_store=Config.RESULT_STORE_FILE)
+    planner.file = FileHandler(use_cache=False)
+    return planner.plan()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_empty_csv_description_is_skipped_by_both_readers(workspace, stream):
+    input_file = write_csv(workspace / "input.csv", ROWS)
+
+    processor = run_inputs(workspace, input_file, stream)
+
+    assert processor.skipped_count == 1
+    assert processor.prompt_count == 2
+    with open(workspace / "prompts.jsonl") as f:
+        assert "nan" not in f.read()
+
+
+def test_plan_matches_a_run_before_and_after_storing_results(workspace):
+    input_file = write_csv(workspace / "input.csv", ROWS)
+
+    before = plan(input_file)
+    run = run_inputs(workspace, input_file, stream=False)
+    assert (before["skipped_rows"], before["requests"]) == (run.skipped_count, run.prompt_count) == (1, 2)
+
+    # Store an answer under every key the run recorded, as the output stage does.
+    with ResultStore(Config.RESULT_STORE_FILE) as store:
+        store.put_many((row["result_key"], {"promo_price": 1.0, "unit_price": 1.0}) for row in run.data if "result_key" in row)
+
+    after = plan(input_file)
+    rerun = run_inputs(workspace, input_file, stream=False)
+    assert after["requests"] == rerun.prompt_count == 0
+    assert after["result_store_rows"] == 3
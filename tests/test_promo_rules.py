@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from core.config import Config
+from core.promo_rules import PROMO_RULES, PromoCalculator
+from main import BatchProcessingManager
+from tests.conftest import write_json
+
+
+@pytest.mark.parametrize("description, base, expected", [
+    ("$5 off when you spend $20", 25.0, ("spend_threshold", 20.0, 20.0)),
+    ("$5 off when you spend $20", 15.0, ("spend_threshold", 15.0, 15.0)),
+    ("2 for $5", 3.0, ("multi_buy", 5.0, 2.5)),
+    ("Buy 3 for $10", 4.0, ("multi_buy", 10.0, 10.0 / 3)),
+    ("Buy 1, get 1 free", 4.0, ("buy_get", 2.0, 2.0)),
+    ("Buy 2 get 1 50% off", 6.0, ("buy_get", 5.0, 5.0)),
+    ("Save 25%", 8.0, ("percent_off", 6.0, 6.0)),
+    ("20% off", 10.0, ("percent_off", 8.0, 8.0)),
+    ("$1.50 off", 4.0, ("fixed_off", 2.5, 2.5)),
+    ("$5 off", 3.0, ("fixed_off", 0.0, 0.0)),
+])
+def test_rules(description, base, expected):
+    name, promo_price, unit_price = PromoCalculator.match(description, base)
+    assert (name, promo_price, unit_price) == (expected[0], pytest.approx(expected[1]), pytest.approx(expected[2]))
+
+
+@pytest.mark.parametrize("description", [
+    "$2 off when you buy 2",
+    "20% off with card",
+    "2 for $5 each",
+    "$1 off; Buy 1, get 1 free",
+    "Save more with the app",
+    "150% off",
+])
+def test_conditional_and_unknown_promos_go_to_the_model(description):
+    assert PromoCalculator.match(description, 10.0) is None
+
+
+def test_labels_and_boilerplate_are_stripped():
+    assert PromoCalculator.match("Digital coupon: $1 off in-store or online ∙ Details", 3.0) == ("fixed_off", 2.0, 2.0)
+
+
+def test_sale_price_takes_precedence_over_regular_price():
+    calculator = PromoCalculator()
+    assert calculator.calculate({"regular_price": "10.00", "sale_price": "8.00", "promo_description": "25% off"}) == {"promo_price": 6.0, "unit_price": 6.0}
+    assert calculator.calculate({"regular_price": "10.00", "sale_price": "", "promo_description": "25% off"}) == {"promo_price": 7.5, "unit_price": 7.5}
+
+
+def test_report_counts_hits_per_rule():
+    calculator = PromoCalculator()
+    for description in ("2 for $5", "3 for $6", "$1 off", "Save more with the app"):
+        calculator.calculate({"regular_price": "4.00", "promo_description": description})
+    calculator.calculate({"regular_price": "", "promo_description": "$1 off"})
+
+    report = calculator.report()
+    assert (report["items"], report["parsed"], report["unparsed"], report["hit_rate"]) == (5, 3, 2, 0.6)
+    assert set(report["patterns"]) == {name for name, _, _ in PROMO_RULES}
+    assert report["patterns"]["multi_buy"] == {"hits": 2, "hit_rate": 0.4}
+    assert report["patterns"]["fixed_off"] == {"hits": 1, "hit_rate": 0.2}
+    assert report["patterns"]["buy_get"] == {"hits": 0, "hit_rate": 0.0}
+
+
+def test_every_job_writes_its_own_report(workspace):
+    managers = []
+    for name, descriptions in (("a", ["2 for $5"]), ("b", ["$1 off", "Save more with the app"])):
+        rows = [{"product_title": f"Product {i}", "regular_price": "4.00", "promo_description": d} for i, d in enumerate(descriptions)]
+        managers.append(BatchProcessingManager(str(write_json(workspace / f"{name}.json", rows)), name, use_result_store=False))
+    for manager in managers:
+        manager.generate_inputs()
+
+    reports = []
+    for manager in managers:
+        with open(manager.manifest.dir / "promo_rules_report.json") as f:
+            reports.append(json.load(f))
+    assert [(report["items"], report["parsed"]) for report in reports] == [(1, 1), (2, 1)]
+    assert not Config.PROMO_RULES_REPORT_FILE.exists()
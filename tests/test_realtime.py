@@ -0,0 +1,126 @@
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+from benchmarks.stub_server import StubHandler, StubServer, completion
+from core.batch_inputs import BatchInputProcessor
+from core.config import Config
+from core.realtime import RealtimeProcessor
+
+
+class ScriptedHandler(StubHandler):
+    """Answers with the server's scripted error statuses first, then with canned completions."""
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server: ScriptedServer = self.server
+        with server.lock:
+            server.received.append(body["messages"][-1]["content"])
+            status = server.failures.pop(0) if server.failures else 200
+        response = completion(body) if status == 200 else {"error": {"message": f"scripted {status}"}}
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ScriptedServer(StubServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ScriptedHandler)
+        self.lock = threading.Lock()
+        self.failures: List[int] = []
+        self.received: List[str] = []
+
+
+@pytest.fixture
+def server() -> Iterator[ScriptedServer]:
+    server = ScriptedServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def processor(server: ScriptedServer, monkeypatch: pytest.MonkeyPatch) -> Iterator[RealtimeProcessor]:
+    monkeypatch.setattr(Config, "REALTIME_BACKOFF_BASE", 0.01)
+    # No jitter, so the backoff delays are exact.
+    monkeypatch.setattr("core.realtime.random.uniform", lambda low, high: 0.0)
+    processor = RealtimeProcessor(api_key="test", base_url=f"http://127.0.0.1:{server.server_port}/v1", concurrency=1)
+    yield processor
+    processor.close()
+
+
+def write_requests(path: Path, custom_ids: List[str]) -> Path:
+    with open(path, "w") as f:
+        for custom_id in custom_ids:
+            f.write(json.dumps(BatchInputProcessor.request_body(custom_id, f"prompt {custom_id}", 100)) + "\n")
+    return path
+
+
+def read_lines(path: Path) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record_delays(processor: RealtimeProcessor, monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    delays: List[float] = []
+    retry_delay = processor.retry_delay
+
+    def recorded(attempt, response):
+        delays.append(retry_delay(attempt, response))
+        return delays[-1]
+
+    monkeypatch.setattr(processor, "retry_delay", recorded)
+    return delays
+
+
+def test_retries_429_and_5xx_with_backoff(workspace, server, processor, monkeypatch):
+    delays = record_delays(processor, monkeypatch)
+    server.failures = [429, 500, 503]
+    batch_input_file = write_requests(workspace / "batch_inputs.jsonl", ["a"])
+
+    processor.process(batch_input_file, "batch_output.jsonl")
+
+    # 429 honours Retry-After; 5xx back off exponentially from REALTIME_BACKOFF_BASE.
+    assert delays == [0.0, 0.02, 0.04]
+    assert server.received == ["prompt a"] * 4
+    [line] = read_lines(Config.OUTPUT_DIR / "batch_output.jsonl")
+    assert line["custom_id"] == "a"
+    assert line["error"] is None
+    assert line["response"]["status_code"] == 200
+
+
+def test_client_errors_are_not_retried(workspace, server, processor, monkeypatch):
+    delays = record_delays(processor, monkeypatch)
+    server.failures = [400]
+    batch_input_file = write_requests(workspace / "batch_inputs.jsonl", ["a"])
+
+    processor.process(batch_input_file, "batch_output.jsonl")
+
+    assert delays == []
+    [line] = read_lines(Config.OUTPUT_DIR / "batch_output.jsonl")
+    assert line["response"]["status_code"] == 400
+    assert line["error"]["code"] == "400"
+
+
+def test_resume_skips_requests_that_already_succeeded(workspace, server, processor):
+    batch_input_file = write_requests(workspace / "batch_inputs.jsonl", ["done", "failed", "new"])
+    output_path = Config.OUTPUT_DIR / "batch_output.jsonl"
+    answered = {"messages": [{"role": "user", "content": "prompt done"}]}
+    with open(output_path, "w") as f:
+        f.write(json.dumps(RealtimeProcessor.output_line({"custom_id": "done"}, 200, completion(answered))) + "\n")
+        f.write(json.dumps(RealtimeProcessor.output_line({"custom_id": "failed"}, 500, {}, {"code": "500", "message": ""})) + "\n")
+
+    processor.process(batch_input_file, "batch_output.jsonl")
+
+    assert sorted(server.received) == ["prompt failed", "prompt new"]
+    succeeded = [line["custom_id"] for line in read_lines(output_path) if not line["error"]]
+    assert sorted(succeeded) == ["done", "failed", "new"]
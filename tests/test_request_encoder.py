@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from core import request_encoder
+from core.batch_inputs import BatchInputProcessor
+
+pytest.importorskip("orjson")
+
+ITEMS = [
+    {"id": 0, "regular_price": "19.99", "sale_price": "", "promo_description": "Buy 2, get 1 free", "promo_price": "", "unit_price": ""},
+    {"id": "a1", "regular_price": 4.5, "sale_price": None, "promo_description": "Digital coupon: $1 off ∙ \"Details\" \\ café\n", "promo_price": 3, "unit_price": True},
+]
+
+
+def encode_lines(compact: bool) -> list:
+    processor = BatchInputProcessor("", "", compact=compact)
+    processor.load_prompt_template()
+    lines = [processor.encoder.encode(f"request-{i}", processor.minify(item), processor.item_max_tokens) for i, item in enumerate(ITEMS)]
+    lines.append(processor.encoder.encode_content("pack-a", processor.prompt_txt, processor.item_max_tokens))
+    return lines
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_orjson_and_stdlib_write_the_same_bytes(monkeypatch, compact):
+    with_orjson = encode_lines(compact)
+    monkeypatch.setattr(request_encoder, "orjson", None)
+    with_stdlib = encode_lines(compact)
+
+    assert [line.encode() for line in with_orjson] == [line.encode() for line in with_stdlib]
+
+
+def test_encoded_line_is_the_request_body(monkeypatch):
+    monkeypatch.setattr(request_encoder, "orjson", None)
+    processor = BatchInputProcessor("", "")
+    processor.load_prompt_template()
+    item = processor.minify(ITEMS[1])
+
+    line = processor.encoder.encode("request-1", item, 1000)
+
+    content = processor.prompt_txt.replace("{INPUT}", json.dumps(item, separators=(",", ":"), ensure_ascii=False))
+    body = BatchInputProcessor.request_body("request-1", content, 1000, model=processor.model)
+    assert line == json.dumps(body, separators=(",", ":"), ensure_ascii=False) + "\n"
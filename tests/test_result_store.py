@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from core.batch_inputs import BatchInputProcessor
+from core.config import Config
+from core.file_utils import FileHandler
+from core.result_store import ResultStore
+from tests.conftest import write_json
+
+ROWS = [
+    {"product_title": "Diapers", "regular_price": "19.99", "sale_price": "", "promo_description": "Buy 2, get 1 at half price with card", "promo_price": "", "unit_price": ""},
+    {"product_title": "Wipes", "regular_price": "4.5", "sale_price": "3.99", "promo_description": "Save more with the app", "promo_price": "3.99", "unit_price": ""},
+]
+
+
+def run_inputs(workspace: Path, input_file: Path, stream: bool) -> BatchInputProcessor:
+    processor = BatchInputProcessor(input_file, workspace / "prompts.jsonl", local_rules=False, stream=stream,
+                                    side_store=workspace / "rows.sqlite", result_store=Config.RESULT_STORE_FILE)
+    processor.file = FileHandler(use_cache=False)
+    processor.process()
+    return processor
+
+
+def test_key_ignores_value_types_and_input_prices():
+    digest = ResultStore.template_digest("gpt-4o-mini", "template")
+    item = {"regular_price": 19.99, "sale_price": float("nan"), "promo_description": "2 for  $5", "promo_price": 1.0}
+    same = {"regular_price": "19.990", "sale_price": "", "promo_description": "2 FOR $5", "promo_price": "", "unit_price": "9"}
+    assert ResultStore.key(digest, BatchInputProcessor.promo_signature(item)) == ResultStore.key(digest, BatchInputProcessor.promo_signature(same))
+
+
+def test_stream_run_hits_results_stored_by_frame_run(workspace):
+    input_file = write_json(workspace / "input.json", ROWS)
+
+    frame_run = run_inputs(workspace, input_file, stream=False)
+    assert frame_run.prompt_count == len(ROWS)
+    # Store an answer under every key the frame run recorded, as the output stage does.
+    with ResultStore(Config.RESULT_STORE_FILE) as store:
+        store.put_many((row["result_key"], {"promo_price": 1.0, "unit_price": 1.0}) for row in frame_run.data)
+
+    stream_run = run_inputs(workspace, input_file, stream=True)
+    assert stream_run.prompt_count == 0
+
+    frame_rerun = run_inputs(workspace, input_file, stream=False)
+    assert frame_rerun.prompt_count == 0
+
+
+def test_hit_only_applies_the_stored_prices(workspace):
+    row = {"product_title": "Diapers", "regular_price": "19.99", "sale_price": "", "promo_description": "BUY 2, get 1 at half price with card",
+           "promo_price": "", "unit_price": ""}
+    input_file = write_json(workspace / "input.json", [row])
+    digest = ResultStore.template_digest(Config.OPENAI_MODEL, open(Config.PROMPT_TEMPLATE_FILE).read())
+    # The model echoes the input fields of the row it answered: another product, with other casing.
+    answer = {"id": 0, "product_title": "Diapers XL", "regular_price": 19.99, "sale_price": "", "promo_description": "Buy 2, get 1 at half price with card",
+              "promo_price": 49.97, "unit_price": 16.66}
+    with ResultStore(Config.RESULT_STORE_FILE) as store:
+        store.put_many([(ResultStore.key(digest, BatchInputProcessor.promo_signature(row)), answer)])
+
+    processor = run_inputs(workspace, input_file, stream=False)
+
+    assert processor.prompt_count == 0
+    [item] = processor.data
+    assert item["promo_description"] == row["promo_description"]
+    assert item["product_title"] == row["product_title"]
+    assert (item["promo_price"], item["unit_price"]) == (49.97, 16.66)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from core.config import Config
+from core.manifest import JobManifest
+from core.metrics import Metrics, metrics
+from core.watcher import FolderWatcher
+
+
+class StandInJob:
+    """Provides the parts of BatchProcessingManager the watcher drives; generate_inputs waits for `gate`."""
+
+    def __init__(self, path: Path, gate: threading.Event):
+        self.manifest = JobManifest.create(input_file=str(path))
+        self.manifest.update(requests=0)
+        self.output_file = FolderWatcher.output_name(path)
+        self.metrics = Metrics()
+        self.gate = gate
+
+    def generate_inputs(self) -> None:
+        assert self.gate.wait(5)
+        with metrics.stage("inputs") as stage:
+            stage["rows"] = 1
+
+    def process_batch(self) -> None:
+        self.manifest.set_stage("batches_finished")
+
+    def write_output(self) -> None:
+        self.manifest.set_stage("output_written")
+
+    def close(self) -> None:
+        pass
+
+    def write_report(self) -> None:
+        self.metrics.write_report(self.manifest.dir / "run_report.json", job_id=self.manifest.job_id)
+
+
+def resume_job(job_id: str) -> StandInJob:
+    pytest.fail(f"Unexpected resume of {job_id}")
+
+
+def create_watcher(inbox: Path, jobs: List[StandInJob], gate: threading.Event) -> FolderWatcher:
+    def create_job(path: Path) -> StandInJob:
+        jobs.append(StandInJob(path, gate))
+        return jobs[-1]
+
+    return FolderWatcher(inbox, create_job, resume_job, poll_interval=0.01, include_existing=True,
+                         state_file=Config.WATCH_STATE_FILE, metrics_textfile=None)
+
+
+@pytest.fixture
+def inbox(workspace: Path) -> Path:
+    inbox = workspace / "inbox"
+    inbox.mkdir()
+    return inbox
+
+
+def test_file_changed_while_its_job_runs_is_processed_after_the_job(inbox):
+    (inbox / "a.json").write_text("[]")
+    gate = threading.Event()
+    jobs: List[StandInJob] = []
+    watcher = create_watcher(inbox, jobs, gate)
+
+    async def scenario() -> None:
+        watching = asyncio.create_task(watcher.watch(stop_when_idle=True))
+        while not jobs:
+            await asyncio.sleep(0.01)
+        (inbox / "a.json").write_text('[{"promo_description": "changed"}]')
+        await asyncio.sleep(0.2)
+        assert len(jobs) == 1
+        gate.set()
+        await asyncio.wait_for(watching, 5)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        watcher.pool.shutdown()
+        watcher.inputs_pool.shutdown()
+
+    assert len(jobs) == 2
+    assert watcher.files[str(inbox / "a.json")]["job_id"] == jobs[1].manifest.job_id
+
+
+def test_jobs_get_separate_outputs_and_metrics(inbox):
+    (inbox / "a.json").write_text("[]")
+    (inbox / "a.csv").write_text("promo_description\n")
+    gate = threading.Event()
+    gate.set()
+    jobs: List[StandInJob] = []
+    watcher = create_watcher(inbox, jobs, gate)
+    metrics.reset()
+
+    watcher.run(stop_when_idle=True)
+
+    assert sorted(job.output_file for job in jobs) == ["a_csv", "a_json"]
+    for job in jobs:
+        assert job.metrics.stages["inputs"]["rows"] == 1
+        with open(job.manifest.dir / "run_report.json") as f:
+            assert json.load(f)["stages"]["inputs"]["rows"] == 1
+    with open(Config.WATCH_REPORT_FILE) as f:
+        inputs = json.load(f)["stages"]["inputs"]
+    assert (inputs["calls"], inputs["rows"]) == (2, 2)
+    assert "inputs" not in metrics.default.stages